@@ -1,18 +1,61 @@
 import pytest
 import io
+import json
+import os
+import signal
+import sys
+import tempfile
+import threading
 from contextlib import redirect_stdout, redirect_stderr
 
+
+# Tests mínimos por worker para que valga la pena repartir la suite
+MIN_TESTS_PER_WORKER = 4
+
+
+def cpu_limit():
+    """
+    CPUs que puede usar el proceso: el límite del cgroup (--cpus de docker)
+    si lo hay y si no las CPUs asignadas al proceso.
+    """
+    cpus = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else (os.cpu_count() or 1)
+    try:
+        with open("/sys/fs/cgroup/cpu.max") as f:
+            quota, period = f.read().split()
+        if quota != "max":
+            cpus = min(cpus, max(1, int(quota) // int(period)))
+    except (OSError, ValueError):
+        pass
+    return cpus
+
+
+class TestTimeout(BaseException):
+    """
+    Se lanza dentro del test que excede su tiempo límite. Hereda de
+    BaseException para que un `except Exception` del alumno no la atrape.
+    """
+
+
 class FormatterPlugin:
     """
     Plugin de Pytest para capturar resultados y formatear
     la salida según los requisitos.
     """
-    def __init__(self):
+    def __init__(self, test_timeout=None, fail_fast=False, workers=1):
         self.passed = 0
         self.failed = 0
         self.total = 0
-        self.failed_test_names = []
+        self.tests = []
         self.collection_error_messages = []
+        # Tiempo límite por test en segundos (None: sin límite). Se aplica
+        # con SIGALRM, que solo se puede usar desde el hilo principal
+        self.test_timeout = test_timeout if threading.current_thread() is threading.main_thread() else None
+        self.fail_fast = fail_fast
+        self.timed_out = set()
+        self._current = None
+        # Procesos entre los que se reparten los tests (ver pytest_runtestloop)
+        self.workers = max(1, min(workers or 1, cpu_limit()))
+        self.used_workers = 1
 
     def pytest_collectreport(self, report):
         """
@@ -46,58 +89,224 @@ class FormatterPlugin:
         # Guardamos el número total de tests que encontró
         self.total = len(session.items)
 
+    @pytest.hookimpl(tryfirst=True)
+    def pytest_runtestloop(self, session):
+        """
+        Con más de un worker reparte los tests en bloques contiguos entre
+        procesos forkeados y junta sus resultados en el orden de
+        recolección. Con fail-fast, errores de recolección o suites chicas
+        se deja el ciclo normal (secuencial) de pytest.
+        """
+        items = session.items
+        workers = min(self.workers, len(items) // MIN_TESTS_PER_WORKER)
+        if workers < 2 or self.fail_fast or session.testsfailed or session.config.option.collectonly:
+            return None
+
+        chunks = [items[i * len(items) // workers:(i + 1) * len(items) // workers] for i in range(workers)]
+        running = []
+        for chunk in chunks:
+            output = tempfile.TemporaryFile("w+")
+            pid = os.fork()
+            if pid == 0:
+                self._run_chunk(chunk, output)
+            running.append((pid, chunk, output))
+
+        tests = []
+        timed_out = set()
+        for pid, chunk, output in running:
+            os.waitpid(pid, 0)
+            output.seek(0)
+            entries = {entry["id"]: entry for entry in map(json.loads, output.read().splitlines())}
+            output.close()
+            for item in chunk:
+                test_name = item.nodeid.removeprefix("test_code.py::")
+                # Si el proceso murió (os._exit, memoria) sus tests pendientes fallan
+                entry = entries.get(test_name) or {
+                    "id": test_name,
+                    "outcome": "failed",
+                    "duration": 0.0,
+                    "message": f"{test_name} -> [Error]: el test terminó el proceso que lo ejecutaba",
+                    "timeout": False,
+                }
+                if entry["timeout"]:
+                    timed_out.add(item.nodeid)
+                tests.append(entry)
+
+        self.tests = tests
+        self.passed = sum(1 for test in tests if test["outcome"] == "passed")
+        self.failed = sum(1 for test in tests if test["outcome"] == "failed")
+        self.timed_out = timed_out
+        self.used_workers = workers
+        session.testsfailed = self.failed
+        return True
+
+    def _run_chunk(self, items, output):
+        """
+        Código de cada worker forkeado: ejecuta sus tests y escribe una
+        línea JSON por resultado, así lo ya ejecutado se conserva aunque
+        el proceso muera. Nunca retorna.
+        """
+        code = 1
+        try:
+            self.tests = []
+            for index, item in enumerate(items):
+                nextitem = items[index + 1] if index + 1 < len(items) else None
+                item.config.hook.pytest_runtest_protocol(item=item, nextitem=nextitem)
+                for entry in self.tests:
+                    output.write(json.dumps(entry) + "\n")
+                output.flush()
+                self.tests = []
+            code = 0
+        finally:
+            os._exit(code)
+
+    def _on_alarm(self, signum, frame):
+        # Fuera de un test (la alarma llegó justo al terminar) no se hace nada
+        if self._current is not None:
+            self.timed_out.add(self._current)
+            raise TestTimeout(f"El test excedió el tiempo límite de {self.test_timeout} s")
+
+    @pytest.hookimpl(hookwrapper=True)
+    def pytest_runtest_call(self, item):
+        """
+        Limita el tiempo de cada test. Si el código del alumno atrapa la
+        excepción y sigue, la alarma se repite cada 0.1 s hasta que el
+        test termina.
+        """
+        if not self.test_timeout:
+            yield
+            return
+        previous = signal.signal(signal.SIGALRM, self._on_alarm)
+        self._current = item.nodeid
+        signal.setitimer(signal.ITIMER_REAL, self.test_timeout, 0.1)
+        try:
+            yield
+        finally:
+            self._current = None
+            signal.setitimer(signal.ITIMER_REAL, 0)
+            signal.signal(signal.SIGALRM, previous)
+
     def pytest_runtest_logreport(self, report):
         """
         Hook #2: Se llama después de que un test se ejecuta.
         """
         if report.when == 'call':
+            test_name = report.nodeid.removeprefix("test_code.py::")
+            entry = {
+                "id": test_name,
+                "outcome": report.outcome,
+                "duration": round(report.duration, 6),
+                "message": None,
+                "timeout": report.nodeid in self.timed_out,
+            }
             if report.passed:
                 self.passed += 1
             elif report.failed:
                 self.failed += 1
-                test_name = report.nodeid.removeprefix("test_code.py::")
                 
                 error_text = str(report.longrepr)
                 name_error_prefix = "NameError: name '"
-                if name_error_prefix in error_text:
+                if entry["timeout"]:
+                    entry["message"] = f"{test_name} -> [Tiempo límite excedido]: el test tardó más de {self.test_timeout} s"
+                elif name_error_prefix in error_text:
                     try:
                         start = error_text.find(name_error_prefix) + len(name_error_prefix)
                         end = error_text.find("'", start)
                         name = error_text[start:end]
 
-                        message = f"{test_name} -> [Test no implementado correctamente]: La funcion '{name}' no existe. Porfavor contacte con su docente."
-                        self.failed_test_names.append(message)
+                        entry["message"] = f"{test_name} -> [Test no implementado correctamente]: La funcion '{name}' no existe. Porfavor contacte con su docente."
                     except Exception:
-                        self.failed_test_names.append(f"{report.nodeid} (Error: NameError no parseable)")
+                        entry["message"] = f"{report.nodeid} (Error: NameError no parseable)"
                 else:
-                    self.failed_test_names.append(test_name)
+                    entry["message"] = test_name
+            self.tests.append(entry)
+
+    @property
+    def failed_test_names(self):
+        return [test["message"] for test in self.tests if test["outcome"] == "failed"]
+
+    def result(self):
+        """
+        Registro estructurado de la ejecución: conteos, puntaje, resultado
+        y duración de cada test y errores de recolección.
+        """
+        return {
+            "passed": self.passed,
+            "failed": self.failed,
+            "total": self.total,
+            "score": int(self.passed / self.total * 100) if self.total > 0 else 0,
+            "tests": self.tests,
+            "collection_errors": self.collection_error_messages,
+            "timeouts": len(self.timed_out),
+            "workers": self.used_workers,
+            # Con fail-fast los tests que siguen al primer fallo no se ejecutan
+            "fail_fast": self.fail_fast,
+            "not_run": self.total - self.passed - self.failed if self.fail_fast else 0,
+        }
+
+
+def render_output(result):
+    """
+    Texto para el alumno construido a partir del registro de resultado.
+    """
+    output_lines = []
+    
+    if result["collection_errors"]:
+        output_lines.append("\n[Errores encontrados al verificar el código]")
+        for message in result["collection_errors"]:
+            output_lines.append(f"  > {message}")
+    elif result["total"] == 0:
+        output_lines.append("\n[ADVERTENCIA]: No se han programado tests para esta actividad.")
+    else:
+        output_lines.append(f"\nTests Superados: {result['passed']}")
+        output_lines.append(f"Tests no superados: {result['failed']}")
+        output_lines.append(f"Tests Totales: {result['total']}")
+        if result.get("not_run"):
+            output_lines.append(f"Tests no ejecutados (se detuvo en el primer fallo): {result['not_run']}")
+        
+        failed_test_names = [test["message"] for test in result["tests"] if test["outcome"] == "failed"]
+        if failed_test_names:
+            output_lines.append("\nTests que no pasaron:")
+            for name in failed_test_names:
+                output_lines.append(f"  - {name}")
+        
+        output_lines.append(f"\nPuntaje obtenido: {result['score']}%")
+    
+    return "\n".join(output_lines)
         
 
-plugin = FormatterPlugin()
-test_files = ['test_code.py']
+def main(args=None, result_path=None, test_timeout=None, fail_fast=False, workers=1):
+    """
+    Ejecuta pytest con los argumentos indicados e imprime el resumen
+    formateado. Si se indica `result_path` escribe ahí el registro de
+    resultado en JSON. `test_timeout` limita el tiempo de cada test,
+    `fail_fast` detiene la ejecución en el primer test que falla y
+    `workers` reparte los tests entre procesos (acotado por las CPUs).
+    Retorna el código de salida del runner.
+    """
+    plugin = FormatterPlugin(test_timeout, fail_fast, workers)
+    if args is None:
+        args = ['test_code.py']
+    if fail_fast:
+        args = [*args, '-x']
 
-f = io.StringIO()
-with redirect_stdout(f), redirect_stderr(f):
-    pytest.main(test_files, plugins=[plugin])
+    f = io.StringIO()
+    with redirect_stdout(f), redirect_stderr(f):
+        pytest.main(args, plugins=[plugin])
 
-if plugin.collection_error_messages:
-    print("\n[Errores encontrados al verificar el código]")
-    for message in plugin.collection_error_messages:
-        print(f"  > {message}")
-    exit(1)
+    result = plugin.result()
+    if result_path:
+        with open(result_path, "w") as result_file:
+            json.dump(result, result_file)
 
-if plugin.total == 0 and not plugin.collection_error_messages:
-    print("\n[ADVERTENCIA]: No se han programado tests para esta actividad.")
-    exit(2)
+    print(render_output(result))
 
-print(f"\nTests Superados: {plugin.passed}")
-print(f"Tests no superados: {plugin.failed}")
-print(f"Tests Totales: {plugin.total}")
+    if result["collection_errors"]:
+        return 1
+    if result["total"] == 0:
+        return 2
+    return 0
 
-if plugin.failed_test_names:
-    print("\nTests que no pasaron:")
-    for name in plugin.failed_test_names:
-        print(f"  - {name}")
 
-if plugin.total > 0:
-    print(f"\nPuntaje obtenido: {int(plugin.passed / plugin.total * 100)}%")
\ No newline at end of file
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,411 @@
+"""
+Proceso padre de larga duración que corre dentro de cada contenedor del
+pool de sandboxes (ver functions/sandbox_pool.py).
+
+Mantiene pytest y el FormatterPlugin ya importados y, por cada trabajo
+recibido por stdin (una línea JSON), hace fork de un hijo limpio que
+ejecuta el código del alumno. La respuesta se escribe en stdout como una
+línea JSON; en los trabajos "run_stream" se escribe además una línea por
+cada fragmento de salida, antes de la línea final {"evento": "fin"}.
+
+El padre corre como root dentro del contenedor y cada hijo como
+CHILD_UID, un usuario sin privilegios: el hijo no puede tocar los
+archivos del padre ni los de otros trabajos, y al terminar cada trabajo
+se matan todos los procesos de ese usuario, incluidos los que el
+programa del alumno dejó en segundo plano.
+"""
+import codecs
+import hashlib
+import json
+import select
+import os
+import resource
+import shutil
+import signal
+import sys
+import tempfile
+import time
+import uuid
+import io
+from contextlib import redirect_stdout, redirect_stderr
+
+import pytest
+from pytest_plugin import main as run_pytest
+
+MAX_OUTPUT_BYTES = 1024 * 1024
+STREAM_CHUNK_BYTES = 4096
+SUITES_DIR = os.path.join(tempfile.gettempdir(), "suites")
+# Los registros de resultado se escriben fuera del directorio del alumno
+RESULTS_DIR = tempfile.mkdtemp(prefix="resultados_")
+# Usuario y grupo de los hijos (nobody)
+CHILD_UID = 65534
+CHILD_GID = 65534
+
+
+def _warm_up():
+    """
+    Ejecuta una recolección vacía para que pytest cargue todos sus
+    plugins internos antes del primer trabajo.
+    """
+    work_dir = tempfile.mkdtemp(prefix="warmup_")
+    try:
+        with open(os.path.join(work_dir, "test_warmup.py"), "w") as f:
+            f.write("def test_warmup():\n    assert True\n")
+        buffer = io.StringIO()
+        with redirect_stdout(buffer), redirect_stderr(buffer):
+            pytest.main([work_dir, "-q", "-p", "no:cacheprovider"])
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def _get_suite_path(test):
+    """
+    Ruta del test según el hash de su contenido. El archivo se conserva
+    mientras viva el contenedor, así pytest reutiliza el bytecode ya
+    reescrito del test en lugar de compilarlo en cada entrega.
+    """
+    suite_dir = os.path.join(SUITES_DIR, hashlib.sha256(test.encode("utf-8")).hexdigest())
+    test_path = os.path.join(suite_dir, "test_code.py")
+    if not os.path.exists(test_path):
+        os.makedirs(suite_dir, exist_ok=True)
+        with open(test_path, "w") as f:
+            f.write(test)
+    return test_path
+
+
+def _read_output(path):
+    with open(path, "rb") as f:
+        data = f.read(MAX_OUTPUT_BYTES + 1)
+    text = data[:MAX_OUTPUT_BYTES].decode("utf-8", errors="replace")
+    if len(data) > MAX_OUTPUT_BYTES:
+        text += "\n[Salida truncada]"
+    return text
+
+
+def _drop_privileges():
+    os.setgroups([])
+    os.setgid(CHILD_GID)
+    os.setuid(CHILD_UID)
+
+
+def _child(job, work_dir, test_path=None, result_path=None, pipes=None):
+    """
+    Código del proceso hijo. Nunca retorna: termina con os._exit.
+    """
+    try:
+        os.setsid()
+
+        memory_mb = job.get("memoria_mb")
+        if memory_mb:
+            limit = int(memory_mb) * 1024 * 1024
+            resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+
+        _drop_privileges()
+        os.chdir(work_dir)
+
+        devnull = os.open(os.devnull, os.O_RDONLY)
+        if pipes:
+            out, err = pipes
+        else:
+            out = os.open("stdout.txt", os.O_WRONLY | os.O_CREAT | os.O_TRUNC)
+            err = os.open("stderr.txt", os.O_WRONLY | os.O_CREAT | os.O_TRUNC)
+        os.dup2(devnull, 0)
+        os.dup2(out, 1)
+        os.dup2(err, 2)
+
+        if job["tipo"] == "run_stream":
+            # Sin buffer para que cada print llegue de inmediato al pipe
+            env = {**os.environ, "PYTHONUNBUFFERED": "1"}
+            os.execve(sys.executable, [sys.executable, "script.py"], env)
+        if job["tipo"] == "run":
+            os.execv(sys.executable, [sys.executable, "script.py"])
+
+        sys.path.insert(0, work_dir)
+        sys.dont_write_bytecode = False
+        code = run_pytest([
+            test_path,
+            f"--rootdir={os.path.dirname(test_path)}",
+            "-p", "no:cacheprovider",
+        ], result_path=result_path, test_timeout=job.get("test_timeout"), fail_fast=job.get("fail_fast", False),
+            workers=job.get("test_workers", 1))
+        sys.stdout.flush()
+        sys.stderr.flush()
+        os._exit(code)
+    except BaseException as e:
+        try:
+            os.write(2, f"Error en el sandbox: {e}".encode())
+        finally:
+            os._exit(1)
+
+
+def _kill(pid):
+    try:
+        os.killpg(pid, signal.SIGKILL)
+    except ProcessLookupError:
+        pass
+    return os.wait4(pid, 0)
+
+
+def _kill_leftovers():
+    """
+    Mata todos los procesos de CHILD_UID que siguen vivos (por ejemplo los
+    que el alumno dejó con fork o setsid, fuera del grupo del hijo). Lo
+    hace un proceso con ese mismo usuario: kill(-1) alcanza a todos los
+    procesos del usuario salvo a él mismo.
+    """
+    pid = os.fork()
+    if pid == 0:
+        try:
+            _drop_privileges()
+            os.kill(-1, signal.SIGKILL)
+        except BaseException:
+            pass
+        os._exit(0)
+    os.waitpid(pid, 0)
+    # El worker es el proceso 1 del contenedor, así que los huérfanos
+    # quedan como hijos suyos y hay que recogerlos
+    while True:
+        try:
+            waited_pid, _ = os.waitpid(-1, os.WNOHANG)
+        except ChildProcessError:
+            break
+        if waited_pid == 0:
+            break
+
+
+def _new_work_dir():
+    # Directorio del trabajo, del usuario del hijo para que pueda escribir
+    # su salida
+    work_dir = tempfile.mkdtemp(prefix="job_")
+    os.chown(work_dir, CHILD_UID, CHILD_GID)
+    return work_dir
+
+
+def _wait(pid, deadline):
+    """
+    Espera al hijo hasta `deadline`; si no terminó lo mata. Retorna
+    (status, rusage, timeout).
+    """
+    while time.monotonic() < deadline:
+        waited_pid, status, rusage = os.wait4(pid, os.WNOHANG)
+        if waited_pid == pid:
+            return status, rusage, False
+        time.sleep(0.005)
+    _, status, rusage = _kill(pid)
+    return status, rusage, True
+
+
+def _resources(rusage, started, output_bytes):
+    """
+    Recursos que usó el hijo: tiempo de CPU, memoria máxima (ru_maxrss,
+    en KB en Linux), tiempo real y bytes de salida producidos. La memoria
+    máxima incluye las páginas del worker que el hijo hereda con el fork.
+    """
+    return {
+        "cpu_user": round(rusage.ru_utime, 4),
+        "cpu_system": round(rusage.ru_stime, 4),
+        "max_rss_kb": rusage.ru_maxrss,
+        "wall_time": round(time.monotonic() - started, 4),
+        "output_bytes": output_bytes,
+    }
+
+
+def _output_size(work_dir):
+    return sum(
+        os.path.getsize(path)
+        for path in (os.path.join(work_dir, "stdout.txt"), os.path.join(work_dir, "stderr.txt"))
+        if os.path.exists(path)
+    )
+
+
+def _fork_and_wait(job, work_dir, test_path=None):
+    """
+    Ejecuta un trabajo en un hijo forkeado sobre `work_dir` y espera su
+    término respetando el timeout del trabajo.
+    """
+    result_path = None
+    if test_path:
+        # El hijo solo puede escribir su propio registro: el archivo se crea
+        # acá y se le cede
+        result_path = os.path.join(RESULTS_DIR, f"{uuid.uuid4().hex}.json")
+        with open(result_path, "w"):
+            pass
+        os.chown(result_path, CHILD_UID, CHILD_GID)
+
+    started = time.monotonic()
+    pid = os.fork()
+    if pid == 0:
+        _child(job, work_dir, test_path, result_path)
+
+    status, rusage, timeout = _wait(pid, started + float(job.get("timeout", 30)))
+    recursos = _resources(rusage, started, _output_size(work_dir))
+    if timeout:
+        if result_path and os.path.exists(result_path):
+            os.remove(result_path)
+        return {
+            "stdout": "",
+            "stderr": "Tiempo de ejecución excedido",
+            "return_code": 124,
+            "timeout": True,
+            "recursos": recursos,
+        }
+
+    response = {
+        "stdout": _read_output(os.path.join(work_dir, "stdout.txt")),
+        "stderr": _read_output(os.path.join(work_dir, "stderr.txt")),
+        "return_code": os.waitstatus_to_exitcode(status),
+        "timeout": False,
+        "recursos": recursos,
+    }
+    if result_path and os.path.exists(result_path):
+        with open(result_path) as f:
+            data = f.read()
+        if data:
+            response["resultado"] = json.loads(data)
+        os.remove(result_path)
+    return response
+
+
+def stream_job(job, emit):
+    """
+    Como un trabajo "run", pero la salida se envía con `emit` a medida que
+    el hijo la produce. Se envían como máximo `max_bytes` bytes entre
+    stdout y stderr; el resto se lee y se descarta, de modo que la memoria
+    usada no depende de cuánto imprima el programa.
+    """
+    work_dir = _new_work_dir()
+    max_bytes = int(job.get("max_bytes", MAX_OUTPUT_BYTES))
+    try:
+        with open(os.path.join(work_dir, "script.py"), "w") as f:
+            f.write(job["code"])
+
+        out_r, out_w = os.pipe()
+        err_r, err_w = os.pipe()
+        started = time.monotonic()
+        pid = os.fork()
+        if pid == 0:
+            os.close(out_r)
+            os.close(err_r)
+            _child(job, work_dir, pipes=(out_w, err_w))
+        os.close(out_w)
+        os.close(err_w)
+
+        streams = {out_r: "stdout", err_r: "stderr"}
+        decoders = {fd: codecs.getincrementaldecoder("utf-8")(errors="replace") for fd in streams}
+        sent = 0
+        produced = 0
+        truncated = False
+        deadline = started + float(job.get("timeout", 30))
+
+        while streams and time.monotonic() < deadline:
+            readable, _, _ = select.select(list(streams), [], [], max(deadline - time.monotonic(), 0))
+            for fd in readable:
+                data = os.read(fd, STREAM_CHUNK_BYTES)
+                produced += len(data)
+                if not data:
+                    text = decoders[fd].decode(b"", final=True)
+                elif truncated:
+                    continue
+                else:
+                    data = data[:max_bytes - sent]
+                    sent += len(data)
+                    text = decoders[fd].decode(data)
+                if text:
+                    emit({"evento": streams[fd], "datos": text})
+                if not data:
+                    del streams[fd]
+                    os.close(fd)
+                elif sent >= max_bytes:
+                    truncated = True
+                    emit({"evento": "truncado", "limite": max_bytes})
+        for fd in streams:
+            os.close(fd)
+
+        # El hijo puede cerrar su salida y seguir corriendo
+        status, rusage, timeout = _wait(pid, deadline)
+        return {
+            "evento": "fin",
+            "return_code": 124 if timeout else os.waitstatus_to_exitcode(status),
+            "timeout": timeout,
+            "truncado": truncated,
+            "recursos": _resources(rusage, started, produced),
+        }
+    finally:
+        _kill_leftovers()
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def handle_job(job):
+    work_dir = _new_work_dir()
+    try:
+        if job["tipo"] == "run":
+            with open(os.path.join(work_dir, "script.py"), "w") as f:
+                f.write(job["code"])
+            return _fork_and_wait(job, work_dir)
+
+        with open(os.path.join(work_dir, "app.py"), "w") as f:
+            f.write(job["code"])
+        return _fork_and_wait(job, work_dir, _get_suite_path(job["test"]))
+    finally:
+        _kill_leftovers()
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def handle_batch(job):
+    """
+    Lote de entregas contra un mismo test: cada entrega corre en su propio
+    hijo y todas comparten el test ya compilado.
+    """
+    results = []
+    for item in job["codes"]:
+        result = handle_job({**job, "tipo": "pytest", "code": item.get("code") or ""})
+        result["id"] = item.get("id")
+        results.append(result)
+    return {"resultados": results}
+
+
+def _write(protocol_out, message):
+    protocol_out.write(json.dumps(message) + "\n")
+    protocol_out.flush()
+
+
+def main():
+    protocol_out = sys.stdout
+    if os.geteuid() != 0:
+        # Sin root no se puede ejecutar a los hijos con otro usuario
+        _write(protocol_out, {"listo": False, "error": "El worker del sandbox debe correr como root"})
+        return
+    # El hijo debe poder llegar a su registro de resultado, pero no listar
+    # los de otros trabajos
+    os.chmod(RESULTS_DIR, 0o711)
+    _warm_up()
+    _write(protocol_out, {"listo": True})
+
+    for line in sys.stdin:
+        if not line.strip():
+            continue
+        job = json.loads(line)
+        if job.get("tipo") == "ping":
+            result = {"pong": True}
+        else:
+            try:
+                if job.get("tipo") == "run_stream":
+                    result = stream_job(job, lambda event: _write(protocol_out, event))
+                elif job.get("tipo") == "pytest_lote":
+                    result = handle_batch(job)
+                else:
+                    result = handle_job(job)
+            except Exception as e:
+                result = {
+                    "stdout": "",
+                    "stderr": f"Error en el sandbox: {e}",
+                    "return_code": 1,
+                    "timeout": False,
+                }
+                if job.get("tipo") == "run_stream":
+                    result["evento"] = "fin"
+        _write(protocol_out, result)
+
+
+if __name__ == "__main__":
+    main()
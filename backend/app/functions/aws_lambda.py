@@ -1,79 +1,268 @@
+import asyncio
 import httpx
 import json
-from typing import Dict, Any
+import random
+import time
+from typing import Dict, Any, List, Optional
 
-from settings import LAMBDA_API_URL
+from functions.cache import content_hash
+from functions.metricas import executor_duration, executor_timeouts
+from functions.result_cache import run_cached, result_key
+from functions.test_suites import get_suite, precheck_code
+from settings import (
+    LAMBDA_API_URL,
+    LAMBDA_HTTP2,
+    LAMBDA_MAX_CONNECTIONS,
+    LAMBDA_MAX_KEEPALIVE,
+    LAMBDA_KEEPALIVE_EXPIRY,
+    LAMBDA_MAX_RETRIES,
+    TEST_TIMEOUT,
+    TEST_WORKERS,
+)
 
-async def execute_python_code(code: str) -> Dict[str, Any]:
+# Timeouts por endpoint: la ejecución simple tiene un límite de 30 s en la
+# Lambda y los tests pueden tardar más
+RUN_CODE_TIMEOUT = httpx.Timeout(35.0, connect=5.0)
+RUN_TEST_TIMEOUT = httpx.Timeout(60.0, connect=5.0)
+BATCH_TEST_TIMEOUT = httpx.Timeout(120.0, connect=5.0)
 
-    url = f"{LAMBDA_API_URL}/CodeRun"
+# Errores transitorios de API Gateway que vale la pena reintentar
+RETRY_STATUS_CODES = {502, 503, 504}
+RETRY_BACKOFF_BASE = 0.2
+
+_client: Optional[httpx.AsyncClient] = None
+
+
+class LambdaError(Exception):
+    """Error de infraestructura de la Lambda (no del código del alumno)."""
+
+
+_stats = {
+    "requests": 0,
+    "new_connections": 0,
+    "reused_connections": 0,
+    "retries": 0,
+    "errors": 0,
+    "in_flight": 0,
+}
+
+
+def _create_client() -> httpx.AsyncClient:
+    return httpx.AsyncClient(
+        base_url=LAMBDA_API_URL or "",
+        http2=LAMBDA_HTTP2,
+        limits=httpx.Limits(
+            max_connections=LAMBDA_MAX_CONNECTIONS,
+            max_keepalive_connections=LAMBDA_MAX_KEEPALIVE,
+            keepalive_expiry=LAMBDA_KEEPALIVE_EXPIRY,
+        ),
+        timeout=RUN_TEST_TIMEOUT,
+    )
+
+
+async def start_lambda_client():
+    """
+    Crea el cliente HTTP compartido. Se llama desde el lifespan de la app.
+    """
+    global _client
+    if _client is None:
+        _client = _create_client()
+
+
+async def close_lambda_client():
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
+def get_lambda_client() -> httpx.AsyncClient:
+    global _client
+    if _client is None:
+        _client = _create_client()
+    return _client
+
+
+def get_lambda_client_stats() -> Dict[str, Any]:
+    return {**_stats, "http2": LAMBDA_HTTP2}
+
+
+async def _post_lambda(path: str, payload: Dict[str, Any], timeout: httpx.Timeout, tipo: str) -> httpx.Response:
+    """
+    POST a la Lambda usando el cliente compartido. Reintenta con backoff
+    exponencial y jitter ante errores de conexión y 5xx transitorios.
+    `tipo` (run, test, evaluacion, lote) etiqueta la métrica de latencia.
+    Si la Lambda no responde o sigue respondiendo 5xx lanza LambdaError.
+    """
+    started = time.perf_counter()
+    _stats["in_flight"] += 1
+    try:
+        response = await _post_lambda_with_retries(path, payload, timeout)
+    except httpx.TimeoutException as e:
+        executor_timeouts.inc(executor="lambda", tipo=tipo)
+        raise LambdaError("La Lambda no respondió a tiempo") from e
+    except httpx.HTTPError as e:
+        raise LambdaError(f"No se pudo contactar a la Lambda: {str(e)}") from e
+    finally:
+        _stats["in_flight"] -= 1
+        executor_duration.observe(time.perf_counter() - started, executor="lambda", tipo=tipo)
+    if response.status_code >= 500:
+        raise LambdaError(f"La Lambda respondió con estado {response.status_code}")
+    return response
+
+
+async def _post_lambda_with_retries(path: str, payload: Dict[str, Any], timeout: httpx.Timeout) -> httpx.Response:
+    client = get_lambda_client()
+
+    for attempt in range(LAMBDA_MAX_RETRIES + 1):
+        new_connection = False
+
+        async def trace(event_name: str, info: Dict[str, Any]):
+            nonlocal new_connection
+            if event_name == "connection.connect_tcp.complete":
+                new_connection = True
+
+        try:
+            response = await client.post(path, json=payload, timeout=timeout, extensions={"trace": trace})
+        except (httpx.ConnectError, httpx.ConnectTimeout, httpx.RemoteProtocolError):
+            _stats["errors"] += 1
+            if attempt == LAMBDA_MAX_RETRIES:
+                raise
+        else:
+            _stats["requests"] += 1
+            if new_connection:
+                _stats["new_connections"] += 1
+            else:
+                _stats["reused_connections"] += 1
+            if response.status_code not in RETRY_STATUS_CODES or attempt == LAMBDA_MAX_RETRIES:
+                return response
+
+        _stats["retries"] += 1
+        await asyncio.sleep(random.uniform(0, RETRY_BACKOFF_BASE * 2 ** attempt))
+
+
+async def execute_python_code(code: str, use_cache: bool = False) -> Dict[str, Any]:
+    # La ejecución simple puede no ser determinista, por eso el cache es opcional
+    if use_cache:
+        key = result_key("run", "lambda", code)
+        return await run_cached(key, lambda: _request_python_code(code))
+    return await _request_python_code(code)
+
+
+async def stream_python_code(code: str):
+    """
+    Versión en streaming de execute_python_code. La Lambda responde
+    recién cuando el programa termina, así que la salida se reenvía como
+    eventos con el mismo formato y límite que el sandbox Docker.
+    """
+    from functions.streaming import result_events
+    try:
+        result = await _request_python_code(code)
+    except Exception as e:
+        yield {"evento": "error", "error": f"Error al ejecutar el código: {str(e)}"}
+        return
+    for event in result_events(result):
+        yield event
+
+
+async def _request_python_code(code: str) -> Dict[str, Any]:
 
     payload = {
         "code": code
     }
     
-    async with httpx.AsyncClient(timeout=35.0) as client:
-        response = await client.post(url, json=payload)
-        response.raise_for_status()
-        
-        # La respuesta tiene estructura: {'statusCode': 200, 'body': '{"output": ..., "errors": ..., "results": {...}}'}
-        lambda_response = response.json()
+    response = await _post_lambda("/CodeRun", payload, RUN_CODE_TIMEOUT, "run")
+    response.raise_for_status()
+    
+    # La respuesta tiene estructura: {'statusCode': 200, 'body': '{"output": ..., "errors": ..., "results": {...}}'}
+    lambda_response = response.json()
+    
+    # Parsear el body que viene como string JSON
+    if 'body' in lambda_response and isinstance(lambda_response['body'], str):
+        body = json.loads(lambda_response['body'])
+    else:
+        body = lambda_response
+    
+    return_code = body.get("results", {}).get("return_code", 1)
+    if return_code == 124:
+        executor_timeouts.inc(executor="lambda", tipo="run")
+    
+    # Retornar en el formato esperado
+    return {
+        "stdout": body.get("output", ""),
+        "stderr": body.get("errors", ""),
+        "return_code": return_code,
+        "recursos": body.get("recursos")
+    }
+
+
+async def _execute_code_with_test(
+        code: str,
+        test: str,
+        test_hash: Optional[str] = None,
+        tipo: str = "test",
+        fail_fast: bool = False,
+) -> Dict[str, Any]:
+    
+    try:
+        # Mismo código contra el mismo test da el mismo resultado: se
+        # cachea y las solicitudes idénticas simultáneas se agrupan
+        test_hash = test_hash or content_hash(test)
         
-        # Parsear el body que viene como string JSON
-        if 'body' in lambda_response and isinstance(lambda_response['body'], str):
-            body = json.loads(lambda_response['body'])
-        else:
-            body = lambda_response
+        # Si al código le falta una función que importa el test, no hace
+        # falta invocar la Lambda para saber el resultado
+        prechecked = precheck_code(code, get_suite(test, test_hash))
+        if prechecked:
+            return prechecked
         
-        # Retornar en el formato esperado
+        key = result_key("test_ff" if fail_fast else "test", "lambda", code, test_hash)
+        return await run_cached(key, lambda: _request_code_with_test(code, test, tipo, fail_fast))
+    except LambdaError:
+        # Lo maneja el enrutador de ejecutores (functions/ejecutores.py)
+        raise
+    except Exception as e:
         return {
-            "stdout": body.get("output", ""),
-            "stderr": body.get("errors", ""),
-            "return_code": body.get("results", {}).get("return_code", 1)
+            "stdout": "",
+            "stderr": f"Error inesperado: {str(e)}",
+            "return_code": 1
         }
 
 
-async def _execute_code_with_test(code: str, test: str) -> Dict[str, Any]:
+async def _request_code_with_test(code: str, test: str, tipo: str = "test", fail_fast: bool = False) -> Dict[str, Any]:
       
-    url = f"{LAMBDA_API_URL}/EdurunCodeTestTarea"
-    
     payload = {
         "code": code,
-        "test": test
+        "test": test,
+        "test_timeout": TEST_TIMEOUT,
+        "fail_fast": fail_fast,
+        "test_workers": TEST_WORKERS
     }
     
-    try:
-        async with httpx.AsyncClient(timeout=60.0) as client:
-            response = await client.post(url, json=payload)
-            
-            
-            lambda_response = response.json()
-            
-            # Parsear el body que viene como string JSON
-            if 'body' in lambda_response and isinstance(lambda_response['body'], str):
-                body = json.loads(lambda_response['body'])
-            else:
-                body = lambda_response
-            
-            # Retornar en el formato esperado (incluso si el código del usuario falló)
-            return {
-                "stdout": body.get("stdout", ""),
-                "stderr": body.get("stderr", ""),
-                "return_code": body.get("return_code", 1)
-            }
-    except Exception as e:
-        return {
-            "stdout": "",
-            "stderr": f"Error inesperado: {str(e)}",
-            "return_code": 1
-        }
+    response = await _post_lambda("/EdurunCodeTestTarea", payload, RUN_TEST_TIMEOUT, tipo)
+    
+    lambda_response = response.json()
+    
+    # Parsear el body que viene como string JSON
+    if 'body' in lambda_response and isinstance(lambda_response['body'], str):
+        body = json.loads(lambda_response['body'])
+    else:
+        body = lambda_response
+    
+    # Retornar en el formato esperado (incluso si el código del usuario falló)
+    return {
+        "stdout": body.get("stdout", ""),
+        "stderr": body.get("stderr", ""),
+        "return_code": body.get("return_code", 1),
+        "resultado": body.get("resultado"),
+        "recursos": body.get("recursos")
+    }
 
 
-async def execute_code_test(code: str, tarea_id: int) -> Dict[str, Any]:
+async def execute_code_test(code: str, tarea_id: int, fail_fast: bool = False) -> Dict[str, Any]:
     from functions.tareas import get_tarea_test
     
     # Obtener el test de la tarea desde la base de datos
-    tarea_data = get_tarea_test(tarea_id)
+    tarea_data = await get_tarea_test(tarea_id)
     
     if not tarea_data or not tarea_data.get("test"):
         return {
@@ -83,14 +272,14 @@ async def execute_code_test(code: str, tarea_id: int) -> Dict[str, Any]:
         }
     
     test = tarea_data.get("test")
-    return await _execute_code_with_test(code, test)
+    return await _execute_code_with_test(code, test, tarea_data.get("hash"), fail_fast=fail_fast)
 
 
-async def execute_code_test_evaluacion(code: str, evaluacion_id: int) -> Dict[str, Any]:
+async def execute_code_test_evaluacion(code: str, evaluacion_id: int, fail_fast: bool = False) -> Dict[str, Any]:
     from functions.evaluaciones import get_evaluacion_test
     
     # Obtener el test de la evaluación desde la base de datos
-    evaluacion_data = get_evaluacion_test(evaluacion_id)
+    evaluacion_data = await get_evaluacion_test(evaluacion_id)
     if not evaluacion_data or not evaluacion_data.get("test"):
         return {
             "stdout": "",
@@ -99,7 +288,7 @@ async def execute_code_test_evaluacion(code: str, evaluacion_id: int) -> Dict[st
         }
     
     test = evaluacion_data.get("test")
-    return await _execute_code_with_test(code, test)
+    return await _execute_code_with_test(code, test, evaluacion_data.get("hash"), fail_fast=fail_fast)
 
 
 async def evaluate_activity(code: str, evaluacion_id: int) -> Dict[str, Any]:
@@ -107,11 +296,10 @@ async def evaluate_activity(code: str, evaluacion_id: int) -> Dict[str, Any]:
     Evalúa una actividad (evaluación) y extrae el puntaje obtenido.
     Similar a execute_code_test_evaluacion pero retorna también el score.
     """
-    import re
     from functions.evaluaciones import get_evaluacion_test
     
     # Obtener el test de la evaluación desde la base de datos
-    evaluacion_data = get_evaluacion_test(evaluacion_id)
+    evaluacion_data = await get_evaluacion_test(evaluacion_id)
     if not evaluacion_data or not evaluacion_data.get("test"):
         return {
             "score": 0,
@@ -121,21 +309,56 @@ async def evaluate_activity(code: str, evaluacion_id: int) -> Dict[str, Any]:
         }
     
     test = evaluacion_data.get("test")
-    result = await _execute_code_with_test(code, test)
-    
-    # Extraer el puntaje del output
-    score = 0
-    output = result.get("stdout", "")
-    
-    score_match = re.search(r'Puntaje obtenido: (\d+)%', output)
-    if score_match:
-        score = int(score_match.group(1))
+    result = await _execute_code_with_test(code, test, evaluacion_data.get("hash"), "evaluacion")
     
     # Retornar con el score incluido
     return {
-        "score": score,
+        "score": _get_score(result),
         "stdout": result.get("stdout", ""),
         "stderr": result.get("stderr", ""),
-        "return_code": result.get("return_code", 1)
+        "return_code": result.get("return_code", 1),
+        "resultado": result.get("resultado"),
+        "recursos": result.get("recursos")
     }
 
+
+def _get_score(result: Dict[str, Any]) -> int:
+    # El puntaje viene en el registro estructurado que escribe el runner
+    return (result.get("resultado") or {}).get("score", 0)
+
+
+async def evaluate_batch(items: List[Dict[str, Any]], test: str) -> List[Dict[str, Any]]:
+    """
+    Califica un lote de entregas ([{"id": ..., "code": ...}]) contra el
+    mismo test en una sola invocación de la Lambda.
+    """
+    payload = {
+        "test": test,
+        "codes": items,
+        "test_timeout": TEST_TIMEOUT,
+        "test_workers": TEST_WORKERS
+    }
+    
+    response = await _post_lambda("/EdurunCodeTestTarea", payload, BATCH_TEST_TIMEOUT, "lote")
+    lambda_response = response.json()
+    
+    if 'body' in lambda_response and isinstance(lambda_response['body'], str):
+        body = json.loads(lambda_response['body'])
+    else:
+        body = lambda_response
+    
+    if "resultados" not in body:
+        raise RuntimeError(body.get("stderr") or "Respuesta inválida de la Lambda")
+    
+    return [
+        {
+            "id": result.get("id"),
+            "score": _get_score(result),
+            "stdout": result.get("stdout", ""),
+            "stderr": result.get("stderr", ""),
+            "return_code": result.get("return_code", 1),
+            "resultado": result.get("resultado"),
+            "recursos": result.get("recursos")
+        }
+        for result in body["resultados"]
+    ]
@@ -1,221 +1,165 @@
-import subprocess
-import uuid
-import os
-import re
+import time
+
 from fastapi.responses import JSONResponse
 
-SCRIPTS_DIR = "/tmp/scripts"
-os.makedirs(SCRIPTS_DIR, exist_ok=True)
-
-def run_code_in_docker(code: str):
-    file_id = str(uuid.uuid4())
-    script_path = os.path.join(SCRIPTS_DIR, f"{file_id}.py")
-    
-    with open(script_path, "w") as f:
-        try:
-            f.write(code)
-        except Exception as e:
-            return JSONResponse(content={"error": "Error al escribir el script"}, status_code=500)
-
-    # 2. Ejecutar el código dentro de un contenedor Docker
-    cmd = [
-        "docker", "run", "--rm",
-        "-m", "128m", "--cpus=0.5",  # límites de recursos
-        "-v", f"{script_path}:/app/script.py:ro",  # montar archivo
-        "python:3.11-slim",
-        "python", "/app/script.py"
-    ]
+from functions.cache import content_hash
+from functions.metricas import executor_duration, executor_timeouts
+from functions.result_cache import run_cached, result_key
+from functions.test_suites import get_suite, precheck_code
+from functions.sandbox_pool import run_sandbox_job, stream_sandbox_job, SandboxError, SandboxSaturatedError
+from settings import STREAM_MAX_BYTES, TEST_TIMEOUT, TEST_WORKERS
+
 
+async def _run_in_sandbox(job: dict, tipo: str):
+    started = time.perf_counter()
     try:
-        result = subprocess.run(
-            cmd, capture_output=True, text=True, timeout=10
-        )
-    except subprocess.TimeoutExpired:
-        return JSONResponse(content={"error": "Tiempo de ejecución excedido"}, status_code=408)
-    finally:
-        # Eliminar el archivo temporal
-        os.remove(script_path)
-
-    output = result.stdout
-    errors = result.stderr
+        result = await run_sandbox_job(job)
+    except SandboxSaturatedError:
+        return JSONResponse(content={"error": "El servidor de ejecución está saturado, intente nuevamente"}, status_code=503)
+    except SandboxError as e:
+        return JSONResponse(content={"error": f"Error al ejecutar el código: {str(e)}"}, status_code=500)
+
+    # Incluye la espera en la cola de admisión
+    executor_duration.observe(time.perf_counter() - started, executor="docker", tipo=tipo)
+    if result.get("timeout"):
+        executor_timeouts.inc(executor="docker", tipo=tipo)
+        return JSONResponse(content={"error": "Tiempo de ejecución excedido", "recursos": result.get("recursos")}, status_code=408)
 
     return {
-        "stdout": output,
-        "stderr": errors,
-        "return_code": result.returncode
+        "stdout": result.get("stdout", ""),
+        "stderr": result.get("stderr", ""),
+        "return_code": result.get("return_code", 1),
+        "resultado": result.get("resultado"),
+        "recursos": result.get("recursos")
     }
 
-def run_evaluacion_unittest_in_docker(code: str, evaluacion_id: int):
-    from functions.evaluaciones import get_evaluacion_test
-    test = get_evaluacion_test(evaluacion_id).get("test")
-    
-    user_file_id = str(uuid.uuid4())
-    test_file_id = str(uuid.uuid4())
-    user_script_path = os.path.join(SCRIPTS_DIR, f"{user_file_id}.py")
-    test_script_path = os.path.join(SCRIPTS_DIR, f"{test_file_id}_test.py")
-    
-    # Ruta absoluta a la carpeta configs de FastAPI
-    pytest_plugin_path = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "configs", "pytest_plugin.py"))
-
-
-    with open(user_script_path, "w") as f:
-        try:
-            f.write(code)
-        except Exception as e:
-            return JSONResponse(content={"error": "Error al escribir el script del usuario"}, status_code=500)
-
-    with open(test_script_path, "w") as f:
-        try:
-            f.write(test)
-        except Exception as e:
-            return JSONResponse(content={"error": "Error al escribir el script de prueba"}, status_code=500)
-
-    cmd = [
-        "docker", "run", "--rm",
-        "-m", "256m", "--cpus=1",
-        "-v", f"{user_script_path}:/app/app.py:ro",
-        "-v", f"{test_script_path}:/app/test_code.py:ro",
-        "-v", f"{pytest_plugin_path}:/app/pytest_plugin.py:ro",
-        "edurun-pytest:latest",
-        "python", "/app/pytest_plugin.py"
-    ]
 
-    try:
-        result = subprocess.run(
-            cmd, capture_output=True, text=True, timeout=30
-        )
-    except subprocess.TimeoutExpired:
-        return JSONResponse(content={"error": "Tiempo de ejecución excedido"}, status_code=408)
-    finally:
-        # Eliminar los archivos temporales
-        os.remove(user_script_path)
-        os.remove(test_script_path)
-
-    output = result.stdout
-    errors = result.stderr
+def _is_cacheable(result) -> bool:
+    # Los errores del sandbox y los timeouts no se cachean
+    return not isinstance(result, JSONResponse)
 
-    return {
-        "stdout": output,
-        "stderr": errors,
-        "return_code": result.returncode
-    }
-    
-def run_tarea_unittest_in_docker(code: str, tarea_id: int):
-    from functions.tareas import get_tarea_test
-    test = get_tarea_test(tarea_id).get("test")
-    
-    user_file_id = str(uuid.uuid4())
-    test_file_id = str(uuid.uuid4())
-    user_script_path = os.path.join(SCRIPTS_DIR, f"{user_file_id}.py")
-    test_script_path = os.path.join(SCRIPTS_DIR, f"{test_file_id}_test.py")
-    
-    # Ruta absoluta al archivo pytest_plugin.py
-    pytest_plugin_path = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "configs", "pytest_plugin.py"))
-
-    with open(user_script_path, "w") as f:
-        try:
-            f.write(code)
-        except Exception as e:
-            return JSONResponse(content={"error": "Error al escribir el script del usuario"}, status_code=500)
-
-    with open(test_script_path, "w") as f:
-        try:
-            f.write(test)
-        except Exception as e:
-            return JSONResponse(content={"error": "Error al escribir el script de prueba"}, status_code=500)
-
-    cmd = [
-        "docker", "run", "--rm",
-        "-m", "256m", "--cpus=1",
-        "-v", f"{user_script_path}:/app/app.py:ro",
-        "-v", f"{test_script_path}:/app/test_code.py:ro",
-        "-v", f"{pytest_plugin_path}:/app/pytest_plugin.py:ro",
-        "edurun-pytest:latest",
-        "python", "/app/pytest_plugin.py"
-    ]
 
-    try:
-        result = subprocess.run(
-            cmd, capture_output=True, text=True, timeout=30
-        )
-    except subprocess.TimeoutExpired:
-        return JSONResponse(content={"error": "Tiempo de ejecución excedido"}, status_code=408)
-    finally:
-        # Eliminar los archivos temporales
-        os.remove(user_script_path)
-        os.remove(test_script_path)
-
-    output = result.stdout
-    errors = result.stderr
+async def _run_pytest_in_sandbox(code: str, test: str, test_hash: str = None, tipo: str = "test", fail_fast: bool = False):
+    test_hash = test_hash or content_hash(test)
 
-    return {
-        "stdout": output,
-        "stderr": errors,
-        "return_code": result.returncode
+    # Si al código le falta una función que importa el test, se responde
+    # sin ocupar un sandbox
+    prechecked = precheck_code(code, get_suite(test, test_hash))
+    if prechecked:
+        return prechecked
+
+    key = result_key("test_ff" if fail_fast else "test", "docker", code, test_hash)
+    return await run_cached(key, lambda: _run_in_sandbox({
+        "tipo": "pytest",
+        "code": code,
+        "test": test,
+        "timeout": 30,
+        "test_timeout": TEST_TIMEOUT,
+        "fail_fast": fail_fast,
+        "test_workers": TEST_WORKERS,
+        "memoria_mb": 256,
+    }, tipo), _is_cacheable)
+
+
+async def run_code_in_docker(code: str, use_cache: bool = False):
+    job = {
+        "tipo": "run",
+        "code": code,
+        "timeout": 10,
+        "memoria_mb": 128,  # límites de recursos
     }
+    if use_cache:
+        return await run_cached(result_key("run", "docker", code), lambda: _run_in_sandbox(job, "run"), _is_cacheable)
+    return await _run_in_sandbox(job, "run")
+
+async def stream_code_in_docker(code: str):
+    """
+    Ejecuta el código enviando su salida como eventos a medida que se
+    produce (ver functions/streaming.py).
+    """
+    job = {
+        "tipo": "run_stream",
+        "code": code,
+        "timeout": 10,
+        "memoria_mb": 128,
+        "max_bytes": STREAM_MAX_BYTES,
+    }
+    try:
+        async for event in stream_sandbox_job(job):
+            yield event
+    except SandboxSaturatedError:
+        yield {"evento": "error", "error": "El servidor de ejecución está saturado, intente nuevamente"}
+
+# En las prácticas se puede pedir fail-fast: la ejecución se detiene en
+# el primer test que falla. Las entregas calificadas corren todos los tests
+async def run_evaluacion_unittest_in_docker(code: str, evaluacion_id: int, fail_fast: bool = False):
+    from functions.evaluaciones import get_evaluacion_test
+    evaluacion_data = await get_evaluacion_test(evaluacion_id)
+    return await _run_pytest_in_sandbox(code, evaluacion_data.get("test"), evaluacion_data.get("hash"), fail_fast=fail_fast)
+
+async def run_tarea_unittest_in_docker(code: str, tarea_id: int, fail_fast: bool = False):
+    from functions.tareas import get_tarea_test
+    tarea_data = await get_tarea_test(tarea_id)
+    return await _run_pytest_in_sandbox(code, tarea_data.get("test"), tarea_data.get("hash"), fail_fast=fail_fast)
 
-def evaluate_activity(code: str, evaluacion_id: int):
+async def evaluate_activity(code: str, evaluacion_id: int):
     from functions.evaluaciones import get_evaluacion_test
-    test = get_evaluacion_test(evaluacion_id).get("test")
-    
-    user_file_id = str(uuid.uuid4())
-    test_file_id = str(uuid.uuid4())
-    user_script_path = os.path.join(SCRIPTS_DIR, f"{user_file_id}.py")
-    test_script_path = os.path.join(SCRIPTS_DIR, f"{test_file_id}_test.py")
-    
-    # Ruta absoluta al archivo pytest_plugin.py
-    pytest_plugin_path = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "configs", "pytest_plugin.py"))
-
-    with open(user_script_path, "w") as f:
-        try:
-            f.write(code)
-        except Exception as e:
-            return JSONResponse(content={"error": "Error al escribir el script del usuario"}, status_code=500)
-
-    with open(test_script_path, "w") as f:
-        try:
-            f.write(test)
-        except Exception as e:
-            return JSONResponse(content={"error": "Error al escribir el script de prueba"}, status_code=500)
-
-    cmd = [
-        "docker", "run", "--rm",
-        "-m", "256m", "--cpus=1",
-        "-v", f"{user_script_path}:/app/app.py:ro",
-        "-v", f"{test_script_path}:/app/test_code.py:ro",
-        "-v", f"{pytest_plugin_path}:/app/pytest_plugin.py:ro",
-        "edurun-pytest:latest",
-        "python", "/app/pytest_plugin.py"
-    ]
+    evaluacion_data = await get_evaluacion_test(evaluacion_id)
 
-    try:
-        result = subprocess.run(
-            cmd, capture_output=True, text=True, timeout=30
-        )
-    except subprocess.TimeoutExpired:
-        return JSONResponse(content={"error": "Tiempo de ejecución excedido"}, status_code=408)
-    finally:
-        # Eliminar los archivos temporales
-        os.remove(user_script_path)
-        os.remove(test_script_path)
-
-    output = result.stdout
-    errors = result.stderr
-
-    # Extraer el puntaje del output
-    score = 0
-    
-    score_match = re.search(r'Puntaje obtenido: (\d+)%', output)
-    if score_match:
-        score = int(score_match.group(1))
-
-    if result.returncode != 0:
+    result = await _run_pytest_in_sandbox(code, evaluacion_data.get("test"), evaluacion_data.get("hash"), "evaluacion")
+    if isinstance(result, JSONResponse):
+        return result
+
+    output = result["stdout"]
+    errors = result["stderr"]
+
+    score = _get_score(result)
+
+    if result["return_code"] != 0:
         errors = output + "\n" + errors
 
     return {
         "score": score,
         "stdout": output,
         "stderr": errors,
-        "return_code": result.returncode
+        "return_code": result["return_code"],
+        "resultado": result.get("resultado"),
+        "recursos": result.get("recursos")
     }
 
+
+def _get_score(result: dict) -> int:
+    # El puntaje viene en el registro estructurado que escribe el runner
+    return (result.get("resultado") or {}).get("score", 0)
+
+
+async def evaluate_batch(items: list, test: str) -> list:
+    """
+    Califica un lote de entregas ([{"id": ..., "code": ...}]) contra el
+    mismo test en un solo worker del pool.
+    """
+    with executor_duration.time(executor="docker", tipo="lote"):
+        response = await run_sandbox_job({
+            "tipo": "pytest_lote",
+            "test": test,
+            "codes": items,
+            "timeout": 30,
+            "test_timeout": TEST_TIMEOUT,
+            "test_workers": TEST_WORKERS,
+            "memoria_mb": 256,
+        })
+    if "resultados" not in response:
+        raise SandboxError(response.get("stderr") or "Respuesta inválida del sandbox")
+
+    return [
+        {
+            "id": result.get("id"),
+            "score": _get_score(result),
+            "stdout": result.get("stdout", ""),
+            "stderr": result.get("stderr", ""),
+            "return_code": result.get("return_code", 1),
+            "resultado": result.get("resultado"),
+            "recursos": result.get("recursos")
+        }
+        for result in response["resultados"]
+    ]
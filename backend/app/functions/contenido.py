@@ -0,0 +1,119 @@
+"""
+Código y detalles de las entregas comprimidos y deduplicados por hash.
+
+Cada contenido se guarda una sola vez en la tabla `contenido` (ver
+backend/sql/003_contenido_entregas.sql), comprimido con zlib, y la entrega
+guarda solo su hash. Como la plantilla inicial y muchos detalles se
+repiten entre alumnos, la mayoría de las entregas comparten contenido.
+"""
+import json
+import zlib
+from typing import Any, Dict, List, Optional, Tuple
+
+from functions.cache import TTLCache, MISSING, content_hash
+from functions.db import fetch
+from settings import CONTENT_COMPRESSION_LEVEL, CONTENT_CACHE_SIZE, CONTENT_CACHE_TTL
+
+# Texto ya descomprimido por hash. Un hash siempre corresponde al mismo
+# contenido, así que esta cache nunca se invalida
+_contenidos = TTLCache("contenido", CONTENT_CACHE_SIZE, CONTENT_CACHE_TTL)
+
+CONTENIDOS_BY_HASH = "SELECT hash, compresion, datos FROM contenido WHERE hash = ANY($1::text[])"
+
+
+def contenidos_cte(first_param: int) -> str:
+    """
+    CTE que inserta los contenidos nuevos en la misma consulta que guarda
+    la entrega. Recibe los tres arreglos de Contenidos.args() desde el
+    parámetro `first_param`.
+    """
+    hashes, compresiones, datos = (f"${first_param + i}" for i in range(3))
+    return f"""
+WITH contenido_nuevo AS (
+    INSERT INTO contenido (hash, compresion, datos)
+    SELECT * FROM unnest({hashes}::text[], {compresiones}::text[], {datos}::bytea[])
+    ON CONFLICT (hash) DO NOTHING
+)"""
+
+
+# Columnas con contenido: (columna, columna del hash, es JSON)
+CAMPOS = (("codigo", "codigo_hash", False), ("detalles", "detalles_hash", True))
+
+
+def _compress(text: str) -> Tuple[str, bytes]:
+    data = text.encode("utf-8")
+    compressed = zlib.compress(data, CONTENT_COMPRESSION_LEVEL)
+    # Los textos muy cortos no ganan nada al comprimirse
+    if len(compressed) < len(data):
+        return "zlib", compressed
+    return "ninguna", data
+
+
+def _decompress(compresion: str, datos: bytes) -> str:
+    if compresion == "zlib":
+        datos = zlib.decompress(datos)
+    return bytes(datos).decode("utf-8")
+
+
+class Contenidos:
+    """
+    Contenidos a guardar junto con una o más entregas. `add` retorna el
+    hash que se guarda en la entrega; `args` los arreglos para
+    contenidos_cte().
+    """
+    def __init__(self):
+        self._items: Dict[str, Tuple[str, bytes]] = {}
+
+    def add(self, value: Any, is_json: bool = False) -> Optional[str]:
+        if value is None:
+            return None
+        text = json.dumps(value, sort_keys=True, ensure_ascii=False) if is_json else value
+        digest = content_hash(text)
+        if digest not in self._items:
+            self._items[digest] = _compress(text)
+            _contenidos.set(digest, text)
+        return digest
+
+    def args(self) -> Tuple[List[str], List[str], List[bytes]]:
+        hashes = list(self._items)
+        return (
+            hashes,
+            [self._items[digest][0] for digest in hashes],
+            [self._items[digest][1] for digest in hashes],
+        )
+
+
+async def resolve_contenidos(rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Reemplaza en cada fila codigo_hash y detalles_hash por el contenido.
+    Los contenidos que no están en cache se leen en una sola consulta, una
+    vez por hash aunque se repitan entre filas.
+    """
+    found: Dict[str, str] = {}
+    missing = set()
+    for row in rows:
+        for _, hash_column, _ in CAMPOS:
+            digest = row.get(hash_column)
+            if digest and digest not in found:
+                text = _contenidos.get(digest)
+                if text is MISSING:
+                    missing.add(digest)
+                else:
+                    found[digest] = text
+
+    if missing:
+        for contenido in await fetch(CONTENIDOS_BY_HASH, list(missing)):
+            text = _decompress(contenido["compresion"], contenido["datos"])
+            _contenidos.set(contenido["hash"], text)
+            found[contenido["hash"]] = text
+
+    for row in rows:
+        for column, hash_column, is_json in CAMPOS:
+            if hash_column not in row:
+                continue
+            digest = row.pop(hash_column)
+            # Sin hash la entrega es anterior al script 003 y conserva su
+            # contenido en la columna original
+            if digest and digest in found:
+                row[column] = json.loads(found[digest]) if is_json else found[digest]
+    return rows
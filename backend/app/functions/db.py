@@ -0,0 +1,102 @@
+import asyncio
+import json
+import sys
+from typing import Any, Dict, List, Optional
+
+import asyncpg
+
+from functions.metricas import db_query_duration
+from settings import (
+    DATABASE_URL,
+    DB_POOL_MIN_SIZE,
+    DB_POOL_MAX_SIZE,
+    DB_COMMAND_TIMEOUT,
+    DB_STATEMENT_CACHE_SIZE,
+)
+
+# Pool de conexiones a Postgres compartido por toda la aplicación. Se crea
+# en el lifespan de la app (main.py) o, si no, en la primera consulta.
+_pool: Optional[asyncpg.Pool] = None
+_pool_lock = asyncio.Lock()
+
+
+async def _init_connection(conn: asyncpg.Connection):
+    # json/jsonb se leen y escriben como dict, igual que con PostgREST
+    for type_name in ("json", "jsonb"):
+        await conn.set_type_codec(
+            type_name,
+            encoder=json.dumps,
+            decoder=json.loads,
+            schema="pg_catalog",
+        )
+
+
+async def start_db_pool():
+    global _pool
+    async with _pool_lock:
+        if _pool is None:
+            # asyncpg prepara cada consulta la primera vez que se usa en una
+            # conexión y la guarda en su cache: las consultas frecuentes
+            # (búsquedas por id, id_lms, id_curso_lms) se escriben como
+            # constantes para que siempre reutilicen el mismo statement
+            _pool = await asyncpg.create_pool(
+                DATABASE_URL,
+                min_size=DB_POOL_MIN_SIZE,
+                max_size=DB_POOL_MAX_SIZE,
+                command_timeout=DB_COMMAND_TIMEOUT,
+                statement_cache_size=DB_STATEMENT_CACHE_SIZE,
+                init=_init_connection,
+            )
+    return _pool
+
+
+async def close_db_pool():
+    global _pool
+    async with _pool_lock:
+        if _pool is not None:
+            await _pool.close()
+            _pool = None
+
+
+async def get_pool() -> asyncpg.Pool:
+    if _pool is None:
+        return await start_db_pool()
+    return _pool
+
+
+def _caller() -> str:
+    # Función que llamó a fetch/fetchrow/executemany, para la métrica de
+    # latencia por función
+    return sys._getframe(2).f_code.co_name
+
+
+async def fetch(query: str, *args) -> List[Dict[str, Any]]:
+    pool = await get_pool()
+    with db_query_duration.time(funcion=_caller()):
+        rows = await pool.fetch(query, *args)
+    return [dict(row) for row in rows]
+
+
+async def fetchrow(query: str, *args) -> Optional[Dict[str, Any]]:
+    pool = await get_pool()
+    with db_query_duration.time(funcion=_caller()):
+        row = await pool.fetchrow(query, *args)
+    return dict(row) if row is not None else None
+
+
+async def executemany(query: str, args: List[tuple]):
+    pool = await get_pool()
+    with db_query_duration.time(funcion=_caller()):
+        await pool.executemany(query, args)
+
+
+def get_db_pool_stats() -> Dict[str, Any]:
+    if _pool is None:
+        return {"started": False, "min_size": DB_POOL_MIN_SIZE, "max_size": DB_POOL_MAX_SIZE}
+    return {
+        "started": True,
+        "min_size": _pool.get_min_size(),
+        "max_size": _pool.get_max_size(),
+        "size": _pool.get_size(),
+        "idle": _pool.get_idle_size(),
+    }
@@ -0,0 +1,337 @@
+"""
+Ejecutores intercambiables (Docker y Lambda) y el enrutador que elige uno
+por solicitud.
+
+Cada ejecutor expone las mismas operaciones y lanza ExecutorUnavailable
+cuando falla su infraestructura (sandbox saturado, Lambda caída), nunca
+por errores del código del alumno. El enrutador prueba los ejecutores
+configurados en EXECUTORS ordenados por latencia y tasa de error
+observadas, salta los que tienen el circuito abierto y, si el elegido
+falla, reintenta la solicitud en el siguiente.
+"""
+import random
+import time
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional
+
+from fastapi.responses import JSONResponse
+
+from settings import (
+    EXECUTORS,
+    EXECUTOR_ROUTING,
+    EXECUTOR_BREAKER_FAILURES,
+    EXECUTOR_BREAKER_COOLDOWN,
+    EXECUTOR_EWMA_ALPHA,
+    EXECUTOR_EXPLORATION,
+)
+
+
+class ExecutorUnavailable(Exception):
+    """
+    El ejecutor no pudo atender la solicitud. `response` es la respuesta
+    de error del ejecutor, si la tiene.
+    """
+    def __init__(self, message: str, response: Optional[JSONResponse] = None):
+        super().__init__(message)
+        self.response = response
+
+
+class Executor:
+    """
+    Interfaz común de los ejecutores. Las operaciones retornan lo mismo que
+    las funciones de functions/containers.py y functions/aws_lambda.py.
+    """
+    name = ""
+
+    async def run_code(self, code: str, use_cache: bool = False):
+        raise NotImplementedError
+
+    def stream_code(self, code: str) -> AsyncIterator[Dict[str, Any]]:
+        raise NotImplementedError
+
+    async def run_tarea_test(self, code: str, tarea_id: int, fail_fast: bool = False):
+        raise NotImplementedError
+
+    async def run_evaluacion_test(self, code: str, evaluacion_id: int, fail_fast: bool = False):
+        raise NotImplementedError
+
+    async def evaluate_activity(self, code: str, evaluacion_id: int):
+        raise NotImplementedError
+
+    async def evaluate_batch(self, items: List[Dict[str, Any]], test: str) -> List[Dict[str, Any]]:
+        raise NotImplementedError
+
+
+class DockerExecutor(Executor):
+    """
+    Pool local de sandboxes. Los errores del sandbox llegan como
+    JSONResponse 500/503; el 408 es un timeout del código del alumno.
+    """
+    name = "docker"
+
+    @staticmethod
+    def _check(result):
+        if isinstance(result, JSONResponse) and result.status_code in (500, 503):
+            raise ExecutorUnavailable(f"El sandbox respondió con estado {result.status_code}", result)
+        return result
+
+    async def run_code(self, code, use_cache=False):
+        from functions.containers import run_code_in_docker
+        return self._check(await run_code_in_docker(code, use_cache))
+
+    def stream_code(self, code):
+        from functions.containers import stream_code_in_docker
+        return stream_code_in_docker(code)
+
+    async def run_tarea_test(self, code, tarea_id, fail_fast=False):
+        from functions.containers import run_tarea_unittest_in_docker
+        return self._check(await run_tarea_unittest_in_docker(code, tarea_id, fail_fast))
+
+    async def run_evaluacion_test(self, code, evaluacion_id, fail_fast=False):
+        from functions.containers import run_evaluacion_unittest_in_docker
+        return self._check(await run_evaluacion_unittest_in_docker(code, evaluacion_id, fail_fast))
+
+    async def evaluate_activity(self, code, evaluacion_id):
+        from functions.containers import evaluate_activity
+        return self._check(await evaluate_activity(code, evaluacion_id))
+
+    async def evaluate_batch(self, items, test):
+        from functions.containers import evaluate_batch
+        from functions.sandbox_pool import SandboxError
+        try:
+            return await evaluate_batch(items, test)
+        except SandboxError as e:
+            raise ExecutorUnavailable(str(e)) from e
+
+
+class LambdaExecutor(Executor):
+    """
+    Lambda en AWS. Los errores de infraestructura llegan como LambdaError.
+    """
+    name = "lambda"
+
+    async def _call(self, function, *args):
+        from functions.aws_lambda import LambdaError
+        try:
+            return await function(*args)
+        except LambdaError as e:
+            raise ExecutorUnavailable(str(e)) from e
+
+    async def run_code(self, code, use_cache=False):
+        from functions.aws_lambda import execute_python_code
+        return await self._call(execute_python_code, code, use_cache)
+
+    def stream_code(self, code):
+        from functions.aws_lambda import stream_python_code
+        return stream_python_code(code)
+
+    async def run_tarea_test(self, code, tarea_id, fail_fast=False):
+        from functions.aws_lambda import execute_code_test
+        return await self._call(execute_code_test, code, tarea_id, fail_fast)
+
+    async def run_evaluacion_test(self, code, evaluacion_id, fail_fast=False):
+        from functions.aws_lambda import execute_code_test_evaluacion
+        return await self._call(execute_code_test_evaluacion, code, evaluacion_id, fail_fast)
+
+    async def evaluate_activity(self, code, evaluacion_id):
+        from functions.aws_lambda import evaluate_activity
+        return await self._call(evaluate_activity, code, evaluacion_id)
+
+    async def evaluate_batch(self, items, test):
+        from functions.aws_lambda import evaluate_batch
+        return await self._call(evaluate_batch, items, test)
+
+
+EXECUTOR_CLASSES = {
+    DockerExecutor.name: DockerExecutor,
+    LambdaExecutor.name: LambdaExecutor,
+}
+
+
+class CircuitBreaker:
+    """
+    Circuito por ejecutor. Tras `failure_threshold` fallas seguidas se abre
+    y el ejecutor no recibe solicitudes durante `cooldown` segundos; luego
+    pasa a semiabierto y deja pasar una sola solicitud de prueba, que lo
+    cierra si sale bien o lo vuelve a abrir si falla.
+    """
+    def __init__(self, failure_threshold: int, cooldown: float):
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.state = "cerrado"
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probing = False
+
+    def allow(self) -> bool:
+        if self.state == "abierto" and time.monotonic() - self.opened_at >= self.cooldown:
+            self.state = "semiabierto"
+            self._probing = False
+        if self.state == "cerrado":
+            return True
+        if self.state == "semiabierto" and not self._probing:
+            self._probing = True
+            return True
+        return False
+
+    def record_success(self):
+        self.state = "cerrado"
+        self.failures = 0
+        self._probing = False
+
+    def record_failure(self):
+        self.failures += 1
+        if self.state == "semiabierto" or self.failures >= self.failure_threshold:
+            self.state = "abierto"
+            self.opened_at = time.monotonic()
+            self._probing = False
+
+
+class _Backend:
+    """
+    Ejecutor con su circuito y las medias móviles (EWMA) de latencia por
+    operación y de tasa de error.
+    """
+    def __init__(self, executor: Executor):
+        self.executor = executor
+        self.breaker = CircuitBreaker(EXECUTOR_BREAKER_FAILURES, EXECUTOR_BREAKER_COOLDOWN)
+        self.latency: Dict[str, float] = {}
+        self.error_rate = 0.0
+        self.requests = 0
+        self.failures = 0
+
+    def record(self, operation: str, elapsed: Optional[float], failed: bool):
+        self.requests += 1
+        self.error_rate += EXECUTOR_EWMA_ALPHA * ((1.0 if failed else 0.0) - self.error_rate)
+        if failed:
+            self.failures += 1
+            self.breaker.record_failure()
+            return
+        self.breaker.record_success()
+        if elapsed is not None:
+            previous = self.latency.get(operation)
+            self.latency[operation] = elapsed if previous is None else previous + EXECUTOR_EWMA_ALPHA * (elapsed - previous)
+
+    def score(self, operation: str) -> float:
+        latency = self.latency.get(operation)
+        if latency is None:
+            # Sin mediciones se prueba primero, salvo que solo haya fallado
+            return 0.0 if self.error_rate == 0 else float("inf")
+        return latency / max(1.0 - self.error_rate, 0.05)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "circuito": self.breaker.state,
+            "fallas_seguidas": self.breaker.failures,
+            "solicitudes": self.requests,
+            "fallas": self.failures,
+            "tasa_error": round(self.error_rate, 4),
+            "latencia": {operation: round(value, 4) for operation, value in self.latency.items()},
+        }
+
+
+class ExecutorRouter:
+    """
+    Elige el ejecutor de cada solicitud. Con EXECUTOR_ROUTING="prioridad"
+    se respeta el orden de EXECUTORS; con "latencia" se prefiere el de
+    menor latencia ajustada por errores y, con probabilidad
+    EXECUTOR_EXPLORATION, se prueba otro para mantener sus medias al día.
+    """
+    def __init__(self, executors: List[Executor], routing: str = "latencia"):
+        self.backends = [_Backend(executor) for executor in executors]
+        self.routing = routing
+        self.fallbacks = 0
+
+    def _candidates(self, operation: str) -> Iterator[_Backend]:
+        backends = list(self.backends)
+        if self.routing == "latencia":
+            # sort es estable: a igual puntaje queda el orden de EXECUTORS
+            backends.sort(key=lambda backend: backend.score(operation))
+            if len(backends) > 1 and random.random() < EXECUTOR_EXPLORATION:
+                backends.insert(0, backends.pop(random.randrange(1, len(backends))))
+        # El circuito se consulta recién al intentar cada ejecutor, así la
+        # solicitud de prueba de un circuito semiabierto siempre se envía
+        tried = 0
+        for backend in backends:
+            if backend.breaker.allow():
+                if tried:
+                    self.fallbacks += 1
+                tried += 1
+                yield backend
+
+    async def execute(self, operation: str, *args, **kwargs):
+        """
+        Ejecuta `operation` en el mejor ejecutor disponible, pasando al
+        siguiente si falla. Si ninguno puede atenderla lanza
+        ExecutorUnavailable con el último error.
+        """
+        error = ExecutorUnavailable("No hay ejecutores disponibles, intente nuevamente")
+        for backend in self._candidates(operation):
+            started = time.perf_counter()
+            try:
+                result = await getattr(backend.executor, operation)(*args, **kwargs)
+            except ExecutorUnavailable as e:
+                backend.record(operation, None, failed=True)
+                error = e
+                continue
+            backend.record(operation, time.perf_counter() - started, failed=False)
+            return result
+        raise error
+
+    async def stream(self, code: str) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Versión de execute para el streaming. Solo se pasa a otro ejecutor
+        si el primer evento ya es un error: una vez enviada salida al
+        cliente la ejecución no se repite.
+        """
+        error_event = {"evento": "error", "error": "No hay ejecutores disponibles, intente nuevamente"}
+        for backend in self._candidates("stream_code"):
+            events = backend.executor.stream_code(code)
+            first = await events.__anext__()
+            if first.get("evento") == "error":
+                await events.aclose()
+                backend.record("stream_code", None, failed=True)
+                error_event = first
+                continue
+            backend.record("stream_code", None, failed=False)
+            yield first
+            async for event in events:
+                yield event
+            return
+        yield error_event
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enrutamiento": self.routing,
+            "respaldos": self.fallbacks,
+            "ejecutores": {backend.executor.name: backend.stats() for backend in self.backends},
+        }
+
+
+_router: Optional[ExecutorRouter] = None
+
+
+def get_executor_router() -> ExecutorRouter:
+    global _router
+    if _router is None:
+        unknown = [name for name in EXECUTORS if name not in EXECUTOR_CLASSES]
+        if unknown or not EXECUTORS:
+            raise ValueError(f"EXECUTORS debe listar ejecutores de {sorted(EXECUTOR_CLASSES)}: {EXECUTORS}")
+        _router = ExecutorRouter([EXECUTOR_CLASSES[name]() for name in EXECUTORS], EXECUTOR_ROUTING)
+    return _router
+
+
+async def run_on_executor(operation: str, *args, **kwargs):
+    """
+    Para las rutas: el resultado de la operación o, si ningún ejecutor
+    pudo atenderla, la respuesta de error del último (503 si no tiene).
+    """
+    try:
+        return await get_executor_router().execute(operation, *args, **kwargs)
+    except ExecutorUnavailable as e:
+        if e.response is not None:
+            return e.response
+        return JSONResponse(content={"error": str(e)}, status_code=503)
+
+
+def get_executor_stats() -> Dict[str, Any]:
+    return get_executor_router().stats()
@@ -0,0 +1,278 @@
+"""
+Cola local y durable de entregas (write-behind).
+
+Al enviar una evaluación la entrega se guarda primero en un SQLite en modo
+WAL y se confirma al alumno; una tarea en segundo plano la escribe después
+en entrega_evaluacion en lotes, reintentando con espera exponencial si la
+base no responde. Las lecturas de una entrega consultan primero esta cola,
+así nunca se muestra una versión anterior a la recién enviada.
+"""
+import asyncio
+import json
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
+
+from functions.contenido import Contenidos, contenidos_cte
+from settings import (
+    WRITE_BEHIND_ENABLED,
+    WRITE_BEHIND_PATH,
+    WRITE_BEHIND_BATCH_SIZE,
+    WRITE_BEHIND_INTERVAL,
+)
+
+MAX_BACKOFF = 60
+
+# Una sola conexión SQLite, usada siempre desde el mismo hilo
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="write-behind")
+_conn: Optional[sqlite3.Connection] = None
+
+_task: Optional[asyncio.Task] = None
+_wakeup: Optional[asyncio.Event] = None
+_stats = {"encoladas": 0, "escritas": 0, "lotes": 0, "errores": 0}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS entrega_pendiente (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    id_evaluacion INTEGER NOT NULL,
+    id_alumno INTEGER NOT NULL,
+    nota INTEGER NOT NULL,
+    codigo TEXT,
+    detalles TEXT,
+    recibida REAL NOT NULL,
+    intentos INTEGER NOT NULL DEFAULT 0,
+    proximo_intento REAL NOT NULL DEFAULT 0,
+    ultimo_error TEXT,
+    UNIQUE (id_alumno, id_evaluacion)
+)
+"""
+
+# Upsert por ids internos (el alumno ya se resolvió al encolar), con el
+# código y los detalles comprimidos como en UPSERT_ENTREGA de
+# functions/evaluaciones.py
+UPSERT_ENTREGA_BY_ID = contenidos_cte(6) + """
+INSERT INTO entrega_evaluacion (id_evaluacion, id_alumno, nota, codigo_hash, detalles_hash)
+VALUES ($1, $2, $3, $4, $5)
+ON CONFLICT (id_alumno, id_evaluacion) DO UPDATE
+SET nota = EXCLUDED.nota, codigo_hash = EXCLUDED.codigo_hash, detalles_hash = EXCLUDED.detalles_hash,
+    codigo = NULL, detalles = NULL
+"""
+
+
+# Operaciones sobre SQLite (corren en el hilo de _executor)
+
+def _open():
+    global _conn
+    if _conn is None:
+        _conn = sqlite3.connect(WRITE_BEHIND_PATH, check_same_thread=False, isolation_level=None)
+        _conn.row_factory = sqlite3.Row
+        _conn.execute("PRAGMA journal_mode=WAL")
+        # FULL: cada entrega confirmada al alumno ya está en disco
+        _conn.execute("PRAGMA synchronous=FULL")
+        _conn.execute(SCHEMA)
+    return _conn
+
+
+def _row_to_entrega(row: sqlite3.Row) -> Dict[str, Any]:
+    return {
+        "id_evaluacion": row["id_evaluacion"],
+        "id_alumno": row["id_alumno"],
+        "nota": row["nota"],
+        "codigo": row["codigo"],
+        "detalles": json.loads(row["detalles"]) if row["detalles"] is not None else None,
+        "pendiente": True,
+    }
+
+
+def _append(id_evaluacion: int, id_alumno: int, nota: int, codigo: Optional[str], detalles: Optional[str]):
+    # Una entrega nueva del mismo alumno reemplaza a la pendiente anterior
+    _open().execute(
+        """
+        INSERT OR REPLACE INTO entrega_pendiente (id_evaluacion, id_alumno, nota, codigo, detalles, recibida)
+        VALUES (?, ?, ?, ?, ?, ?)
+        """,
+        (id_evaluacion, id_alumno, nota, codigo, detalles, time.time())
+    )
+
+
+def _get(id_alumno: int, id_evaluacion: int) -> Optional[Dict[str, Any]]:
+    row = _open().execute(
+        "SELECT * FROM entrega_pendiente WHERE id_alumno = ? AND id_evaluacion = ?",
+        (id_alumno, id_evaluacion)
+    ).fetchone()
+    return _row_to_entrega(row) if row else None
+
+
+def _get_by_alumno(id_alumno: int) -> List[Dict[str, Any]]:
+    rows = _open().execute(
+        "SELECT * FROM entrega_pendiente WHERE id_alumno = ?", (id_alumno,)
+    ).fetchall()
+    return [_row_to_entrega(row) for row in rows]
+
+
+def _take(limit: int) -> List[sqlite3.Row]:
+    return _open().execute(
+        "SELECT * FROM entrega_pendiente WHERE proximo_intento <= ? ORDER BY seq LIMIT ?",
+        (time.time(), limit)
+    ).fetchall()
+
+
+def _delete(seqs: List[int]):
+    # Si la entrega se reemplazó mientras se escribía, su seq cambió y
+    # la versión nueva sigue pendiente
+    _open().executemany("DELETE FROM entrega_pendiente WHERE seq = ?", [(seq,) for seq in seqs])
+
+
+def _fail(seqs: List[int], error: str):
+    conn = _open()
+    for seq in seqs:
+        conn.execute(
+            """
+            UPDATE entrega_pendiente
+            SET intentos = intentos + 1,
+                proximo_intento = ? + min(?, 1 << min(intentos, 16)),
+                ultimo_error = ?
+            WHERE seq = ?
+            """,
+            (time.time(), MAX_BACKOFF, error, seq)
+        )
+
+
+def _count() -> Dict[str, Any]:
+    row = _open().execute(
+        "SELECT count(*) AS pendientes, sum(intentos > 0) AS con_error, min(recibida) AS mas_antigua FROM entrega_pendiente"
+    ).fetchone()
+    return {
+        "pendientes": row["pendientes"],
+        "con_error": row["con_error"] or 0,
+        "antiguedad_segundos": round(time.time() - row["mas_antigua"], 2) if row["mas_antigua"] else 0.0,
+    }
+
+
+async def _run(fn, *args):
+    return await asyncio.get_running_loop().run_in_executor(_executor, fn, *args)
+
+
+# API usada por las rutas y por functions/evaluaciones.py
+
+async def submit_entrega(entrega) -> List[Dict[str, Any]]:
+    """
+    Registra la entrega. Con la cola activa la confirma apenas queda
+    guardada en disco; si no, la escribe directamente en la base.
+    Retorna lista vacía si el alumno no está registrado.
+    """
+    from functions.evaluaciones import create_or_update_entrega_evaluacion
+    from functions.lti import get_user_id_by_lms_id
+
+    if not WRITE_BEHIND_ENABLED:
+        return await create_or_update_entrega_evaluacion(entrega)
+
+    user = await get_user_id_by_lms_id(entrega.id_alumno)
+    if not user:
+        return []
+
+    detalles = json.dumps(entrega.detalles) if entrega.detalles is not None else None
+    await _run(_append, entrega.id_evaluacion, user["id"], entrega.nota, entrega.codigo, detalles)
+    _stats["encoladas"] += 1
+    if _wakeup is not None:
+        _wakeup.set()
+
+    return [{
+        "id_evaluacion": entrega.id_evaluacion,
+        "id_alumno": user["id"],
+        "nota": entrega.nota,
+        "codigo": entrega.codigo,
+        "detalles": entrega.detalles,
+        "pendiente": True,
+    }]
+
+
+async def get_pending_entrega(id_alumno: int, id_evaluacion: int) -> Optional[Dict[str, Any]]:
+    if not WRITE_BEHIND_ENABLED:
+        return None
+    return await _run(_get, id_alumno, id_evaluacion)
+
+
+async def get_pending_entregas_by_alumno(id_alumno: int) -> List[Dict[str, Any]]:
+    if not WRITE_BEHIND_ENABLED:
+        return []
+    return await _run(_get_by_alumno, id_alumno)
+
+
+async def flush_pending() -> int:
+    """
+    Escribe un lote de entregas pendientes. Retorna cuántas se escribieron.
+    """
+    from functions.db import executemany
+
+    rows = await _run(_take, WRITE_BEHIND_BATCH_SIZE)
+    if not rows:
+        return 0
+
+    seqs = [row["seq"] for row in rows]
+    args = []
+    for row in rows:
+        contenidos = Contenidos()
+        codigo_hash = contenidos.add(row["codigo"])
+        detalles_hash = contenidos.add(json.loads(row["detalles"]) if row["detalles"] is not None else None, is_json=True)
+        args.append((row["id_evaluacion"], row["id_alumno"], row["nota"], codigo_hash, detalles_hash, *contenidos.args()))
+    try:
+        await executemany(UPSERT_ENTREGA_BY_ID, args)
+    except Exception as e:
+        _stats["errores"] += 1
+        await _run(_fail, seqs, str(e))
+        print(f"Error al escribir entregas pendientes: {str(e)}")
+        return 0
+
+    await _run(_delete, seqs)
+    _stats["escritas"] += len(rows)
+    _stats["lotes"] += 1
+    return len(rows)
+
+
+async def _flush_loop():
+    while True:
+        try:
+            await asyncio.wait_for(_wakeup.wait(), timeout=WRITE_BEHIND_INTERVAL)
+        except asyncio.TimeoutError:
+            pass
+        _wakeup.clear()
+        try:
+            # Si el lote salió lleno se sigue vaciando sin esperar
+            while await flush_pending() == WRITE_BEHIND_BATCH_SIZE:
+                pass
+        except Exception as e:
+            print(f"Error en la cola de entregas pendientes: {str(e)}")
+
+
+async def start_write_behind():
+    global _task, _wakeup
+    if not WRITE_BEHIND_ENABLED or _task is not None:
+        return
+    await _run(_open)
+    _wakeup = asyncio.Event()
+    # Las entregas que quedaron pendientes de una ejecución anterior se
+    # escriben en la primera vuelta
+    _task = asyncio.create_task(_flush_loop())
+
+
+async def stop_write_behind():
+    global _task
+    if _task is None:
+        return
+    _task.cancel()
+    try:
+        await _task
+    except asyncio.CancelledError:
+        pass
+    _task = None
+    # Último intento de vaciar la cola; lo que falle queda en disco
+    while await flush_pending() == WRITE_BEHIND_BATCH_SIZE:
+        pass
+
+
+async def get_write_behind_stats() -> Dict[str, Any]:
+    if not WRITE_BEHIND_ENABLED:
+        return {"activa": False}
+    return {"activa": True, **_stats, **(await _run(_count))}
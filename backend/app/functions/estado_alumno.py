@@ -0,0 +1,49 @@
+from typing import Any, Dict, List
+
+from fastapi import HTTPException
+
+from functions.db import fetch
+
+# Actividades del curso con la nota del alumno en cada evaluación, en una
+# sola consulta sobre el resumen estado_entrega (backend/sql/004_estado_entregas.sql).
+# Las tareas no tienen entregas registradas
+ESTADO_ALUMNO = """
+SELECT 'evaluacion' AS tipo, evaluacion.id, evaluacion.titulo, evaluacion.fecha_limite,
+       estado.id_evaluacion IS NOT NULL AS entregada, estado.nota
+FROM evaluacion
+LEFT JOIN estado_entrega estado
+    ON estado.id_evaluacion = evaluacion.id AND estado.id_alumno = $2
+WHERE evaluacion.id_curso = $1
+UNION ALL
+SELECT 'tarea', tarea.id, tarea.titulo, tarea.fecha_limite, false, NULL
+FROM tarea
+WHERE tarea.id_curso = $1
+ORDER BY tipo, id
+"""
+
+
+async def get_estado_alumno(course_id_lms: str, user_id_lms: str) -> List[Dict[str, Any]]:
+    """
+    Estado del alumno en todas las actividades del curso: id, título,
+    fecha límite, si entregó y con qué nota.
+    """
+    from functions.lti import get_course_id_by_lms_id, get_user_id_by_lms_id
+    from functions.entregas_pendientes import get_pending_entregas_by_alumno
+
+    course = await get_course_id_by_lms_id(course_id_lms)
+    if not course:
+        raise HTTPException(status_code=404, detail="Curso no encontrado")
+    user = await get_user_id_by_lms_id(user_id_lms)
+    if not user:
+        raise HTTPException(status_code=404, detail="Alumno no encontrado")
+
+    rows = await fetch(ESTADO_ALUMNO, course["id"], user["id"])
+
+    # Las entregas que siguen en la cola local aún no llegan al resumen
+    pending = {entrega["id_evaluacion"]: entrega for entrega in await get_pending_entregas_by_alumno(user["id"])}
+    if pending:
+        for row in rows:
+            if row["tipo"] == "evaluacion" and row["id"] in pending:
+                row["entregada"] = True
+                row["nota"] = pending[row["id"]]["nota"]
+    return rows
@@ -1,125 +1,149 @@
-from functions.supabase import supabaseClient
+from typing import Optional
 
+from functions.db import fetch, fetchrow, executemany
+from functions.cache import TTLCache, MISSING, content_hash
+from functions.contenido import Contenidos, contenidos_cte, resolve_contenidos
+from functions.listados import bump_course_version
+from settings import TEST_CACHE_SIZE, TEST_CACHE_TTL
 
-def get_evaluaciones_by_course_lms_id(course_id_lms: str):
-    from functions.lti import get_course_id_by_lms_id
-    course_id = get_course_id_by_lms_id(course_id_lms).get("id")
-    response = (
-        supabaseClient.table("evaluacion")
-        .select("id, titulo, fecha_limite")
-        .eq("id_curso", course_id)
-        .execute()
-    )
-    return response.data
-
-def get_evaluacion_by_id(evaluacion_id: int):
-    response = (
-        supabaseClient.table("evaluacion")
-        .select("id, titulo, fecha_limite, contenido, test")
-        .eq("id", evaluacion_id)
-        .execute()
-    )
-    return response.data[0]
-
-def get_evaluacion_test(evaluacion_id: int):
-    response = (
-        supabaseClient.table("evaluacion")
-        .select("test")
-        .eq("id", evaluacion_id)
-        .execute()
-    )
-    if response.data:
-        return response.data[0]
+# Cache de tests por id de evaluacion. Se invalida al actualizar o eliminar
+_test_cache = TTLCache("evaluacion_test", TEST_CACHE_SIZE, TEST_CACHE_TTL)
+
+# Consultas frecuentes (ver functions/db.py)
+# Página de actividades del curso por cursor (id); LIMIT NULL trae todas
+EVALUACIONES_BY_COURSE = """
+SELECT id, titulo, fecha_limite FROM evaluacion
+WHERE id_curso = $1 AND id > $2
+ORDER BY id
+LIMIT $3
+"""
+EVALUACION_BY_ID = "SELECT id, titulo, fecha_limite, contenido, test FROM evaluacion WHERE id = $1"
+EVALUACION_TEST_BY_ID = "SELECT test FROM evaluacion WHERE id = $1"
+ENTREGA_BY_ALUMNO = "SELECT * FROM entrega_evaluacion WHERE id_alumno = $1 AND id_evaluacion = $2"
+
+
+async def get_evaluaciones_by_course(course_id: int, after: Optional[int] = None, limit: Optional[int] = None):
+    return await fetch(EVALUACIONES_BY_COURSE, course_id, after or 0, limit)
+
+async def get_evaluacion_by_id(evaluacion_id: int):
+    return await fetchrow(EVALUACION_BY_ID, evaluacion_id)
+
+async def get_evaluacion_test(evaluacion_id: int):
+    cached = _test_cache.get(evaluacion_id)
+    if cached is not MISSING:
+        return cached
+
+    row = await fetchrow(EVALUACION_TEST_BY_ID, evaluacion_id)
+    if row:
+        test = row.get("test")
+        data = {"test": test, "hash": content_hash(test) if test else None}
+        _test_cache.set(evaluacion_id, data)
+        return data
     else:
         return None
-    
+
 # Metodos Post
 from models.evaluacion import Evaluacion, EvaluacionUpdate
+from functions.test_suites import analyze_test
 
-def create_evaluacion(evaluacion: Evaluacion):
-    response = (
-        supabaseClient.table("evaluacion")
-        .insert({"id_curso": evaluacion.id_curso,
-                 "titulo": evaluacion.titulo,
-                 "contenido": evaluacion.contenido,
-                 "fecha_limite": evaluacion.fecha_limite,
-                 "test": evaluacion.test})
-        .execute()
+async def create_evaluacion(evaluacion: Evaluacion):
+    # Validar el test antes de guardarlo (lanza TestSuiteError)
+    if evaluacion.test:
+        analyze_test(evaluacion.test)
+    response = await fetch(
+        """
+        INSERT INTO evaluacion (id_curso, titulo, contenido, fecha_limite, test)
+        VALUES ($1, $2, $3, $4::text::timestamptz, $5)
+        RETURNING *
+        """,
+        evaluacion.id_curso, evaluacion.titulo, evaluacion.contenido,
+        evaluacion.fecha_limite, evaluacion.test
     )
-    return response.data
-
-def update_evaluacion(evaluacion_id: int, evaluacion: EvaluacionUpdate):
-    response = (
-        supabaseClient.table("evaluacion")
-        .update({"titulo": evaluacion.titulo,
-                 "contenido": evaluacion.contenido,
-                 "test": evaluacion.test})
-        .eq("id", evaluacion_id)
-        .execute()
+    bump_course_version("evaluacion", evaluacion.id_curso)
+    return response
+
+async def update_evaluacion(evaluacion_id: int, evaluacion: EvaluacionUpdate):
+    # Validar el test antes de guardarlo (lanza TestSuiteError)
+    if evaluacion.test:
+        analyze_test(evaluacion.test)
+    response = await fetch(
+        """
+        UPDATE evaluacion SET titulo = $2, contenido = $3, test = $4
+        WHERE id = $1
+        RETURNING *
+        """,
+        evaluacion_id, evaluacion.titulo, evaluacion.contenido, evaluacion.test
     )
-    return response.data
+    _test_cache.delete(evaluacion_id)
+    for row in response:
+        bump_course_version("evaluacion", row["id_curso"])
+    return response
 
 
-def delete_evaluacion(evaluacion_id: int):
-    response = (
-        supabaseClient.table("evaluacion")
-        .delete()
-        .eq("id", evaluacion_id)
-        .execute()
-    )
-    return response.data
+async def delete_evaluacion(evaluacion_id: int):
+    response = await fetch("DELETE FROM evaluacion WHERE id = $1 RETURNING *", evaluacion_id)
+    _test_cache.delete(evaluacion_id)
+    for row in response:
+        bump_course_version("evaluacion", row["id_curso"])
+    return response
 
 from models.evaluacion import EntregaEvaluacion
 
-def create_entrega_evaluacion(entrega_data: EntregaEvaluacion):
+async def get_entrega_evaluacion(user_id_lms: str, evaluacion_id: int):
     from functions.lti import get_user_id_by_lms_id
-    user = get_user_id_by_lms_id(entrega_data.id_alumno)
+    from functions.entregas_pendientes import get_pending_entrega
+    user = await get_user_id_by_lms_id(user_id_lms)
     user_id = user.get("id")
-    response = (
-        supabaseClient.table("entrega_evaluacion")
-        .insert({"id_evaluacion": entrega_data.id_evaluacion,
-                 "id_alumno": user_id,
-                 "nota": entrega_data.nota,
-                 "codigo": entrega_data.codigo,
-                 "detalles": entrega_data.detalles})
-        .execute()
-    )
-    return response.data
+    # Una entrega aún en la cola es más reciente que la guardada en la base
+    pending = await get_pending_entrega(user_id, evaluacion_id)
+    if pending:
+        return pending
+    row = await fetchrow(ENTREGA_BY_ALUMNO, user_id, evaluacion_id)
+    if row:
+        await resolve_contenidos([row])
+    return row
 
-def update_entrega_evaluacion(entrega_data: EntregaEvaluacion):
-    from functions.lti import get_user_id_by_lms_id
-    user = get_user_id_by_lms_id(entrega_data.id_alumno)
-    user_id = user.get("id")
-    response = (
-        supabaseClient.table("entrega_evaluacion")
-        .update({"nota": entrega_data.nota,
-                 "codigo": entrega_data.codigo,
-                 "detalles": entrega_data.detalles})
-        .eq("id_alumno", user_id)
-        .eq("id_evaluacion", entrega_data.id_evaluacion)
-        .execute()
-    )
-    return response.data
+# Crea o reemplaza la entrega del alumno en un solo viaje a la base,
+# resolviendo el id interno del alumno y guardando el código y los
+# detalles comprimidos (functions/contenido.py) en la misma consulta.
+# Requiere backend/sql/002_entrega_evaluacion_unica.sql y 003_contenido_entregas.sql
+UPSERT_ENTREGA = contenidos_cte(6) + """
+INSERT INTO entrega_evaluacion (id_evaluacion, id_alumno, nota, codigo_hash, detalles_hash)
+SELECT $1, usuario.id, $3, $4, $5 FROM usuario WHERE usuario.id_lms = $2
+ON CONFLICT (id_alumno, id_evaluacion) DO UPDATE
+SET nota = EXCLUDED.nota, codigo_hash = EXCLUDED.codigo_hash, detalles_hash = EXCLUDED.detalles_hash,
+    codigo = NULL, detalles = NULL
+RETURNING *
+"""
+ENTREGAS_BY_EVALUACION = """
+SELECT id, id_evaluacion, id_alumno, codigo, codigo_hash, detalles, detalles_hash
+FROM entrega_evaluacion WHERE id_evaluacion = $1
+"""
+UPDATE_NOTA_ENTREGA = contenidos_cte(4) + """
+UPDATE entrega_evaluacion SET nota = $2, detalles_hash = $3, detalles = NULL WHERE id = $1
+"""
 
-def get_entrega_evaluacion(user_id_lms: str, evaluacion_id: int):
-    from functions.lti import get_user_id_by_lms_id
-    user = get_user_id_by_lms_id(user_id_lms)
-    user_id = user.get("id")
-    response = (
-        supabaseClient.table("entrega_evaluacion")
-        .select("*")
-        .eq("id_alumno", user_id)
-        .eq("id_evaluacion", evaluacion_id)
-        .execute()
+async def create_or_update_entrega_evaluacion(entrega_data: EntregaEvaluacion):
+    contenidos = Contenidos()
+    codigo_hash = contenidos.add(entrega_data.codigo)
+    detalles_hash = contenidos.add(entrega_data.detalles, is_json=True)
+    # Lista vacía si el alumno no está registrado
+    response = await fetch(
+        UPSERT_ENTREGA,
+        entrega_data.id_evaluacion, entrega_data.id_alumno, entrega_data.nota,
+        codigo_hash, detalles_hash, *contenidos.args()
     )
-    if response.data:
-        return response.data[0]
-    else:
-        return None
+    return await resolve_contenidos(response)
 
-def create_or_update_entrega_evaluacion(entrega_data: EntregaEvaluacion):
-    existing_entrega = get_entrega_evaluacion(entrega_data.id_alumno, entrega_data.id_evaluacion)
-    if existing_entrega:
-        return update_entrega_evaluacion(entrega_data)
-    else:
-        return create_entrega_evaluacion(entrega_data)
\ No newline at end of file
+async def get_entregas_by_evaluacion(evaluacion_id: int):
+    return await resolve_contenidos(await fetch(ENTREGAS_BY_EVALUACION, evaluacion_id))
+
+async def update_notas_entregas(entregas: list):
+    # Cada fila trae id, id_evaluacion, id_alumno, nota y detalles
+    args = []
+    for entrega in entregas:
+        contenidos = Contenidos()
+        detalles_hash = contenidos.add(entrega["detalles"], is_json=True)
+        args.append((entrega["id"], entrega["nota"], detalles_hash, *contenidos.args()))
+    await executemany(UPDATE_NOTA_ENTREGA, args)
+    return entregas
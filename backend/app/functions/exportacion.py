@@ -0,0 +1,117 @@
+import csv
+import io
+import json
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+from fastapi import HTTPException
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import StreamingResponse
+
+from functions.contenido import resolve_contenidos
+from functions.db import fetch
+from settings import EXPORT_PAGE_SIZE
+
+BASE_COLUMNS = ["id", "id_evaluacion", "evaluacion", "id_alumno", "alumno_id_lms", "alumno", "nota"]
+
+# Entregas por cursor (id de la entrega) filtradas por curso o evaluación.
+# Las columnas opcionales se agregan en EXPORT_COLUMNS
+EXPORT_QUERY = """
+SELECT
+    entrega.id, entrega.id_evaluacion, evaluacion.titulo AS evaluacion,
+    entrega.id_alumno, usuario.id_lms AS alumno_id_lms, usuario.nombre AS alumno,
+    entrega.nota{columnas}
+FROM entrega_evaluacion entrega
+JOIN evaluacion ON evaluacion.id = entrega.id_evaluacion
+JOIN usuario ON usuario.id = entrega.id_alumno
+WHERE {filtro} = $1 AND entrega.id > $2
+ORDER BY entrega.id
+LIMIT $3
+"""
+
+
+def _columns(include_codigo: bool, include_detalles: bool) -> List[str]:
+    columns = list(BASE_COLUMNS)
+    if include_codigo:
+        columns.append("codigo")
+    if include_detalles:
+        columns.append("detalles")
+    return columns
+
+
+async def _iter_entregas(filter_column: str, filter_value: int, columns: List[str]) -> AsyncIterator[Dict[str, Any]]:
+    # El código y los detalles se leen por hash, una vez por página
+    extra = "".join(f", entrega.{column}, entrega.{column}_hash" for column in columns[len(BASE_COLUMNS):])
+    query = EXPORT_QUERY.format(columnas=extra, filtro=filter_column)
+
+    # Una página por consulta: cada lectura toma y devuelve una conexión
+    # del pool y en memoria nunca hay más de EXPORT_PAGE_SIZE filas
+    after = 0
+    while True:
+        rows = await fetch(query, filter_value, after, EXPORT_PAGE_SIZE)
+        await resolve_contenidos(rows)
+        for row in rows:
+            yield row
+        if len(rows) < EXPORT_PAGE_SIZE:
+            break
+        after = rows[-1]["id"]
+
+
+async def _ndjson_lines(rows: AsyncIterator[Dict[str, Any]]) -> AsyncIterator[str]:
+    async for row in rows:
+        yield json.dumps(jsonable_encoder(row), ensure_ascii=False) + "\n"
+
+
+async def _csv_lines(rows: AsyncIterator[Dict[str, Any]], columns: List[str]) -> AsyncIterator[str]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    def line(values) -> str:
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerow(values)
+        return buffer.getvalue()
+
+    yield line(columns)
+    async for row in rows:
+        values = [row[column] for column in columns]
+        if "detalles" in row:
+            values[columns.index("detalles")] = json.dumps(row["detalles"], ensure_ascii=False) if row["detalles"] is not None else ""
+        yield line(values)
+
+
+async def export_entregas(
+        course_id_lms: Optional[str] = None,
+        evaluacion_id: Optional[int] = None,
+        formato: str = "ndjson",
+        include_codigo: bool = False,
+        include_detalles: bool = False,
+) -> StreamingResponse:
+    """
+    Exporta en streaming (NDJSON o CSV) las entregas de un curso o de una
+    evaluación. `codigo` y `detalles` solo se incluyen si se piden.
+    """
+    if evaluacion_id is not None:
+        filter_column, filter_value = "entrega.id_evaluacion", evaluacion_id
+        name = f"entregas_evaluacion_{evaluacion_id}"
+    elif course_id_lms:
+        from functions.lti import get_course_id_by_lms_id
+        course = await get_course_id_by_lms_id(course_id_lms)
+        if not course:
+            raise HTTPException(status_code=404, detail="Curso no encontrado")
+        filter_column, filter_value = "evaluacion.id_curso", course["id"]
+        name = f"entregas_curso_{course['id']}"
+    else:
+        raise HTTPException(status_code=422, detail="Debe indicar el curso o la evaluación")
+
+    columns = _columns(include_codigo, include_detalles)
+    rows = _iter_entregas(filter_column, filter_value, columns)
+    if formato == "csv":
+        content, media_type, extension = _csv_lines(rows, columns), "text/csv", "csv"
+    else:
+        content, media_type, extension = _ndjson_lines(rows), "application/x-ndjson", "ndjson"
+
+    return StreamingResponse(
+        content,
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{name}.{extension}"'},
+    )
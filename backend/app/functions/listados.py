@@ -0,0 +1,92 @@
+import itertools
+import uuid
+from typing import Optional
+
+from fastapi import HTTPException, Request
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, Response
+
+from functions.cache import TTLCache, MISSING
+from settings import LISTING_CACHE_SIZE, LISTING_CACHE_TTL
+
+# Versión de los listados de cada curso, por tipo de actividad. Crear,
+# actualizar o eliminar una actividad le asigna una versión nueva; las
+# versiones expiran a los LISTING_CACHE_TTL segundos para acotar cuánto
+# puede tardar en verse un cambio hecho en otra instancia.
+_versions = TTLCache("listado_versiones", LISTING_CACHE_SIZE, LISTING_CACHE_TTL)
+_responses = TTLCache("listados", LISTING_CACHE_SIZE, LISTING_CACHE_TTL)
+
+# El prefijo del proceso evita que un ETag emitido antes de un reinicio
+# coincida con una versión nueva
+_epoch = uuid.uuid4().hex[:8]
+_counter = itertools.count(1)
+
+
+def _get_version(kind: str, course_id: int) -> int:
+    version = _versions.get((kind, course_id))
+    if version is MISSING:
+        version = next(_counter)
+        _versions.set((kind, course_id), version)
+    return version
+
+
+def bump_course_version(kind: str, course_id: Optional[int]):
+    """
+    Invalida los listados de `kind` ("evaluacion" o "tarea") del curso.
+    """
+    if course_id is not None:
+        _versions.set((kind, course_id), next(_counter))
+
+
+async def _fetch_listing(kind: str, course_id: int, after: Optional[int], limit: Optional[int]):
+    if kind == "evaluacion":
+        from functions.evaluaciones import get_evaluaciones_by_course
+        return await get_evaluaciones_by_course(course_id, after, limit)
+    from functions.tareas import get_tareas_by_course
+    return await get_tareas_by_course(course_id, after, limit)
+
+
+def _etag_matches(request: Request, etag: str) -> bool:
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    tags = [tag.strip() for tag in header.split(",")]
+    return "*" in tags or etag in tags or etag.removeprefix("W/") in tags
+
+
+async def listing_response(
+        request: Request,
+        kind: str,
+        course_id_lms: str,
+        after: Optional[int] = None,
+        limit: Optional[int] = None,
+) -> Response:
+    """
+    Listado de actividades del curso ordenado por id. Con `limit` se
+    pagina por cursor: la página siguiente se pide con `after` igual al
+    header X-Next-Cursor. Responde 304 si el ETag enviado sigue vigente.
+    """
+    from functions.lti import get_course_id_by_lms_id
+    course = await get_course_id_by_lms_id(course_id_lms)
+    if not course:
+        raise HTTPException(status_code=404, detail="Curso no encontrado")
+    course_id = course["id"]
+
+    version = _get_version(kind, course_id)
+    etag = f'W/"{_epoch}.{version}.{after or 0}.{limit or 0}"'
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if _etag_matches(request, etag):
+        return Response(status_code=304, headers=headers)
+
+    key = (kind, course_id, version, after, limit)
+    cached = _responses.get(key)
+    if cached is MISSING:
+        rows = await _fetch_listing(kind, course_id, after, limit)
+        next_cursor = rows[-1]["id"] if limit and len(rows) == limit else None
+        cached = (JSONResponse(jsonable_encoder(rows)).body, next_cursor)
+        _responses.set(key, cached)
+
+    body, next_cursor = cached
+    if next_cursor is not None:
+        headers["X-Next-Cursor"] = str(next_cursor)
+    return Response(content=body, media_type="application/json", headers=headers)
@@ -1,151 +1,137 @@
-from functions.supabase import supabaseClient
+from functions.db import fetchrow
+from functions.cache import TTLCache, MISSING
+from settings import (
+    LTI_LAUNCH_CACHE_SIZE,
+    LTI_LAUNCH_CACHE_TTL,
+    IDENTITY_CACHE_SIZE,
+    IDENTITY_CACHE_TTL,
+    IDENTITY_NEGATIVE_TTL,
+)
+
+# Lanzamientos ya registrados (guid de plataforma, curso, usuario): los
+# siguientes lanzamientos de la misma combinación no consultan la base
+_known_launches = TTLCache("lti_lanzamientos", LTI_LAUNCH_CACHE_SIZE, LTI_LAUNCH_CACHE_TTL)
+
+# Mapa id_lms -> id interno de usuarios y cursos. Una vez creada, la
+# relación no cambia; los ids que no existen se recuerdan por menos tiempo
+# para no ocultar un registro recién hecho en otra instancia
+_user_ids = TTLCache("usuario_ids", IDENTITY_CACHE_SIZE, IDENTITY_CACHE_TTL)
+_course_ids = TTLCache("curso_ids", IDENTITY_CACHE_SIZE, IDENTITY_CACHE_TTL)
+
+# Consultas frecuentes (ver functions/db.py)
+USER_BY_LMS_ID = "SELECT id FROM usuario WHERE id_lms = $1"
+COURSE_BY_LMS_ID = "SELECT id FROM curso WHERE id_curso_lms = $1"
 
 # Funciones get
 
-def get_platform_id_by_guid(platform_guid: str):
-    response = ( supabaseClient.table("plataforma")
-    .select("id")
-    .eq("guid", platform_guid)
-    .execute()
-    )
-    return response.data[0] if response.data else None
-
-def get_user_id_by_lms_id(user_id_lms: str):
-    response = ( supabaseClient.table("usuario")
-    .select("id")
-    .eq("id_lms", user_id_lms)
-    .execute()
-    )
-    return response.data[0] if response.data else None
-
-def get_course_id_by_lms_id(course_id_lms: str):
-    response = ( supabaseClient.table("curso")
-    .select("id")
-    .eq("id_curso_lms", course_id_lms)
-    .execute()
-    )
-    return response.data[0] if response.data else None
-
-def get_user_in_course(user_id: int, course_id: int):
-    response = ( supabaseClient.table("curso_usuario")
-    .select("*")
-    .eq("id_usuario", user_id)
-    .eq("id_curso", course_id)
-    .execute()
-    )
-    return response.data[0] if response.data else None
+async def _get_identity(cache: TTLCache, query: str, id_lms: str):
+    cached = cache.get(id_lms)
+    if cached is not MISSING:
+        return cached
+
+    row = await fetchrow(query, id_lms)
+    cache.set(id_lms, row, None if row else IDENTITY_NEGATIVE_TTL)
+    return row
+
+async def get_user_id_by_lms_id(user_id_lms: str):
+    return await _get_identity(_user_ids, USER_BY_LMS_ID, user_id_lms)
+
+async def get_course_id_by_lms_id(course_id_lms: str):
+    return await _get_identity(_course_ids, COURSE_BY_LMS_ID, course_id_lms)
 
 # Funciones post
 
 from models.lti import Plataforma, Usuario, Curso
 
-def register_platform(plataforma: Plataforma):
-    response = ( supabaseClient.table("plataforma")
-    .insert({"guid": plataforma.guid,
-             "nombre": plataforma.nombre,
-             "version": plataforma.version,
-             "family_code": plataforma.family_code})
-    .execute()
-    )
-    return response.data
-
-def register_user(usuario: Usuario):
-    response = ( supabaseClient.table("usuario")
-    .insert({"id_lms": usuario.id_lms,
-             "nombre": usuario.nombre})
-    .execute()
-    )
-    return response.data
-
-def register_course(curso: Curso):
-    response = ( supabaseClient.table("curso")
-    .insert({"nombre": curso.nombre,
-             "etiqueta": curso.etiqueta,
-             "id_curso_lms": curso.id_curso_lms,
-             "id_plataforma": curso.id_plataforma})
-    .execute()
-    )
-    return response.data
-
-def enroll_user_in_course(user_id: int, course_id: int):
-    response = ( supabaseClient.table("curso_usuario")
-    .insert({"id_usuario": user_id,
-             "id_curso": course_id})
-    .execute()
-    )
-    return response.data
+# Registra (o lee, si ya existen) plataforma, curso, usuario e inscripción
+# en una sola consulta. "DO UPDATE" sin cambios hace que RETURNING siempre
+# entregue la fila, también cuando otro lanzamiento la insertó en paralelo;
+# xmax = 0 solo en las filas recién insertadas. Requiere las claves únicas
+# de backend/sql/001_lti_claves_unicas.sql
+REGISTER_LAUNCH = """
+WITH plataforma_row AS (
+    INSERT INTO plataforma (guid, nombre, version, family_code)
+    VALUES ($1, $2, $3, $4)
+    ON CONFLICT (guid) DO UPDATE SET guid = EXCLUDED.guid
+    RETURNING id, xmax = 0 AS registrado
+), curso_row AS (
+    INSERT INTO curso (nombre, etiqueta, id_curso_lms, id_plataforma)
+    SELECT $5, $6, $7, id FROM plataforma_row
+    ON CONFLICT (id_curso_lms) DO UPDATE SET id_curso_lms = EXCLUDED.id_curso_lms
+    RETURNING id, xmax = 0 AS registrado
+), usuario_row AS (
+    INSERT INTO usuario (id_lms, nombre)
+    VALUES ($8, $9)
+    ON CONFLICT (id_lms) DO UPDATE SET id_lms = EXCLUDED.id_lms
+    RETURNING id, xmax = 0 AS registrado
+), inscripcion_row AS (
+    INSERT INTO curso_usuario (id_usuario, id_curso)
+    SELECT usuario_row.id, curso_row.id FROM usuario_row, curso_row
+    ON CONFLICT (id_usuario, id_curso) DO UPDATE SET id_curso = EXCLUDED.id_curso
+    RETURNING id, xmax = 0 AS registrado
+)
+SELECT
+    plataforma_row.id AS id_plataforma, plataforma_row.registrado AS plataforma_registrada,
+    curso_row.id AS id_curso, curso_row.registrado AS curso_registrado,
+    usuario_row.id AS id_usuario, usuario_row.registrado AS usuario_registrado,
+    inscripcion_row.registrado AS inscripcion_registrada
+FROM plataforma_row, curso_row, usuario_row, inscripcion_row
+"""
 
 # Launch completo
 
-def register_lti_launch(
+async def register_lti_launch(
         usuario: Usuario,
         curso: Curso,
         plataforma: Plataforma,
 ):
-    platform_state = None
-    course_state = None
-    user_state = None
-    enrollment_state = None
+    key = (plataforma.guid, curso.id_curso_lms, usuario.id_lms)
+    if _known_launches.get(key) is not MISSING:
+        return _launch_response("existing", "existing", "existing", "existing")
 
     try:
-        # Verificar/Registrar Plataforma
-        platform = get_platform_id_by_guid(plataforma.guid)
-        if not platform:
-            platform_data = register_platform(plataforma)
-            platform = platform_data[0] if platform_data else None
-            platform_state = "registered"
-        else:
-            platform_state = "existing"
-        
-        platform_id = platform.get('id')
-        curso.id_plataforma = platform_id 
-        
-        # Verificar/Registrar Curso
-        course = get_course_id_by_lms_id(curso.id_curso_lms)
-        if not course:
-            print(f"Curso no encontrado. Registrando curso: {curso.nombre}")
-            course_data = register_course(curso)
-            course = course_data[0] if course_data else None
-            course_state = "registered"
-        else:
-            course_state = "existing"
-        
-        course_id = course.get('id')
-        
-        # Verificar/Registrar Usuario
-        user = get_user_id_by_lms_id(usuario.id_lms)
-        if not user:
-            print(f"Usuario no encontrado. Registrando usuario: {usuario.nombre}")
-            user_data = register_user(usuario)
-            user = user_data[0] if user_data else None
-            user_state = "registered"
-        else:
-            user_state = "existing"
-        
-        user_id = user.get('id')
-        
-        is_enrolled = get_user_in_course(user_id, course_id)
-        if not is_enrolled:
-            enrollment = enroll_user_in_course(user_id, course_id)
-            enrollment_state = "registered"
-        else:
-            enrollment_state = "existing"
-        
-        return {
-            "success": True,
-            "data": {
-                "plataforma": platform_state,
-                "curso": course_state,
-                "usuario": user_state,
-                "enrolacion": enrollment_state
-            },
-            "message": "Registro LTI completado exitosamente"
-        }
-        
+        row = await fetchrow(
+            REGISTER_LAUNCH,
+            plataforma.guid, plataforma.nombre, plataforma.version, plataforma.family_code,
+            curso.nombre, curso.etiqueta, curso.id_curso_lms,
+            usuario.id_lms, usuario.nombre
+        )
+        _known_launches.set(key, {
+            "plataforma": row["id_plataforma"],
+            "curso": row["id_curso"],
+            "usuario": row["id_usuario"],
+        })
+        _course_ids.set(curso.id_curso_lms, {"id": row["id_curso"]})
+        _user_ids.set(usuario.id_lms, {"id": row["id_usuario"]})
+
+        return _launch_response(
+            _state(row["plataforma_registrada"]),
+            _state(row["curso_registrado"]),
+            _state(row["usuario_registrado"]),
+            _state(row["inscripcion_registrada"]),
+        )
+
     except Exception as e:
         print(f"Error en register_lti_launch: {str(e)}")
         return {
             "success": False,
             "message": f"Error al procesar el registro LTI: {str(e)}",
             "data": None
-        }
\ No newline at end of file
+        }
+
+
+def _state(registered: bool) -> str:
+    return "registered" if registered else "existing"
+
+
+def _launch_response(platform_state: str, course_state: str, user_state: str, enrollment_state: str):
+    return {
+        "success": True,
+        "data": {
+            "plataforma": platform_state,
+            "curso": course_state,
+            "usuario": user_state,
+            "enrolacion": enrollment_state
+        },
+        "message": "Registro LTI completado exitosamente"
+    }
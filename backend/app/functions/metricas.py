@@ -0,0 +1,222 @@
+"""
+Métricas de la aplicación en el formato de texto de Prometheus (ver la
+ruta /metrics en main.py).
+
+Los contadores e histogramas se actualizan en el momento desde el
+middleware HTTP, el acceso a la base y los ejecutores. Los valores que ya
+llevan otros módulos (cola de admisión, pool de sandboxes, caches, pool
+de conexiones) se leen recién al exponer las métricas.
+"""
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+# Límites superiores (segundos) de los buckets de latencia
+HTTP_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+DB_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 5)
+EXECUTOR_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2, 5, 10, 20, 30, 60, 120)
+
+Labels = Tuple[Tuple[str, str], ...]
+
+_metrics: List["_Metric"] = []
+_collectors: List[Callable[[], Iterable[Tuple[str, str, str, Dict[str, str], float]]]] = []
+
+
+def _labels(labels: Dict[str, str]) -> Labels:
+    return tuple(sorted((name, str(value)) for name, value in labels.items()))
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labels: Labels, extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = list(labels) + ([extra] if extra else [])
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    type = ""
+
+    def __init__(self, name: str, help: str):
+        self.name = name
+        self.help = help
+        self._lock = threading.Lock()
+        _metrics.append(self)
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.type}", *self._samples()]
+
+    def _samples(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    type = "counter"
+
+    def __init__(self, name: str, help: str):
+        super().__init__(name, help)
+        self._values: Dict[Labels, float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = _labels(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            values = list(self._values.items())
+        return [f"{self.name}{_format_labels(labels)} {_format_value(value)}" for labels, value in values]
+
+
+class Histogram(_Metric):
+    type = "histogram"
+
+    def __init__(self, name: str, help: str, buckets: Tuple[float, ...]):
+        super().__init__(name, help)
+        self.buckets = tuple(buckets)
+        # Por cada combinación de etiquetas: cuentas por bucket, suma y total
+        self._values: Dict[Labels, Tuple[List[int], List[float]]] = {}
+
+    def observe(self, value: float, **labels):
+        key = _labels(labels)
+        with self._lock:
+            counts, totals = self._values.setdefault(key, ([0] * len(self.buckets), [0.0, 0]))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            totals[0] += value
+            totals[1] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            values = [(labels, list(counts), list(totals)) for labels, (counts, totals) in self._values.items()]
+        lines = []
+        for labels, counts, (total_sum, total_count) in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_format_labels(labels, ('le', _format_value(float(bound))))} {cumulative}")
+            lines.append(f"{self.name}_bucket{_format_labels(labels, ('le', '+Inf'))} {total_count}")
+            lines.append(f"{self.name}_sum{_format_labels(labels)} {_format_value(total_sum)}")
+            lines.append(f"{self.name}_count{_format_labels(labels)} {total_count}")
+        return lines
+
+
+def register_collector(collector: Callable[[], Iterable[Tuple[str, str, str, Dict[str, str], float]]]):
+    """
+    Registra una función que al exponer las métricas retorna muestras
+    (nombre, tipo, ayuda, etiquetas, valor) leídas de otro módulo.
+    """
+    _collectors.append(collector)
+
+
+def render_metrics() -> str:
+    lines = []
+    for metric in _metrics:
+        lines.extend(metric.render())
+
+    # Las muestras de los collectors se agrupan por nombre
+    grouped: Dict[str, Tuple[str, str, List[str]]] = {}
+    for collector in _collectors:
+        for name, metric_type, help, labels, value in collector():
+            entry = grouped.setdefault(name, (metric_type, help, []))
+            entry[2].append(f"{name}{_format_labels(_labels(labels))} {_format_value(value)}")
+    for name, (metric_type, help, samples) in grouped.items():
+        lines.extend([f"# HELP {name} {help}", f"# TYPE {name} {metric_type}", *samples])
+    return "\n".join(lines) + "\n"
+
+
+http_request_duration = Histogram(
+    "edurun_http_request_duration_seconds",
+    "Latencia de las solicitudes HTTP por ruta, método y código de estado",
+    HTTP_BUCKETS,
+)
+db_query_duration = Histogram(
+    "edurun_db_query_duration_seconds",
+    "Latencia de las consultas a Postgres por función que las hace",
+    DB_BUCKETS,
+)
+executor_duration = Histogram(
+    "edurun_executor_duration_seconds",
+    "Latencia de las ejecuciones por ejecutor (docker, lambda) y tipo (run, test, evaluacion, lote)",
+    EXECUTOR_BUCKETS,
+)
+executor_timeouts = Counter(
+    "edurun_executor_timeouts_total",
+    "Ejecuciones que excedieron el tiempo límite por ejecutor y tipo",
+)
+
+
+def _cache_samples():
+    from functions.cache import get_cache_stats
+    for name, stats in get_cache_stats().items():
+        labels = {"cache": name}
+        yield "edurun_cache_hits_total", "counter", "Aciertos por cache", labels, stats["hits"]
+        yield "edurun_cache_misses_total", "counter", "Fallos por cache", labels, stats["misses"]
+        yield "edurun_cache_hit_ratio", "gauge", "Proporción de aciertos por cache", labels, stats["hit_ratio"]
+        yield "edurun_cache_entries", "gauge", "Entradas en cada cache", labels, stats["size"]
+
+
+def _sandbox_samples():
+    from functions.sandbox_pool import get_sandbox_pool_stats
+    stats = get_sandbox_pool_stats()
+    admission = stats["admission"]
+    labels = {"executor": "docker"}
+    yield "edurun_executor_queue_depth", "gauge", "Ejecuciones esperando turno en la cola de admisión", labels, admission["waiting"]
+    yield "edurun_executor_in_flight", "gauge", "Ejecuciones en curso por ejecutor", labels, admission["in_flight"]
+    yield "edurun_executor_rejected_total", "counter", "Ejecuciones rechazadas por la cola de admisión", labels, admission["rejected"]
+    yield "edurun_sandbox_workers", "gauge", "Workers del pool de sandboxes por estado", {"estado": "ocupado"}, stats.get("busy", 0)
+    yield "edurun_sandbox_workers", "gauge", "Workers del pool de sandboxes por estado", {"estado": "libre"}, stats.get("idle", 0)
+
+
+def _db_samples():
+    from functions.db import get_db_pool_stats
+    stats = get_db_pool_stats()
+    yield "edurun_db_pool_connections", "gauge", "Conexiones del pool de Postgres por estado", {"estado": "abierta"}, stats.get("size", 0)
+    yield "edurun_db_pool_connections", "gauge", "Conexiones del pool de Postgres por estado", {"estado": "libre"}, stats.get("idle", 0)
+
+
+def _lambda_samples():
+    from functions.aws_lambda import get_lambda_client_stats
+    stats = get_lambda_client_stats()
+    yield "edurun_executor_in_flight", "gauge", "Ejecuciones en curso por ejecutor", {"executor": "lambda"}, stats["in_flight"]
+    for name in ("requests", "retries", "errors"):
+        yield f"edurun_lambda_{name}_total", "counter", f"Cliente HTTP de la Lambda: {name}", {}, stats[name]
+
+
+# Estado del circuito como número para poder graficarlo y alertar
+CIRCUIT_STATES = {"cerrado": 0, "semiabierto": 1, "abierto": 2}
+
+
+def _executor_router_samples():
+    from functions.ejecutores import get_executor_stats
+    stats = get_executor_stats()
+    yield "edurun_executor_fallbacks_total", "counter", "Solicitudes reintentadas en otro ejecutor", {}, stats["respaldos"]
+    for name, backend in stats["ejecutores"].items():
+        labels = {"executor": name}
+        yield "edurun_executor_circuit_state", "gauge", "Circuito por ejecutor (0 cerrado, 1 semiabierto, 2 abierto)", labels, CIRCUIT_STATES[backend["circuito"]]
+        yield "edurun_executor_error_rate", "gauge", "Tasa de error (EWMA) por ejecutor", labels, backend["tasa_error"]
+        yield "edurun_executor_failures_total", "counter", "Fallas de infraestructura por ejecutor", labels, backend["fallas"]
+
+
+for _collector in (_cache_samples, _sandbox_samples, _db_samples, _lambda_samples, _executor_router_samples):
+    register_collector(_collector)
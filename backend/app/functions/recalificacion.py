@@ -0,0 +1,130 @@
+import asyncio
+import time
+import uuid
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+from functions.cache import TTLCache, MISSING
+from settings import REGRADE_BATCH_SIZE, REGRADE_CONCURRENCY
+
+# Estado de las recalificaciones recientes, consultable por id de trabajo
+_jobs = TTLCache("recalificaciones", 100, 24 * 60 * 60)
+_tasks = set()
+
+
+def _public_status(job: Dict[str, Any]) -> Dict[str, Any]:
+    finished_at = job["fin"] or time.monotonic()
+    elapsed = finished_at - job["inicio"]
+    return {
+        "id": job["id"],
+        "evaluacion_id": job["evaluacion_id"],
+        "estado": job["estado"],
+        "total": job["total"],
+        "calificadas": job["calificadas"],
+        "fallidas": job["fallidas"],
+        "progreso": round((job["calificadas"] + job["fallidas"]) / job["total"] * 100, 1) if job["total"] else 0.0,
+        "duracion_segundos": round(elapsed, 2),
+        "entregas_por_segundo": round(job["calificadas"] / elapsed, 2) if elapsed > 0 else 0.0,
+        "errores": job["errores"][-10:],
+    }
+
+
+async def start_regrade(evaluacion_id: int) -> Dict[str, Any]:
+    """
+    Inicia en segundo plano la recalificación de todas las entregas de una
+    evaluación y retorna el estado inicial del trabajo.
+    """
+    job = {
+        "id": uuid.uuid4().hex,
+        "evaluacion_id": evaluacion_id,
+        "estado": "pendiente",
+        "total": 0,
+        "calificadas": 0,
+        "fallidas": 0,
+        "errores": [],
+        "inicio": time.monotonic(),
+        "fin": None,
+    }
+    _jobs.set(job["id"], job)
+
+    task = asyncio.create_task(_run_regrade(job))
+    _tasks.add(task)
+    task.add_done_callback(_tasks.discard)
+    return _public_status(job)
+
+
+def get_regrade_status(job_id: str) -> Optional[Dict[str, Any]]:
+    job = _jobs.get(job_id)
+    if job is MISSING:
+        return None
+    return _public_status(job)
+
+
+async def _run_regrade(job: Dict[str, Any]):
+    from functions.evaluaciones import get_evaluacion_test, get_entregas_by_evaluacion
+
+    try:
+        job["estado"] = "en_curso"
+        evaluacion_data = await get_evaluacion_test(job["evaluacion_id"])
+        if not evaluacion_data or not evaluacion_data.get("test"):
+            job["estado"] = "error"
+            job["errores"].append("No se encontró el test para la evaluación especificada")
+            return
+
+        entregas = await get_entregas_by_evaluacion(job["evaluacion_id"])
+        job["total"] = len(entregas)
+
+        semaphore = asyncio.Semaphore(REGRADE_CONCURRENCY)
+        batches = [entregas[i:i + REGRADE_BATCH_SIZE] for i in range(0, len(entregas), REGRADE_BATCH_SIZE)]
+        await asyncio.gather(*[
+            _grade_batch(job, batch, evaluacion_data["test"], semaphore)
+            for batch in batches
+        ])
+        job["estado"] = "completado"
+    except Exception as e:
+        job["estado"] = "error"
+        job["errores"].append(str(e))
+    finally:
+        job["fin"] = time.monotonic()
+
+
+async def _grade_batch(job: Dict[str, Any], batch: List[Dict[str, Any]], test: str, semaphore: asyncio.Semaphore):
+    from functions.ejecutores import get_executor_router
+    from functions.evaluaciones import update_notas_entregas
+
+    async with semaphore:
+        try:
+            items = [{"id": entrega["id"], "code": entrega.get("codigo") or ""} for entrega in batch]
+            results = {result["id"]: result for result in await get_executor_router().execute("evaluate_batch", items, test)}
+
+            fecha = datetime.now(timezone.utc).isoformat()
+            rows = []
+            for entrega in batch:
+                result = results.get(entrega["id"])
+                if result is None:
+                    continue
+                # Se conservan los detalles registrados por el frontend
+                detalles = dict(entrega.get("detalles") or {})
+                detalles["recalificacion"] = {
+                    "fecha": fecha,
+                    "salida": result["stdout"],
+                    "errores": result["stderr"],
+                    "return_code": result["return_code"],
+                    "resultado": result.get("resultado"),
+                    "recursos": result.get("recursos"),
+                }
+                rows.append({
+                    "id": entrega["id"],
+                    "id_evaluacion": entrega["id_evaluacion"],
+                    "id_alumno": entrega["id_alumno"],
+                    "nota": result["score"],
+                    "detalles": detalles,
+                })
+
+            if rows:
+                await update_notas_entregas(rows)
+            job["calificadas"] += len(rows)
+            job["fallidas"] += len(batch) - len(rows)
+        except Exception as e:
+            job["fallidas"] += len(batch)
+            job["errores"].append(str(e))
@@ -0,0 +1,40 @@
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from functions.cache import TTLCache, SingleFlight, MISSING, content_hash
+from settings import RESULT_CACHE_SIZE, RESULT_CACHE_TTL, RUNNER_VERSION, TEST_TIMEOUT
+
+# Resultados de ejecución indexados por hash(código, test, runner). Solo
+# se cachean ejecuciones deterministas (tests); /run-code/ es opcional
+_results = TTLCache("resultados", RESULT_CACHE_SIZE, RESULT_CACHE_TTL)
+_in_flight = SingleFlight()
+
+
+def result_key(kind: str, runner: str, code: str, test_hash: Optional[str] = None) -> str:
+    # El límite por test cambia el resultado de los tests que lo exceden
+    return content_hash(kind, runner, RUNNER_VERSION, str(TEST_TIMEOUT), code, test_hash)
+
+
+async def run_cached(
+        key: str,
+        run: Callable[[], Awaitable[Any]],
+        cacheable: Callable[[Any], bool] = lambda result: True,
+) -> Any:
+    """
+    Retorna el resultado cacheado para `key` o ejecuta `run` una sola vez
+    aunque lleguen varias solicitudes idénticas al mismo tiempo.
+    """
+    cached = _results.get(key)
+    if cached is not MISSING:
+        return cached
+
+    async def run_and_store():
+        result = await run()
+        if cacheable(result):
+            _results.set(key, result)
+        return result
+
+    return await _in_flight.do(key, run_and_store)
+
+
+def get_result_cache_stats() -> Dict[str, Any]:
+    return {**_results.stats(), "singleflight": _in_flight.stats()}
@@ -0,0 +1,496 @@
+import asyncio
+import json
+import os
+import queue
+import select
+import subprocess
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from typing import AsyncIterator, Callable, Optional
+
+from settings import (
+    SANDBOX_IMAGE,
+    SANDBOX_POOL_SIZE,
+    SANDBOX_MAX_JOBS,
+    SANDBOX_MEMORY,
+    SANDBOX_CPUS,
+    SANDBOX_MAX_CONCURRENCY,
+    SANDBOX_MAX_QUEUE,
+    SANDBOX_QUEUE_TIMEOUT,
+    SANDBOX_HEALTH_INTERVAL,
+    STREAM_BUFFER_EVENTS,
+)
+
+CONFIGS_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "configs"))
+
+# Tiempo extra que se espera la respuesta del worker por sobre el timeout
+# del trabajo (el worker mata al hijo y responde por su cuenta)
+RESPONSE_MARGIN = 5
+STARTUP_TIMEOUT = 60
+ACQUIRE_TIMEOUT = 60
+
+
+class SandboxError(Exception):
+    """Error de infraestructura del sandbox (no del código del alumno)."""
+
+
+class SandboxSaturatedError(SandboxError):
+    """La cola de admisión está llena o se agotó el tiempo de espera."""
+
+
+class SandboxWorker:
+    """
+    Contenedor de larga duración con el proceso padre de
+    configs/sandbox_worker.py. Se comunica por stdin/stdout con líneas JSON.
+    """
+    def __init__(self, image: str, memory: str, cpus: str):
+        self.name = f"edurun-sandbox-{uuid.uuid4().hex[:12]}"
+        self.jobs = 0
+        self.created_at = time.monotonic()
+
+        cmd = [
+            "docker", "run", "-i", "--rm",
+            "--name", self.name,
+            # El worker necesita root para ejecutar cada trabajo con otro
+            # usuario (ver configs/sandbox_worker.py); no-new-privileges
+            # impide que el alumno lo recupere con un binario setuid
+            "--user", "root",
+            "--security-opt", "no-new-privileges",
+            "-m", memory, f"--cpus={cpus}",
+            "-v", f"{os.path.join(CONFIGS_DIR, 'pytest_plugin.py')}:/app/pytest_plugin.py:ro",
+            "-v", f"{os.path.join(CONFIGS_DIR, 'sandbox_worker.py')}:/app/sandbox_worker.py:ro",
+            image,
+            "python", "-u", "/app/sandbox_worker.py"
+        ]
+        self.proc = subprocess.Popen(
+            cmd,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+        )
+        self._buffer = b""
+
+        ready = self._read_line(STARTUP_TIMEOUT)
+        if not ready.get("listo"):
+            self.close()
+            raise SandboxError("El sandbox no pudo iniciar")
+
+    def _read_line(self, timeout: float) -> dict:
+        # Se lee directo del descriptor: en streaming llegan varias líneas
+        # juntas y select no ve las que quedan en un buffer de Python
+        deadline = time.monotonic() + timeout
+        while b"\n" not in self._buffer:
+            ready, _, _ = select.select([self.proc.stdout], [], [], max(deadline - time.monotonic(), 0))
+            if not ready:
+                raise SandboxError("El sandbox no respondió a tiempo")
+            chunk = os.read(self.proc.stdout.fileno(), 65536)
+            if not chunk:
+                raise SandboxError("El sandbox terminó inesperadamente")
+            self._buffer += chunk
+        line, self._buffer = self._buffer.split(b"\n", 1)
+        return json.loads(line)
+
+    def _send(self, job: dict):
+        try:
+            self.proc.stdin.write((json.dumps(job) + "\n").encode("utf-8"))
+            self.proc.stdin.flush()
+        except (BrokenPipeError, OSError) as e:
+            raise SandboxError(f"No se pudo enviar el trabajo al sandbox: {e}")
+
+    def request(self, job: dict) -> dict:
+        self._send(job)
+        # En un lote el timeout aplica a cada entrega
+        jobs_count = len(job.get("codes") or [None])
+        return self._read_line(float(job.get("timeout", 30)) * jobs_count + RESPONSE_MARGIN)
+
+    def stream(self, job: dict, emit: Callable[[dict], None]) -> dict:
+        """
+        Envía un trabajo "run_stream" y pasa cada evento de salida a
+        `emit` hasta recibir el evento final, que se retorna.
+        """
+        self._send(job)
+        deadline = time.monotonic() + float(job.get("timeout", 30)) + RESPONSE_MARGIN
+        while True:
+            event = self._read_line(max(deadline - time.monotonic(), 0))
+            if event.get("evento") == "fin":
+                return event
+            emit(event)
+
+    def is_alive(self) -> bool:
+        return self.proc.poll() is None
+
+    def ping(self) -> bool:
+        try:
+            return self.request({"tipo": "ping", "timeout": 0}).get("pong", False)
+        except SandboxError:
+            return False
+
+    def close(self):
+        try:
+            self.proc.stdin.close()
+            self.proc.wait(timeout=2)
+        except Exception:
+            subprocess.run(["docker", "rm", "-f", self.name], capture_output=True)
+            self.proc.kill()
+
+
+class SandboxPool:
+    """
+    Pool de contenedores precalentados. Cada trabajo toma un worker libre,
+    se ejecuta en un hijo forkeado dentro del contenedor y el worker vuelve
+    al pool. Los workers se reciclan tras `max_jobs` trabajos y se
+    reemplazan si dejan de responder.
+    """
+    def __init__(self, size: int, max_jobs: int, image: str, memory: str, cpus: str):
+        self.size = size
+        self.max_jobs = max_jobs
+        self.image = image
+        self.memory = memory
+        self.cpus = cpus
+
+        self._idle = queue.Queue()
+        self._lock = threading.Lock()
+        self._workers = set()
+        self._closed = False
+
+        self.jobs_total = 0
+        self.timeouts = 0
+        self.recycled = 0
+        self.replaced = 0
+        self.spawn_errors = 0
+
+    def start(self):
+        for _ in range(self.size):
+            self._spawn_async()
+
+    def _spawn(self):
+        try:
+            worker = SandboxWorker(self.image, self.memory, self.cpus)
+        except Exception:
+            with self._lock:
+                self.spawn_errors += 1
+            raise
+        with self._lock:
+            if self._closed:
+                worker.close()
+                return
+            self._workers.add(worker)
+        self._idle.put(worker)
+
+    def _spawn_async(self):
+        threading.Thread(target=self._spawn_quietly, daemon=True).start()
+
+    def _spawn_quietly(self):
+        try:
+            self._spawn()
+        except Exception as e:
+            print(f"Error al iniciar sandbox: {str(e)}")
+
+    def _retire(self, worker: SandboxWorker):
+        with self._lock:
+            self._workers.discard(worker)
+        threading.Thread(target=worker.close, daemon=True).start()
+        if not self._closed:
+            self._spawn_async()
+
+    def _acquire(self) -> SandboxWorker:
+        deadline = time.monotonic() + ACQUIRE_TIMEOUT
+        while True:
+            remaining = deadline - time.monotonic()
+            try:
+                worker = self._idle.get(timeout=max(remaining, 0))
+            except queue.Empty:
+                raise SandboxError("No hay sandboxes disponibles")
+            if worker.is_alive():
+                return worker
+            with self._lock:
+                self.replaced += 1
+            self._retire(worker)
+
+    def run(self, job: dict) -> dict:
+        """
+        Ejecuta un trabajo en un worker del pool. `job` contiene el tipo
+        ("run", "pytest" o "pytest_lote"), el código, el test y los límites.
+        """
+        return self._dispatch(lambda worker: worker.request(job))
+
+    def stream(self, job: dict, emit: Callable[[dict], None]) -> dict:
+        """
+        Ejecuta un trabajo "run_stream" pasando cada fragmento de salida a
+        `emit`. Retorna el evento final con el código de retorno.
+        """
+        return self._dispatch(lambda worker: worker.stream(job, emit))
+
+    def _dispatch(self, call: Callable[[SandboxWorker], dict]) -> dict:
+        worker = self._acquire()
+        try:
+            result = call(worker)
+        except SandboxError:
+            with self._lock:
+                self.replaced += 1
+            self._retire(worker)
+            raise
+
+        worker.jobs += 1
+        with self._lock:
+            self.jobs_total += 1
+            if result.get("timeout"):
+                self.timeouts += 1
+
+        if worker.jobs >= self.max_jobs:
+            with self._lock:
+                self.recycled += 1
+            self._retire(worker)
+        else:
+            self._idle.put(worker)
+        return result
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = len(self._workers)
+            return {
+                "size": self.size,
+                "workers": total,
+                "idle": self._idle.qsize(),
+                "busy": max(total - self._idle.qsize(), 0),
+                "max_jobs": self.max_jobs,
+                "jobs_total": self.jobs_total,
+                "timeouts": self.timeouts,
+                "recycled": self.recycled,
+                "replaced": self.replaced,
+                "spawn_errors": self.spawn_errors,
+            }
+
+    def health_check(self):
+        """
+        Hace ping a los workers libres y reemplaza los que no responden.
+        """
+        checked = []
+        while True:
+            try:
+                worker = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            if worker.is_alive() and worker.ping():
+                checked.append(worker)
+            else:
+                with self._lock:
+                    self.replaced += 1
+                self._retire(worker)
+        for worker in checked:
+            self._idle.put(worker)
+
+    def shutdown(self):
+        with self._lock:
+            self._closed = True
+            workers = list(self._workers)
+            self._workers.clear()
+        for worker in workers:
+            worker.close()
+
+
+class AdmissionQueue:
+    """
+    Control de admisión para el event loop: como máximo `max_concurrency`
+    ejecuciones en curso y `max_queue` esperando turno. Las solicitudes
+    que no caben se rechazan de inmediato en vez de acumularse.
+    """
+    def __init__(self, max_concurrency: int, max_queue: int, queue_timeout: float):
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self._semaphore = None
+
+        self.waiting = 0
+        self.in_flight = 0
+        self.admitted = 0
+        self.rejected = 0
+
+    def _get_semaphore(self) -> asyncio.Semaphore:
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._semaphore
+
+    async def acquire(self):
+        semaphore = self._get_semaphore()
+        if semaphore.locked():
+            if self.waiting >= self.max_queue:
+                self.rejected += 1
+                raise SandboxSaturatedError("La cola de ejecución está llena")
+
+            self.waiting += 1
+            try:
+                await asyncio.wait_for(semaphore.acquire(), timeout=self.queue_timeout)
+            except asyncio.TimeoutError:
+                self.rejected += 1
+                raise SandboxSaturatedError("Se agotó el tiempo de espera en la cola de ejecución")
+            finally:
+                self.waiting -= 1
+        else:
+            await semaphore.acquire()
+
+        self.in_flight += 1
+        self.admitted += 1
+
+    def release(self):
+        self.in_flight -= 1
+        self._get_semaphore().release()
+
+    async def __aenter__(self):
+        await self.acquire()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self.release()
+
+    def stats(self) -> dict:
+        return {
+            "max_concurrency": self.max_concurrency,
+            "max_queue": self.max_queue,
+            "waiting": self.waiting,
+            "in_flight": self.in_flight,
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+        }
+
+
+_pool = None
+_pool_lock = threading.Lock()
+_health_task: Optional[asyncio.Task] = None
+
+admission = AdmissionQueue(SANDBOX_MAX_CONCURRENCY, SANDBOX_MAX_QUEUE, SANDBOX_QUEUE_TIMEOUT)
+
+# Hilos dedicados a esperar las respuestas bloqueantes de los workers,
+# para no ocupar el executor por defecto del event loop
+_executor = ThreadPoolExecutor(max_workers=SANDBOX_MAX_CONCURRENCY, thread_name_prefix="sandbox")
+
+
+def get_sandbox_pool() -> SandboxPool:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = SandboxPool(
+                size=SANDBOX_POOL_SIZE,
+                max_jobs=SANDBOX_MAX_JOBS,
+                image=SANDBOX_IMAGE,
+                memory=SANDBOX_MEMORY,
+                cpus=SANDBOX_CPUS,
+            )
+            _pool.start()
+        return _pool
+
+
+async def run_sandbox_job(job: dict) -> dict:
+    """
+    Versión asíncrona de SandboxPool.run: pasa por la cola de admisión y
+    espera la respuesta del worker fuera del event loop.
+    """
+    async with admission:
+        loop = asyncio.get_running_loop()
+        pool = await loop.run_in_executor(_executor, get_sandbox_pool)
+        return await loop.run_in_executor(_executor, pool.run, job)
+
+
+async def stream_sandbox_job(job: dict) -> AsyncIterator[dict]:
+    """
+    Ejecuta un trabajo "run_stream" y entrega sus eventos a medida que el
+    worker los produce, terminando con el evento "fin" (o "error" si falla
+    el sandbox). Entre el hilo que lee del worker y el event loop hay una
+    cola acotada: si el cliente lee lento, el hilo espera en vez de
+    acumular salida en memoria.
+    """
+    await admission.acquire()
+    loop = asyncio.get_running_loop()
+    events = asyncio.Queue(maxsize=STREAM_BUFFER_EVENTS)
+    closed = threading.Event()
+
+    def emit(event: dict):
+        if closed.is_set():
+            return
+        future = asyncio.run_coroutine_threadsafe(events.put(event), loop)
+        while not closed.is_set():
+            try:
+                future.result(timeout=0.5)
+                return
+            except FutureTimeoutError:
+                continue
+        future.cancel()
+
+    def produce():
+        try:
+            emit(get_sandbox_pool().stream(job, emit))
+        except SandboxError as e:
+            emit({"evento": "error", "error": str(e)})
+
+    try:
+        task = loop.run_in_executor(_executor, produce)
+    except BaseException:
+        admission.release()
+        raise
+    # El worker sigue ocupado hasta que el programa termina, aunque el
+    # cliente se desconecte antes
+    task.add_done_callback(lambda _: admission.release())
+
+    try:
+        while True:
+            event = await events.get()
+            yield event
+            if event.get("evento") in ("fin", "error"):
+                break
+    finally:
+        closed.set()
+
+
+def get_sandbox_pool_stats() -> dict:
+    if _pool is None:
+        stats = {"size": SANDBOX_POOL_SIZE, "workers": 0, "started": False}
+    else:
+        stats = {**_pool.stats(), "started": True}
+    stats["admission"] = admission.stats()
+    return stats
+
+
+async def _health_check_loop():
+    loop = asyncio.get_running_loop()
+    while True:
+        await asyncio.sleep(SANDBOX_HEALTH_INTERVAL)
+        # El chequeo no crea el pool: solo revisa el que ya se usa
+        if _pool is None:
+            continue
+        try:
+            # En el executor por defecto, para no ocupar los hilos de los trabajos
+            await loop.run_in_executor(None, _pool.health_check)
+        except Exception as e:
+            print(f"Error al revisar los sandboxes: {str(e)}")
+
+
+async def start_sandbox_health_checks():
+    """
+    Inicia el chequeo periódico de los workers libres. Se llama desde el
+    lifespan de la app.
+    """
+    global _health_task
+    if SANDBOX_HEALTH_INTERVAL > 0 and _health_task is None:
+        _health_task = asyncio.create_task(_health_check_loop())
+
+
+async def stop_sandbox_health_checks():
+    global _health_task
+    if _health_task is None:
+        return
+    _health_task.cancel()
+    try:
+        await _health_task
+    except asyncio.CancelledError:
+        pass
+    _health_task = None
+
+
+def shutdown_sandbox_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown()
+            _pool = None
@@ -0,0 +1,66 @@
+import json
+from typing import Any, AsyncIterator, Dict, Iterator
+
+from fastapi.responses import StreamingResponse
+
+from settings import STREAM_MAX_BYTES
+
+STREAM_CHUNK_CHARS = 4096
+
+
+def sse_event(event: Dict[str, Any]) -> str:
+    """
+    Serializa un evento ({"evento": ..., ...}) como mensaje Server-Sent
+    Events. El resto de las claves va como JSON en el campo data.
+    """
+    data = {key: value for key, value in event.items() if key != "evento"}
+    return f"event: {event.get('evento', 'message')}\ndata: {json.dumps(data)}\n\n"
+
+
+async def _sse_stream(events: AsyncIterator[Dict[str, Any]]) -> AsyncIterator[str]:
+    # Un comentario inicial hace que el navegador reciba los headers sin
+    # esperar la primera salida del programa
+    yield ": inicio\n\n"
+    async for event in events:
+        yield sse_event(event)
+
+
+def sse_response(events: AsyncIterator[Dict[str, Any]]) -> StreamingResponse:
+    return StreamingResponse(
+        _sse_stream(events),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            # Evita que nginx acumule la respuesta antes de enviarla
+            "X-Accel-Buffering": "no",
+        },
+    )
+
+
+def result_events(result: Dict[str, Any], max_bytes: int = STREAM_MAX_BYTES) -> Iterator[Dict[str, Any]]:
+    """
+    Convierte un resultado ya completo (stdout, stderr, return_code) en los
+    mismos eventos que produce una ejecución en streaming, respetando el
+    límite de bytes de salida.
+    """
+    remaining = max_bytes
+    truncated = False
+    for name in ("stdout", "stderr"):
+        data = (result.get(name) or "").encode("utf-8")
+        if len(data) > remaining:
+            data = data[:remaining]
+            truncated = True
+        remaining -= len(data)
+        text = data.decode("utf-8", errors="ignore")
+        for start in range(0, len(text), STREAM_CHUNK_CHARS):
+            yield {"evento": name, "datos": text[start:start + STREAM_CHUNK_CHARS]}
+
+    if truncated:
+        yield {"evento": "truncado", "limite": max_bytes}
+    yield {
+        "evento": "fin",
+        "return_code": result.get("return_code", 1),
+        "timeout": False,
+        "truncado": truncated,
+        "recursos": result.get("recursos"),
+    }
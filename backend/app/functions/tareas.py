@@ -1,69 +1,84 @@
-from functions.supabase import supabaseClient
+from typing import Optional
 
-def get_tareas_by_course_lms_id(course_id_lms: str):
-    from functions.lti import get_course_id_by_lms_id
-    course_id = get_course_id_by_lms_id(course_id_lms).get("id")
-    response = (
-        supabaseClient.table("tarea")
-        .select("id, titulo")
-        .eq("id_curso", course_id)
-        .execute()
-    )
-    return response.data
+from functions.db import fetch, fetchrow
+from functions.cache import TTLCache, MISSING, content_hash
+from functions.listados import bump_course_version
+from settings import TEST_CACHE_SIZE, TEST_CACHE_TTL
 
-def get_tarea_by_id(tarea_id: int):
-    response = (
-        supabaseClient.table("tarea")
-        .select("id, titulo, contenido, test")
-        .eq("id", tarea_id)
-        .execute()
-    )
-    return response.data[0]
+# Cache de tests por id de tarea. Se invalida al actualizar o eliminar
+_test_cache = TTLCache("tarea_test", TEST_CACHE_SIZE, TEST_CACHE_TTL)
 
-def get_tarea_test(tarea_id: int):
-    response = (
-        supabaseClient.table("tarea")
-        .select("test")
-        .eq("id", tarea_id)
-        .execute()
-    )
-    if response.data:
-        return response.data[0]
+# Consultas frecuentes (ver functions/db.py)
+# Página de actividades del curso por cursor (id); LIMIT NULL trae todas
+TAREAS_BY_COURSE = """
+SELECT id, titulo FROM tarea
+WHERE id_curso = $1 AND id > $2
+ORDER BY id
+LIMIT $3
+"""
+TAREA_BY_ID = "SELECT id, titulo, contenido, test FROM tarea WHERE id = $1"
+TAREA_TEST_BY_ID = "SELECT test FROM tarea WHERE id = $1"
+
+async def get_tareas_by_course(course_id: int, after: Optional[int] = None, limit: Optional[int] = None):
+    return await fetch(TAREAS_BY_COURSE, course_id, after or 0, limit)
+
+async def get_tarea_by_id(tarea_id: int):
+    return await fetchrow(TAREA_BY_ID, tarea_id)
+
+async def get_tarea_test(tarea_id: int):
+    cached = _test_cache.get(tarea_id)
+    if cached is not MISSING:
+        return cached
+
+    row = await fetchrow(TAREA_TEST_BY_ID, tarea_id)
+    if row:
+        test = row.get("test")
+        data = {"test": test, "hash": content_hash(test) if test else None}
+        _test_cache.set(tarea_id, data)
+        return data
     else:
         return None
 
 # Metodos Post
 from models.tarea import Tarea, TareaUpdate
+from functions.test_suites import analyze_test
 
-def create_tarea(tarea: Tarea):
-    response = (
-        supabaseClient.table("tarea")
-        .insert({"id_curso": tarea.id_curso,
-                 "titulo": tarea.titulo,
-                 "contenido": tarea.contenido,
-                 "fecha_limite": tarea.fecha_limite,
-                 "test": tarea.test})
-        .execute()
+async def create_tarea(tarea: Tarea):
+    # Validar el test antes de guardarlo (lanza TestSuiteError)
+    if tarea.test:
+        analyze_test(tarea.test)
+    response = await fetch(
+        """
+        INSERT INTO tarea (id_curso, titulo, contenido, fecha_limite, test)
+        VALUES ($1, $2, $3, $4::text::timestamptz, $5)
+        RETURNING *
+        """,
+        tarea.id_curso, tarea.titulo, tarea.contenido, tarea.fecha_limite, tarea.test
     )
-    return response.data
+    bump_course_version("tarea", tarea.id_curso)
+    return response
 
-def update_tarea(tarea_id: int, tarea: TareaUpdate):
-    response = (
-        supabaseClient.table("tarea")
-        .update({"titulo": tarea.titulo,
-                 "contenido": tarea.contenido,
-                 "test": tarea.test})
-        .eq("id", tarea_id)
-        .execute()
+async def update_tarea(tarea_id: int, tarea: TareaUpdate):
+    # Validar el test antes de guardarlo (lanza TestSuiteError)
+    if tarea.test:
+        analyze_test(tarea.test)
+    response = await fetch(
+        """
+        UPDATE tarea SET titulo = $2, contenido = $3, test = $4
+        WHERE id = $1
+        RETURNING *
+        """,
+        tarea_id, tarea.titulo, tarea.contenido, tarea.test
     )
-    return response.data
+    _test_cache.delete(tarea_id)
+    for row in response:
+        bump_course_version("tarea", row["id_curso"])
+    return response
 
 
-def delete_tarea(tarea_id: int):
-    response = (
-        supabaseClient.table("tarea")
-        .delete()
-        .eq("id", tarea_id)
-        .execute()
-    )
-    return response.data
\ No newline at end of file
+async def delete_tarea(tarea_id: int):
+    response = await fetch("DELETE FROM tarea WHERE id = $1 RETURNING *", tarea_id)
+    _test_cache.delete(tarea_id)
+    for row in response:
+        bump_course_version("tarea", row["id_curso"])
+    return response
@@ -0,0 +1,129 @@
+import ast
+from typing import Any, Dict, Optional
+
+from functions.cache import TTLCache, MISSING, content_hash
+from settings import TEST_CACHE_SIZE
+
+# Análisis de cada test (ids, nombres importados desde app) indexado por
+# el hash de su contenido. Se llena al guardar y, si falta, al ejecutar
+_suites = TTLCache("suites", TEST_CACHE_SIZE, 24 * 60 * 60)
+
+TEST_FILE_NAME = "test_code.py"
+
+
+class TestSuiteError(ValueError):
+    """El test de la actividad no se puede compilar."""
+
+
+def analyze_test(test: str) -> Dict[str, Any]:
+    """
+    Compila el test y extrae los ids de los tests que pytest va a recolectar
+    y los nombres que importa desde `app`. Lanza TestSuiteError si el test
+    tiene errores de sintaxis o no define ningún test.
+    """
+    try:
+        tree = ast.parse(test, TEST_FILE_NAME)
+        compile(tree, TEST_FILE_NAME, "exec")
+    except SyntaxError as e:
+        raise TestSuiteError(f"Error de sintaxis en el test (línea {e.lineno}): {e.msg}")
+
+    test_ids = []
+    app_imports = []
+    for node in tree.body:
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)) and node.name.startswith("test"):
+            test_ids.append(f"{TEST_FILE_NAME}::{node.name}")
+        elif isinstance(node, ast.ClassDef) and node.name.startswith("Test"):
+            for item in node.body:
+                if isinstance(item, (ast.FunctionDef, ast.AsyncFunctionDef)) and item.name.startswith("test"):
+                    test_ids.append(f"{TEST_FILE_NAME}::{node.name}::{item.name}")
+        elif isinstance(node, ast.ImportFrom) and node.module == "app" and node.level == 0:
+            app_imports.extend(alias.name for alias in node.names if alias.name != "*")
+
+    if not test_ids:
+        raise TestSuiteError("El test no contiene funciones test_* para ejecutar")
+
+    suite = {
+        "hash": content_hash(test),
+        "test_ids": test_ids,
+        "app_imports": app_imports,
+    }
+    _suites.set(suite["hash"], suite)
+    return suite
+
+
+def get_suite(test: str, test_hash: Optional[str] = None) -> Optional[Dict[str, Any]]:
+    """
+    Retorna el análisis del test, o None si el test no compila.
+    """
+    suite = _suites.get(test_hash or content_hash(test))
+    if suite is not MISSING:
+        return suite
+    try:
+        return analyze_test(test)
+    except TestSuiteError:
+        return None
+
+
+def _defined_names(tree: ast.Module):
+    """
+    Nombres definidos a nivel de módulo, o None si el código los puede
+    definir dinámicamente (import *, globals(), exec...).
+    """
+    names = set()
+    for node in ast.walk(tree):
+        if isinstance(node, ast.ImportFrom) and any(alias.name == "*" for alias in node.names):
+            return None
+        if isinstance(node, ast.Name) and node.id in ("globals", "exec", "eval", "setattr", "__import__"):
+            return None
+
+    for node in tree.body:
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+            names.add(node.name)
+        elif isinstance(node, (ast.Import, ast.ImportFrom)):
+            names.update((alias.asname or alias.name).split(".")[0] for alias in node.names)
+        else:
+            # Asignaciones, for, with, try, if... a nivel de módulo
+            for child in ast.walk(node):
+                if isinstance(child, ast.Name) and isinstance(child.ctx, ast.Store):
+                    names.add(child.id)
+                elif isinstance(child, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+                    names.add(child.name)
+    return names
+
+
+def precheck_code(code: str, suite: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """
+    Verifica sin sandbox que el código defina las funciones que importa el
+    test. Si falta alguna retorna el mismo resultado que daría el runner;
+    en cualquier otro caso retorna None y el código se ejecuta normalmente.
+    """
+    if not suite or not suite["app_imports"]:
+        return None
+    try:
+        names = _defined_names(ast.parse(code))
+    except SyntaxError:
+        # El runner reporta los errores de sintaxis con su propio formato
+        return None
+    if names is None:
+        return None
+
+    for name in suite["app_imports"]:
+        if name not in names:
+            message = f"No se encuentra la función '{name}' en el código"
+            return {
+                "stdout": (
+                    "\n[Errores encontrados al verificar el código]"
+                    f"\n  > {message}"
+                ),
+                "stderr": "",
+                "return_code": 1,
+                "resultado": {
+                    "passed": 0,
+                    "failed": 0,
+                    "total": 0,
+                    "score": 0,
+                    "tests": [],
+                    "collection_errors": [message],
+                },
+            }
+    return None
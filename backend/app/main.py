@@ -1,9 +1,33 @@
-from fastapi import FastAPI
+import time
+from contextlib import asynccontextmanager
+
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse
 
 from settings import FRONTEND_URL
 
-app = FastAPI(title="Edurun Python")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    from functions.aws_lambda import start_lambda_client, close_lambda_client
+    from functions.sandbox_pool import start_sandbox_health_checks, stop_sandbox_health_checks, shutdown_sandbox_pool
+    from functions.db import start_db_pool, close_db_pool
+    from functions.entregas_pendientes import start_write_behind, stop_write_behind
+
+    await start_db_pool()
+    await start_write_behind()
+    await start_lambda_client()
+    await start_sandbox_health_checks()
+    yield
+    await stop_sandbox_health_checks()
+    await close_lambda_client()
+    await stop_write_behind()
+    await close_db_pool()
+    shutdown_sandbox_pool()
+
+
+app = FastAPI(title="Edurun Python", lifespan=lifespan)
 
 origins = [
     "http://localhost",
@@ -17,8 +41,36 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag", "X-Next-Cursor"],
 )
 
+@app.middleware("http")
+async def measure_latency(request: Request, call_next):
+    from functions.metricas import http_request_duration
+    started = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        # Se etiqueta con la plantilla de la ruta (/api/evaluacion/{evaluacion_id})
+        # para no crear una serie por cada id
+        route = request.scope.get("route")
+        http_request_duration.observe(
+            time.perf_counter() - started,
+            ruta=route.path if route else "sin_ruta",
+            metodo=request.method,
+            estado=status,
+        )
+
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    from functions.metricas import render_metrics
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
+
 # Routers
 from router.api import router as evaluaciones_router
 from router.lti import router as lti_router
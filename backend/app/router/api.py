@@ -1,7 +1,10 @@
+from typing import Optional
+
 from fastapi import APIRouter
 
 # Funciones para manejar los endpoints
-from fastapi import Form
+from fastapi import Form, HTTPException, Query, Request
+from functions.test_suites import TestSuiteError
 from models.evaluacion import EntregaEvaluacion, Evaluacion, EvaluacionUpdate
 from models.tarea import Tarea, TareaUpdate
 
@@ -11,120 +14,188 @@ router = APIRouter()
 async def health_check():
     return {"status": "ok"}
 
+@router.get("/cache/stats/")
+async def cache_stats():
+    from functions.cache import get_cache_stats
+    from functions.result_cache import get_result_cache_stats
+    return {**get_cache_stats(), "resultados": get_result_cache_stats()}
+
+@router.get("/db/stats/")
+async def db_stats():
+    from functions.db import get_db_pool_stats
+    return get_db_pool_stats()
+
+@router.get("/entregas/pendientes/stats/")
+async def write_behind_stats():
+    from functions.entregas_pendientes import get_write_behind_stats
+    return await get_write_behind_stats()
+
 # evaluaciones
 
 @router.get("/evaluaciones/{course_id_lms}")
-async def read_evaluaciones(course_id_lms: str):
-    from functions.evaluaciones import get_evaluaciones_by_course_lms_id
-    return get_evaluaciones_by_course_lms_id(course_id_lms)
+async def read_evaluaciones(
+        request: Request,
+        course_id_lms: str,
+        after: Optional[int] = None,
+        limit: Optional[int] = Query(None, ge=1, le=500),
+):
+    from functions.listados import listing_response
+    return await listing_response(request, "evaluacion", course_id_lms, after, limit)
 
 @router.get("/evaluacion/{evaluacion_id}")
 async def read_evaluacion(evaluacion_id: int):
     from functions.evaluaciones import get_evaluacion_by_id
-    return get_evaluacion_by_id(evaluacion_id)
+    return await get_evaluacion_by_id(evaluacion_id)
 
 @router.post("/evaluacion/")
 async def create_evaluacion(evaluacion: Evaluacion):
     from functions.evaluaciones import create_evaluacion
-    response = create_evaluacion(evaluacion)
+    try:
+        response = await create_evaluacion(evaluacion)
+    except TestSuiteError as e:
+        raise HTTPException(status_code=422, detail=str(e))
     return response
 
 @router.put("/evaluacion/{evaluacion_id}")
 async def update_evaluacion(evaluacion_id: int, evaluacion: EvaluacionUpdate):
     from functions.evaluaciones import update_evaluacion
-    response = update_evaluacion(evaluacion_id, evaluacion)
+    try:
+        response = await update_evaluacion(evaluacion_id, evaluacion)
+    except TestSuiteError as e:
+        raise HTTPException(status_code=422, detail=str(e))
     return response
 
 @router.post("/evaluacion/entrega/")
 async def submit_evaluacion(entrega: EntregaEvaluacion):
-    from functions.evaluaciones import create_or_update_entrega_evaluacion
-    response = create_or_update_entrega_evaluacion(entrega)
+    from functions.entregas_pendientes import submit_entrega
+    response = await submit_entrega(entrega)
+    if not response:
+        raise HTTPException(status_code=404, detail="Alumno no encontrado")
     return response
 
 @router.get("/evaluacion/entrega/")
 async def get_entregas_evaluacion(user_id_lms: str,evaluacion_id: int):
     from functions.evaluaciones import get_entrega_evaluacion
-    response = get_entrega_evaluacion(user_id_lms,evaluacion_id)
+    response = await get_entrega_evaluacion(user_id_lms,evaluacion_id)
     return response
 
+@router.get("/estado/{course_id_lms}/{user_id_lms}")
+async def get_estado_alumno(course_id_lms: str, user_id_lms: str):
+    from functions.estado_alumno import get_estado_alumno
+    return await get_estado_alumno(course_id_lms, user_id_lms)
+
+@router.get("/entregas/exportar/")
+async def export_entregas(
+        curso: Optional[str] = None,
+        evaluacion_id: Optional[int] = None,
+        formato: str = Query("ndjson", pattern="^(ndjson|csv)$"),
+        codigo: bool = False,
+        detalles: bool = False,
+):
+    from functions.exportacion import export_entregas
+    return await export_entregas(curso, evaluacion_id, formato, codigo, detalles)
+
+@router.post("/evaluacion/{evaluacion_id}/recalificar/")
+async def regrade_evaluacion(evaluacion_id: int):
+    from functions.recalificacion import start_regrade
+    return await start_regrade(evaluacion_id)
+
+@router.get("/recalificacion/{job_id}")
+async def get_regrade_status(job_id: str):
+    from functions.recalificacion import get_regrade_status
+    result = get_regrade_status(job_id)
+    if result:
+        return result
+    return {"error": "Recalificación no encontrada"}
+
 # tareas
 
 @router.get("/tareas/{course_id_lms}")
-async def read_tareas(course_id_lms: str):
-    from functions.tareas import get_tareas_by_course_lms_id
-    return get_tareas_by_course_lms_id(course_id_lms)
+async def read_tareas(
+        request: Request,
+        course_id_lms: str,
+        after: Optional[int] = None,
+        limit: Optional[int] = Query(None, ge=1, le=500),
+):
+    from functions.listados import listing_response
+    return await listing_response(request, "tarea", course_id_lms, after, limit)
 
 @router.get("/tarea/{tarea_id}")
 async def read_tarea(tarea_id: int):
     from functions.tareas import get_tarea_by_id
-    return get_tarea_by_id(tarea_id)
+    return await get_tarea_by_id(tarea_id)
 
 @router.post("/tarea/")
 async def create_tarea(tarea: Tarea):
     from functions.tareas import create_tarea
-    response = create_tarea(tarea)
+    try:
+        response = await create_tarea(tarea)
+    except TestSuiteError as e:
+        raise HTTPException(status_code=422, detail=str(e))
     return response
 
 @router.put("/tarea/{tarea_id}")
 async def update_tarea(tarea_id: int, tarea: TareaUpdate):
     from functions.tareas import update_tarea
-    response = update_tarea(tarea_id, tarea)
+    try:
+        response = await update_tarea(tarea_id, tarea)
+    except TestSuiteError as e:
+        raise HTTPException(status_code=422, detail=str(e))
     return response
 
 # Delete endpoints
 @router.delete("/evaluacion/{evaluacion_id}")
 async def delete_evaluacion(evaluacion_id: int):
     from functions.evaluaciones import delete_evaluacion
-    response = delete_evaluacion(evaluacion_id)
+    response = await delete_evaluacion(evaluacion_id)
     return response
 
 @router.delete("/tarea/{tarea_id}")
 async def delete_tarea(tarea_id: int):
     from functions.tareas import delete_tarea
-    response = delete_tarea(tarea_id)
+    response = await delete_tarea(tarea_id)
     return response
 
-# Containers endpoints
+# Ejecución de código (functions/ejecutores.py): cada solicitud va al
+# ejecutor que elija el enrutador entre los configurados en EXECUTORS
 
-'''
-@router.post("/send-code/")
-async def send_code(code: str = Form(...), evaluacion_id: int = Form(...)):
-    from functions.containers import evaluate_activity
-    return evaluate_activity(code, evaluacion_id)
+@router.get("/ejecutores/stats/")
+async def executor_stats():
+    from functions.ejecutores import get_executor_stats
+    return get_executor_stats()
 
-@router.post("/run-code/")
-async def run_code(code: str = Form(...)):
-    from functions.containers import run_code_in_docker
-    return run_code_in_docker(code)
-
-@router.post("/run-tarea-test/")
-async def run_test(code: str = Form(...), tarea_id: int = Form(...)):
-    from functions.containers import run_tarea_unittest_in_docker
-    return run_tarea_unittest_in_docker(code, tarea_id)
+@router.get("/sandbox/stats/")
+async def sandbox_stats():
+    from functions.sandbox_pool import get_sandbox_pool_stats
+    return get_sandbox_pool_stats()
 
-@router.post("/run-evaluacion-test/")
-async def run_evaluacion_test(code: str = Form(...), evaluacion_id: int = Form(...)):
-    from functions.containers import run_evaluacion_unittest_in_docker
-    return run_evaluacion_unittest_in_docker(code, evaluacion_id)
-'''
+@router.get("/lambda/stats/")
+async def lambda_stats():
+    from functions.aws_lambda import get_lambda_client_stats
+    return get_lambda_client_stats()
 
-# AWS Lambda endpoints
 @router.post("/run-code/")
-async def run_code_lambda(code: str = Form(...)):
-    from functions.aws_lambda import execute_python_code
-    return await execute_python_code(code)
+async def run_code(code: str = Form(...), cache: bool = Form(False)):
+    from functions.ejecutores import run_on_executor
+    return await run_on_executor("run_code", code, cache)
+
+@router.post("/run-code/stream/")
+async def run_code_stream(code: str = Form(...)):
+    from functions.ejecutores import get_executor_router
+    from functions.streaming import sse_response
+    return sse_response(get_executor_router().stream(code))
 
 @router.post("/run-tarea-test/")
-async def run_tarea_test_lambda(code: str = Form(...), tarea_id: int = Form(...)):
-    from functions.aws_lambda import execute_code_test
-    return await execute_code_test(code, tarea_id)
+async def run_tarea_test(code: str = Form(...), tarea_id: int = Form(...), fail_fast: bool = Form(False)):
+    from functions.ejecutores import run_on_executor
+    return await run_on_executor("run_tarea_test", code, tarea_id, fail_fast)
 
 @router.post("/run-evaluacion-test/")
-async def run_evaluacion_test_lambda(code: str = Form(...), evaluacion_id: int = Form(...)):
-    from functions.aws_lambda import execute_code_test_evaluacion
-    return await execute_code_test_evaluacion(code, evaluacion_id)
+async def run_evaluacion_test(code: str = Form(...), evaluacion_id: int = Form(...), fail_fast: bool = Form(False)):
+    from functions.ejecutores import run_on_executor
+    return await run_on_executor("run_evaluacion_test", code, evaluacion_id, fail_fast)
 
 @router.post("/send-code/")
-async def evaluate_activity_lambda(code: str = Form(...), evaluacion_id: int = Form(...)):
-    from functions.aws_lambda import evaluate_activity
-    return await evaluate_activity(code, evaluacion_id)
\ No newline at end of file
+async def send_code(code: str = Form(...), evaluacion_id: int = Form(...)):
+    from functions.ejecutores import run_on_executor
+    return await run_on_executor("evaluate_activity", code, evaluacion_id)
@@ -10,7 +10,7 @@ async def get_canvas_data():
 @router.get("/course/{course_id_lms}")
 async def get_course_by_lms_id(course_id_lms: str):
     from functions.lti import get_course_id_by_lms_id
-    result = get_course_id_by_lms_id(course_id_lms)
+    result = await get_course_id_by_lms_id(course_id_lms)
     if result:
         return result
     return {"error": "Curso no encontrado"}
@@ -18,5 +18,5 @@ async def get_course_by_lms_id(course_id_lms: str):
 @router.post("/register_instance/")
 async def register_lti_launch(usuario: Usuario, curso: Curso, plataforma: Plataforma):
     from functions.lti import register_lti_launch
-    result = register_lti_launch(usuario, curso, plataforma)
+    result = await register_lti_launch(usuario, curso, plataforma)
     return result
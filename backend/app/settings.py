@@ -3,9 +3,126 @@ from dotenv import load_dotenv
 
 load_dotenv()
 
-SUPABASE_URL = os.getenv("SUPABASE_URL")
-SUPABASE_KEY = os.getenv("SUPABASE_KEY")
+DATABASE_URL = os.getenv("DATABASE_URL")
+
+# Pool de conexiones a Postgres (functions/db.py)
+
+DB_POOL_MIN_SIZE = int(os.getenv("DB_POOL_MIN_SIZE", "2"))
+DB_POOL_MAX_SIZE = int(os.getenv("DB_POOL_MAX_SIZE", "10"))
+DB_COMMAND_TIMEOUT = float(os.getenv("DB_COMMAND_TIMEOUT", "10"))
+DB_STATEMENT_CACHE_SIZE = int(os.getenv("DB_STATEMENT_CACHE_SIZE", "100"))
 
 FRONTEND_URL = os.getenv("FRONTEND_URL")
 
-LAMBDA_API_URL = os.getenv("LAMBDA_API_URL")
\ No newline at end of file
+LAMBDA_API_URL = os.getenv("LAMBDA_API_URL")
+
+# Ejecutores habilitados (functions/ejecutores.py), en orden de
+# preferencia: docker, lambda o ambos. Con más de uno cada solicitud va al
+# de menor latencia y tasa de error ("latencia") o al primero disponible
+# ("prioridad"), y si falla se reintenta en el siguiente. El circuito de un
+# ejecutor se abre tras EXECUTOR_BREAKER_FAILURES fallas seguidas y se
+# vuelve a probar pasados EXECUTOR_BREAKER_COOLDOWN segundos
+
+EXECUTORS = [name.strip() for name in os.getenv("EXECUTORS", "lambda").split(",") if name.strip()]
+EXECUTOR_ROUTING = os.getenv("EXECUTOR_ROUTING", "latencia")
+EXECUTOR_BREAKER_FAILURES = int(os.getenv("EXECUTOR_BREAKER_FAILURES", "5"))
+EXECUTOR_BREAKER_COOLDOWN = float(os.getenv("EXECUTOR_BREAKER_COOLDOWN", "30"))
+EXECUTOR_EWMA_ALPHA = float(os.getenv("EXECUTOR_EWMA_ALPHA", "0.2"))
+EXECUTOR_EXPLORATION = float(os.getenv("EXECUTOR_EXPLORATION", "0.05"))
+
+# Cliente HTTP compartido hacia la Lambda (functions/aws_lambda.py)
+
+LAMBDA_HTTP2 = os.getenv("LAMBDA_HTTP2", "true").lower() == "true"
+LAMBDA_MAX_CONNECTIONS = int(os.getenv("LAMBDA_MAX_CONNECTIONS", "100"))
+LAMBDA_MAX_KEEPALIVE = int(os.getenv("LAMBDA_MAX_KEEPALIVE", "20"))
+LAMBDA_KEEPALIVE_EXPIRY = float(os.getenv("LAMBDA_KEEPALIVE_EXPIRY", "30"))
+LAMBDA_MAX_RETRIES = int(os.getenv("LAMBDA_MAX_RETRIES", "2"))
+
+# Cache en memoria de los tests de tareas y evaluaciones
+
+TEST_CACHE_SIZE = int(os.getenv("TEST_CACHE_SIZE", "1024"))
+TEST_CACHE_TTL = float(os.getenv("TEST_CACHE_TTL", "300"))
+
+# Cache de lanzamientos LTI ya registrados
+
+LTI_LAUNCH_CACHE_SIZE = int(os.getenv("LTI_LAUNCH_CACHE_SIZE", "10000"))
+LTI_LAUNCH_CACHE_TTL = float(os.getenv("LTI_LAUNCH_CACHE_TTL", str(12 * 60 * 60)))
+
+# Cache id_lms -> id interno de usuarios y cursos. Los ids no encontrados
+# se recuerdan solo IDENTITY_NEGATIVE_TTL segundos
+
+IDENTITY_CACHE_SIZE = int(os.getenv("IDENTITY_CACHE_SIZE", "50000"))
+IDENTITY_CACHE_TTL = float(os.getenv("IDENTITY_CACHE_TTL", str(24 * 60 * 60)))
+IDENTITY_NEGATIVE_TTL = float(os.getenv("IDENTITY_NEGATIVE_TTL", "30"))
+
+# Cache de los listados de actividades por curso (ETag y respuesta)
+
+LISTING_CACHE_SIZE = int(os.getenv("LISTING_CACHE_SIZE", "2048"))
+LISTING_CACHE_TTL = float(os.getenv("LISTING_CACHE_TTL", "30"))
+
+# Cache de resultados de ejecución. RUNNER_VERSION se debe cambiar cuando
+# cambie la salida del runner para descartar resultados antiguos
+
+RESULT_CACHE_SIZE = int(os.getenv("RESULT_CACHE_SIZE", "2048"))
+RESULT_CACHE_TTL = float(os.getenv("RESULT_CACHE_TTL", "600"))
+RUNNER_VERSION = os.getenv("RUNNER_VERSION", "3")
+
+# Tiempo límite de cada test (segundos). Un test que lo excede se marca
+# como fallido por tiempo y los demás se siguen ejecutando
+
+TEST_TIMEOUT = float(os.getenv("TEST_TIMEOUT", "5"))
+
+# Procesos entre los que se reparten los tests de una misma entrega. Se
+# acota por las CPUs del sandbox (SANDBOX_CPUS) o de la Lambda
+
+TEST_WORKERS = int(os.getenv("TEST_WORKERS", "4"))
+
+# Cola local de entregas (functions/entregas_pendientes.py): las entregas
+# se confirman al quedar en el SQLite y se escriben en la base en lotes
+
+WRITE_BEHIND_ENABLED = os.getenv("WRITE_BEHIND_ENABLED", "true").lower() == "true"
+WRITE_BEHIND_PATH = os.getenv("WRITE_BEHIND_PATH", "entregas_pendientes.db")
+WRITE_BEHIND_BATCH_SIZE = int(os.getenv("WRITE_BEHIND_BATCH_SIZE", "200"))
+WRITE_BEHIND_INTERVAL = float(os.getenv("WRITE_BEHIND_INTERVAL", "0.5"))
+
+# Contenido de las entregas (functions/contenido.py): nivel de compresión
+# zlib (1-9) y cache de contenidos ya descomprimidos
+
+CONTENT_COMPRESSION_LEVEL = int(os.getenv("CONTENT_COMPRESSION_LEVEL", "6"))
+CONTENT_CACHE_SIZE = int(os.getenv("CONTENT_CACHE_SIZE", "2048"))
+CONTENT_CACHE_TTL = float(os.getenv("CONTENT_CACHE_TTL", "3600"))
+
+# Exportación de entregas: filas leídas por consulta
+
+EXPORT_PAGE_SIZE = int(os.getenv("EXPORT_PAGE_SIZE", "500"))
+
+# Recalificación masiva: entregas por lote y lotes en paralelo
+
+REGRADE_BATCH_SIZE = int(os.getenv("REGRADE_BATCH_SIZE", "10"))
+REGRADE_CONCURRENCY = int(os.getenv("REGRADE_CONCURRENCY", "4"))
+
+# Pool de sandboxes Docker (functions/sandbox_pool.py)
+
+SANDBOX_IMAGE = os.getenv("SANDBOX_IMAGE", "edurun-pytest:latest")
+SANDBOX_POOL_SIZE = int(os.getenv("SANDBOX_POOL_SIZE", "4"))
+SANDBOX_MAX_JOBS = int(os.getenv("SANDBOX_MAX_JOBS", "200"))
+SANDBOX_MEMORY = os.getenv("SANDBOX_MEMORY", "256m")
+SANDBOX_CPUS = os.getenv("SANDBOX_CPUS", "1")
+
+# Concurrencia máxima de ejecuciones, tamaño de la cola de admisión y
+# tiempo máximo de espera en ella (segundos)
+
+SANDBOX_MAX_CONCURRENCY = int(os.getenv("SANDBOX_MAX_CONCURRENCY", str(SANDBOX_POOL_SIZE)))
+SANDBOX_MAX_QUEUE = int(os.getenv("SANDBOX_MAX_QUEUE", "100"))
+SANDBOX_QUEUE_TIMEOUT = float(os.getenv("SANDBOX_QUEUE_TIMEOUT", "60"))
+
+# Cada cuántos segundos se hace ping a los sandboxes libres para reemplazar
+# los que no responden (0 lo desactiva)
+
+SANDBOX_HEALTH_INTERVAL = float(os.getenv("SANDBOX_HEALTH_INTERVAL", "30"))
+
+# Ejecución con salida en streaming (/run-code/stream/): bytes máximos de
+# salida por ejecución y eventos en buffer por conexión
+
+STREAM_MAX_BYTES = int(os.getenv("STREAM_MAX_BYTES", str(256 * 1024)))
+STREAM_BUFFER_EVENTS = int(os.getenv("STREAM_BUFFER_EVENTS", "64"))
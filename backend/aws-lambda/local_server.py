@@ -0,0 +1,141 @@
+"""
+Servidor local que reemplaza a API Gateway + Lambda para correr todo el
+flujo de ejecución y calificación sin AWS (pruebas de carga, benchmarks y CI).
+
+Expone los lambda_handler de runCode.lambda.py y runTest.lambda.py en las
+mismas rutas (/CodeRun y /EdurunCodeTestTarea) y con el mismo sobre
+{"statusCode", "body"}, así functions/aws_lambda.py lo usa sin cambios:
+
+    pip install -r ../requirements.txt pytest
+    python local_server.py --port 9000 --concurrency 4 --cold-start 0.5
+    # en backend/app/.env: LAMBDA_API_URL="http://127.0.0.1:9000"
+
+Cada proceso del pool hace de una instancia de la Lambda. La primera
+invocación de cada función en un proceso, o la que llega después de
+--idle-timeout segundos sin uso, espera --cold-start segundos como el
+arranque en frío de AWS. Con --throttle las solicitudes que exceden
+--concurrency se rechazan con 429 en vez de esperar turno.
+"""
+import argparse
+import asyncio
+import importlib.util
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import asynccontextmanager
+from typing import Any, Dict
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+HANDLERS_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Ruta de API Gateway -> archivo del handler
+ROUTES = {
+    "CodeRun": "runCode.lambda.py",
+    "EdurunCodeTestTarea": "runTest.lambda.py",
+}
+
+# Estado de cada proceso del pool (una "instancia" de la Lambda)
+_handlers: Dict[str, Any] = {}
+_last_invocation: Dict[str, float] = {}
+
+
+def _load_handler(file_name):
+    # Los nombres tienen puntos (runCode.lambda.py), no se pueden importar
+    # con import normal
+    module_name = file_name.replace(".", "_")
+    spec = importlib.util.spec_from_file_location(module_name, os.path.join(HANDLERS_DIR, file_name))
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[module_name] = module
+    spec.loader.exec_module(module)
+    return module.lambda_handler
+
+
+def _invoke(file_name, event, cold_start, idle_timeout):
+    """
+    Se ejecuta en un proceso del pool. Retorna (respuesta, arranque_en_frio).
+    """
+    now = time.monotonic()
+    last = _last_invocation.get(file_name)
+    cold = last is None or now - last > idle_timeout
+    if cold:
+        time.sleep(cold_start)
+    if file_name not in _handlers:
+        _handlers[file_name] = _load_handler(file_name)
+    try:
+        response = _handlers[file_name](event, None)
+    finally:
+        _last_invocation[file_name] = time.monotonic()
+    return response, cold
+
+
+def create_app(concurrency=4, cold_start=0.0, idle_timeout=300.0, throttle=False):
+    executor = ProcessPoolExecutor(max_workers=concurrency)
+    slots = asyncio.Semaphore(concurrency)
+    stats = {
+        "invocations": 0,
+        "cold_starts": 0,
+        "throttled": 0,
+        "errors": 0,
+        "in_flight": 0,
+    }
+
+    @asynccontextmanager
+    async def lifespan(app: FastAPI):
+        yield
+        executor.shutdown(cancel_futures=True)
+
+    app = FastAPI(title="Edurun Lambda local", lifespan=lifespan)
+
+    @app.get("/stats")
+    async def get_stats():
+        return {**stats, "concurrency": concurrency, "cold_start": cold_start, "idle_timeout": idle_timeout}
+
+    @app.post("/{function_name}")
+    async def invoke(function_name: str, request: Request):
+        file_name = ROUTES.get(function_name)
+        if file_name is None:
+            return JSONResponse(content={"message": "Missing Authentication Token"}, status_code=403)
+        if throttle and slots.locked():
+            stats["throttled"] += 1
+            return JSONResponse(content={"message": "Rate Exceeded."}, status_code=429)
+
+        # Como API Gateway: el body llega como string dentro del evento
+        event = {"body": (await request.body()).decode("utf-8")}
+        async with slots:
+            stats["in_flight"] += 1
+            try:
+                loop = asyncio.get_running_loop()
+                response, cold = await loop.run_in_executor(executor, _invoke, file_name, event, cold_start, idle_timeout)
+            except Exception:
+                stats["errors"] += 1
+                return JSONResponse(content={"message": "Internal server error"}, status_code=502)
+            finally:
+                stats["in_flight"] -= 1
+
+        stats["invocations"] += 1
+        stats["cold_starts"] += int(cold)
+        return JSONResponse(content=response, headers={"X-Cold-Start": "1" if cold else "0"})
+
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Lambda local para pruebas sin AWS")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9000)
+    parser.add_argument("--concurrency", type=int, default=4, help="instancias (procesos) simultáneas")
+    parser.add_argument("--cold-start", type=float, default=0.0, help="segundos de arranque en frío simulado")
+    parser.add_argument("--idle-timeout", type=float, default=300.0, help="segundos sin uso tras los que una instancia vuelve a estar fría")
+    parser.add_argument("--throttle", action="store_true", help="responder 429 al superar la concurrencia en vez de encolar")
+    args = parser.parse_args()
+
+    app = create_app(args.concurrency, args.cold_start, args.idle_timeout, args.throttle)
+    uvicorn.run(app, host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,57 @@
 import json
 import subprocess
 import tempfile
+import time
 import os
 
+TIMEOUT = 30
+
+
+def _run_measured(path):
+    """
+    Ejecuta el script y espera su término con os.wait4 para obtener los
+    recursos que usó el proceso (CPU, memoria máxima). La salida se escribe
+    en archivos temporales para medir cuántos bytes produjo.
+    Retorna (output, errors, return_code, timeout, recursos).
+    """
+    with tempfile.TemporaryFile() as out, tempfile.TemporaryFile() as err:
+        started = time.monotonic()
+        process = subprocess.Popen(['python3', path], stdout=out, stderr=err, stdin=subprocess.DEVNULL)
+        deadline = started + TIMEOUT
+        timeout = False
+        while True:
+            pid, status, rusage = os.wait4(process.pid, os.WNOHANG)
+            if pid == process.pid:
+                break
+            if time.monotonic() >= deadline:
+                process.kill()
+                _, status, rusage = os.wait4(process.pid, 0)
+                timeout = True
+                break
+            time.sleep(0.005)
+        # El proceso ya se recogió con wait4
+        process.returncode = os.waitstatus_to_exitcode(status)
+
+        out_bytes = out.seek(0, os.SEEK_END)
+        err_bytes = err.seek(0, os.SEEK_END)
+        out.seek(0)
+        err.seek(0)
+        recursos = {
+            "cpu_user": round(rusage.ru_utime, 4),
+            "cpu_system": round(rusage.ru_stime, 4),
+            "max_rss_kb": rusage.ru_maxrss,
+            "wall_time": round(time.monotonic() - started, 4),
+            "output_bytes": out_bytes + err_bytes,
+        }
+        return (
+            out.read().decode('utf-8', errors='replace'),
+            err.read().decode('utf-8', errors='replace'),
+            process.returncode,
+            timeout,
+            recursos,
+        )
+
+
 def lambda_handler(event, context):
     try:
         # Manejo flexible del body para diferentes formatos de event
@@ -52,23 +101,15 @@ def lambda_handler(event, context):
             temp_file.write(code)
             temp_file_path = temp_file.name
         
+        recursos = None
         try:
-            # Ejecutar el código Python
-            result = subprocess.run(
-                ['python3', temp_file_path],
-                capture_output=True,
-                text=True,
-                timeout=30  # Timeout de 30 segundos para evitar ejecuciones infinitas
-            )
-            
-            output = result.stdout
-            errors = result.stderr
-            return_code = result.returncode
+            # Ejecutar el código Python (timeout de 30 segundos para evitar ejecuciones infinitas)
+            output, errors, return_code, timeout, recursos = _run_measured(temp_file_path)
             
-        except subprocess.TimeoutExpired:
-            output = ""
-            errors = "Error: El código excedió el tiempo límite de ejecución (30 segundos)"
-            return_code = 124
+            if timeout:
+                output = ""
+                errors = "Error: El código excedió el tiempo límite de ejecución (30 segundos)"
+                return_code = 124
         
         except Exception as e:
             output = ""
@@ -89,7 +130,8 @@ def lambda_handler(event, context):
                 "errors": errors,
                 "results": {
                     "return_code": return_code
-                }
+                },
+                "recursos": recursos
             })
         }
     
@@ -1,12 +1,481 @@
 import json
+import hashlib
+import resource
 import subprocess
 import os
 import sys
+import time
 import uuid
 import shutil
+import signal
+import tempfile
+import threading
 import io
 from contextlib import redirect_stdout, redirect_stderr
 
+# pytest viene de la layer de la Lambda, que ya está en el path al
+# importar el handler
+import pytest
+
+
+# Tests mínimos por worker para que valga la pena repartir la suite
+MIN_TESTS_PER_WORKER = 4
+
+
+def cpu_limit():
+    """
+    CPUs que puede usar el proceso: el límite del cgroup (--cpus de docker)
+    si lo hay y si no las CPUs asignadas al proceso.
+    """
+    cpus = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else (os.cpu_count() or 1)
+    try:
+        with open("/sys/fs/cgroup/cpu.max") as f:
+            quota, period = f.read().split()
+        if quota != "max":
+            cpus = min(cpus, max(1, int(quota) // int(period)))
+    except (OSError, ValueError):
+        pass
+    return cpus
+
+
+class TestTimeout(BaseException):
+    """
+    Se lanza dentro del test que excede su tiempo límite. Hereda de
+    BaseException para que un `except Exception` del alumno no la atrape.
+    """
+
+
+class FormatterPlugin:
+    """
+    Plugin de Pytest para capturar resultados y formatear
+    la salida según los requisitos.
+    """
+    def __init__(self, test_timeout=None, fail_fast=False, workers=1):
+        self.passed = 0
+        self.failed = 0
+        self.total = 0
+        self.tests = []
+        self.collection_error_messages = []
+        # Tiempo límite por test en segundos (None: sin límite). Se aplica
+        # con SIGALRM, que solo se puede usar desde el hilo principal
+        self.test_timeout = test_timeout if threading.current_thread() is threading.main_thread() else None
+        self.fail_fast = fail_fast
+        self.timed_out = set()
+        self._current = None
+        # Procesos entre los que se reparten los tests (ver pytest_runtestloop)
+        self.workers = max(1, min(workers or 1, cpu_limit()))
+        self.used_workers = 1
+
+    def pytest_collectreport(self, report):
+        """
+        Hook #1: Se llama cuando pytest intenta 'recolectar' (importar)
+        un archivo de test.
+        """
+        if report.failed:
+            error_text = str(report.longrepr)
+            import_error_prefix = "ImportError: cannot import name '"
+
+            if import_error_prefix in error_text:
+                try:
+                    start_index = error_text.find(import_error_prefix) + len(import_error_prefix)
+                    end_index = error_text.find("'", start_index)
+
+                    if end_index != -1:
+                        function_name = error_text[start_index:end_index]
+                        self.collection_error_messages.append(f"No se encuentra la función '{function_name}' en el código")
+                    else:
+                        self.collection_error_messages.append(f"Error de importación: {error_text.splitlines()[-1]}")  
+                except Exception:
+                    self.collection_error_messages.append(f"Error de importación: {error_text.splitlines()[-1]}")
+            else:
+                self.collection_error_messages.append(f"Se ha encontrado el siguiente error en el codigo, porfavor corregir antes de correr los tests: {error_text.splitlines()[-1]}")
+
+    def pytest_collection_finish(self, session):
+        """
+        Hook #3: Se llama después de que pytest ha terminado de 
+        encontrar todos los tests.
+        """
+        # Guardamos el número total de tests que encontró
+        self.total = len(session.items)
+
+    @pytest.hookimpl(tryfirst=True)
+    def pytest_runtestloop(self, session):
+        """
+        Con más de un worker reparte los tests en bloques contiguos entre
+        procesos forkeados y junta sus resultados en el orden de
+        recolección. Con fail-fast, errores de recolección o suites chicas
+        se deja el ciclo normal (secuencial) de pytest.
+        """
+        items = session.items
+        workers = min(self.workers, len(items) // MIN_TESTS_PER_WORKER)
+        if workers < 2 or self.fail_fast or session.testsfailed or session.config.option.collectonly:
+            return None
+
+        chunks = [items[i * len(items) // workers:(i + 1) * len(items) // workers] for i in range(workers)]
+        running = []
+        for chunk in chunks:
+            output = tempfile.TemporaryFile("w+")
+            pid = os.fork()
+            if pid == 0:
+                self._run_chunk(chunk, output)
+            running.append((pid, chunk, output))
+
+        tests = []
+        timed_out = set()
+        for pid, chunk, output in running:
+            os.waitpid(pid, 0)
+            output.seek(0)
+            entries = {entry["id"]: entry for entry in map(json.loads, output.read().splitlines())}
+            output.close()
+            for item in chunk:
+                test_name = item.nodeid.removeprefix("test_code.py::")
+                # Si el proceso murió (os._exit, memoria) sus tests pendientes fallan
+                entry = entries.get(test_name) or {
+                    "id": test_name,
+                    "outcome": "failed",
+                    "duration": 0.0,
+                    "message": f"{test_name} -> [Error]: el test terminó el proceso que lo ejecutaba",
+                    "timeout": False,
+                }
+                if entry["timeout"]:
+                    timed_out.add(item.nodeid)
+                tests.append(entry)
+
+        self.tests = tests
+        self.passed = sum(1 for test in tests if test["outcome"] == "passed")
+        self.failed = sum(1 for test in tests if test["outcome"] == "failed")
+        self.timed_out = timed_out
+        self.used_workers = workers
+        session.testsfailed = self.failed
+        return True
+
+    def _run_chunk(self, items, output):
+        """
+        Código de cada worker forkeado: ejecuta sus tests y escribe una
+        línea JSON por resultado, así lo ya ejecutado se conserva aunque
+        el proceso muera. Nunca retorna.
+        """
+        code = 1
+        try:
+            self.tests = []
+            for index, item in enumerate(items):
+                nextitem = items[index + 1] if index + 1 < len(items) else None
+                item.config.hook.pytest_runtest_protocol(item=item, nextitem=nextitem)
+                for entry in self.tests:
+                    output.write(json.dumps(entry) + "\n")
+                output.flush()
+                self.tests = []
+            code = 0
+        finally:
+            os._exit(code)
+
+    def _on_alarm(self, signum, frame):
+        # Fuera de un test (la alarma llegó justo al terminar) no se hace nada
+        if self._current is not None:
+            self.timed_out.add(self._current)
+            raise TestTimeout(f"El test excedió el tiempo límite de {self.test_timeout} s")
+
+    @pytest.hookimpl(hookwrapper=True)
+    def pytest_runtest_call(self, item):
+        """
+        Limita el tiempo de cada test. Si el código del alumno atrapa la
+        excepción y sigue, la alarma se repite cada 0.1 s hasta que el
+        test termina.
+        """
+        if not self.test_timeout:
+            yield
+            return
+        previous = signal.signal(signal.SIGALRM, self._on_alarm)
+        self._current = item.nodeid
+        signal.setitimer(signal.ITIMER_REAL, self.test_timeout, 0.1)
+        try:
+            yield
+        finally:
+            self._current = None
+            signal.setitimer(signal.ITIMER_REAL, 0)
+            signal.signal(signal.SIGALRM, previous)
+
+    def pytest_runtest_logreport(self, report):
+        """
+        Hook #2: Se llama después de que un test se ejecuta.
+        """
+        if report.when == 'call':
+            test_name = report.nodeid.removeprefix("test_code.py::")
+            entry = {
+                "id": test_name,
+                "outcome": report.outcome,
+                "duration": round(report.duration, 6),
+                "message": None,
+                "timeout": report.nodeid in self.timed_out,
+            }
+            if report.passed:
+                self.passed += 1
+            elif report.failed:
+                self.failed += 1
+                
+                error_text = str(report.longrepr)
+                name_error_prefix = "NameError: name '"
+                if entry["timeout"]:
+                    entry["message"] = f"{test_name} -> [Tiempo límite excedido]: el test tardó más de {self.test_timeout} s"
+                elif name_error_prefix in error_text:
+                    try:
+                        start = error_text.find(name_error_prefix) + len(name_error_prefix)
+                        end = error_text.find("'", start)
+                        name = error_text[start:end]
+
+                        entry["message"] = f"{test_name} -> [Test no implementado correctamente]: La funcion '{name}' no existe. Porfavor contacte con su docente."
+                    except Exception:
+                        entry["message"] = f"{report.nodeid} (Error: NameError no parseable)"
+                else:
+                    entry["message"] = test_name
+            self.tests.append(entry)
+
+    @property
+    def failed_test_names(self):
+        return [test["message"] for test in self.tests if test["outcome"] == "failed"]
+
+    def result(self):
+        """
+        Registro estructurado de la ejecución: conteos, puntaje, resultado
+        y duración de cada test y errores de recolección.
+        """
+        return {
+            "passed": self.passed,
+            "failed": self.failed,
+            "total": self.total,
+            "score": int(self.passed / self.total * 100) if self.total > 0 else 0,
+            "tests": self.tests,
+            "collection_errors": self.collection_error_messages,
+            "timeouts": len(self.timed_out),
+            "workers": self.used_workers,
+            # Con fail-fast los tests que siguen al primer fallo no se ejecutan
+            "fail_fast": self.fail_fast,
+            "not_run": self.total - self.passed - self.failed if self.fail_fast else 0,
+        }
+
+
+def render_output(result):
+    """
+    Texto para el alumno construido a partir del registro de resultado.
+    """
+    output_lines = []
+    
+    if result["collection_errors"]:
+        output_lines.append("\n[Errores encontrados al verificar el código]")
+        for message in result["collection_errors"]:
+            output_lines.append(f"  > {message}")
+    elif result["total"] == 0:
+        output_lines.append("\n[ADVERTENCIA]: No se han programado tests para esta actividad.")
+    else:
+        output_lines.append(f"\nTests Superados: {result['passed']}")
+        output_lines.append(f"Tests no superados: {result['failed']}")
+        output_lines.append(f"Tests Totales: {result['total']}")
+        if result.get("not_run"):
+            output_lines.append(f"Tests no ejecutados (se detuvo en el primer fallo): {result['not_run']}")
+        
+        failed_test_names = [test["message"] for test in result["tests"] if test["outcome"] == "failed"]
+        if failed_test_names:
+            output_lines.append("\nTests que no pasaron:")
+            for name in failed_test_names:
+                output_lines.append(f"  - {name}")
+        
+        output_lines.append(f"\nPuntaje obtenido: {result['score']}%")
+    
+    return "\n".join(output_lines)
+
+# Crear instancia del plugin
+plugin = FormatterPlugin()
+
+# Capturar la salida de pytest
+output_buffer = io.StringIO()
+
+
+def _clear_submission_modules():
+    # Limpiar cualquier módulo previamente importado que pueda interferir
+    # Esto es importante porque Lambda reutiliza el entorno
+    modules_to_remove = [mod for mod in sys.modules.keys() if mod.startswith('app') or mod.startswith('test_code')]
+    for mod in modules_to_remove:
+        try:
+            del sys.modules[mod]
+        except:
+            pass
+
+
+SUITES_DIR = os.path.join('/tmp', 'suites')
+
+
+def _get_suite_dir(test):
+    """
+    Directorio del test según el hash de su contenido. Se conserva entre
+    invocaciones para que pytest reutilice el bytecode ya reescrito del
+    test en vez de volver a compilarlo en cada ejecución.
+    """
+    suite_dir = os.path.join(SUITES_DIR, hashlib.sha256(test.encode('utf-8')).hexdigest())
+    if not os.path.exists(os.path.join(suite_dir, 'test_code.py')):
+        tmp_dir = f"{suite_dir}.{uuid.uuid4().hex}"
+        os.makedirs(tmp_dir)
+        with open(os.path.join(tmp_dir, 'test_code.py'), 'w') as test_file:
+            test_file.write(test)
+        try:
+            os.rename(tmp_dir, suite_dir)
+        except OSError:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+    return suite_dir
+
+
+def _reset_peak_rss():
+    # Reinicia el máximo de memoria residente (VmHWM) del proceso para
+    # medir solo esta ejecución. Si el kernel no lo permite se informa el
+    # máximo desde el inicio del proceso
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+    except OSError:
+        pass
+
+
+def _peak_rss_kb():
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def _run_pytest(test_file_path, test_timeout=None, fail_fast=False, workers=1):
+    """
+    Ejecuta pytest sobre el archivo de test indicado (el código del alumno
+    debe estar en el directorio actual) y retorna
+    (output, errors, return_code, result, recursos). pytest corre en este
+    mismo proceso, así que los recursos se miden como diferencia del
+    uso del proceso (y de los workers forkeados) antes y después.
+    """
+    # Crear instancia del plugin
+    plugin = FormatterPlugin(test_timeout, fail_fast, workers)
+    
+    # Capturar la salida de pytest
+    output_buffer = io.StringIO()
+    
+    _reset_peak_rss()
+    usage_before = resource.getrusage(resource.RUSAGE_SELF)
+    children_before = resource.getrusage(resource.RUSAGE_CHILDREN)
+    started = time.monotonic()
+    try:
+        with redirect_stdout(output_buffer), redirect_stderr(output_buffer):
+            # Ejecutar pytest sin buscar en otros directorios
+            pytest.main([
+                test_file_path,
+                f'--rootdir={os.path.dirname(test_file_path)}',
+                '-v',
+                '--tb=short',  # Traceback corto
+                '-p', 'no:cacheprovider',  # Desactivar caché de pytest
+                '--override-ini=python_files=test_code.py',  # Solo este archivo
+                '--override-ini=python_classes=',  # No buscar clases
+                '--override-ini=python_functions=test_*',  # Solo funciones test_*
+                *(['-x'] if fail_fast else [])  # Detenerse en el primer fallo
+            ], plugins=[plugin])
+        
+        result = plugin.result()
+        
+        # Construir la salida formateada a partir del registro
+        output = render_output(result)
+        if result["collection_errors"]:
+            return_code = 1
+        elif result["total"] == 0:
+            return_code = 2
+        else:
+            return_code = 0 if result["failed"] == 0 else 1
+        
+        errors = ""
+        
+    except Exception as e:
+        result = None
+        output = ""
+        errors = f"Error al ejecutar pytest: {str(e)}"
+        return_code = 1
+
+    usage_after = resource.getrusage(resource.RUSAGE_SELF)
+    children_after = resource.getrusage(resource.RUSAGE_CHILDREN)
+    peak_rss_kb = _peak_rss_kb()
+    if plugin.used_workers > 1:
+        peak_rss_kb = max(peak_rss_kb, children_after.ru_maxrss)
+    recursos = {
+        "cpu_user": round(
+            usage_after.ru_utime - usage_before.ru_utime + children_after.ru_utime - children_before.ru_utime, 4
+        ),
+        "cpu_system": round(
+            usage_after.ru_stime - usage_before.ru_stime + children_after.ru_stime - children_before.ru_stime, 4
+        ),
+        "max_rss_kb": peak_rss_kb,
+        "wall_time": round(time.monotonic() - started, 4),
+        "output_bytes": len(output_buffer.getvalue().encode('utf-8')),
+    }
+    return output, errors, return_code, result, recursos
+
+
+def _run_submissions(codes, test, test_timeout=None, fail_fast=False, workers=1):
+    """
+    Ejecuta el mismo test contra una lista de códigos. pytest se importa una
+    sola vez para todo el lote y el test compilado se reutiliza; cada código
+    se escribe en su propio directorio y se limpian los módulos entre uno y otro.
+    """
+    # Crear un directorio único para esta ejecución
+    execution_id = str(uuid.uuid4())
+    work_dir = os.path.join('/tmp', f'execution_{execution_id}')
+    os.makedirs(work_dir, exist_ok=True)
+    
+    # Guardar el directorio de trabajo actual
+    original_cwd = os.getcwd()
+    
+    # Permitir que pytest guarde el bytecode del test en el directorio del
+    # test; el de app.py queda en el directorio de cada entrega
+    previous_dont_write_bytecode = sys.dont_write_bytecode
+    sys.dont_write_bytecode = False
+    
+    results = []
+    try:
+        test_file_path = os.path.join(_get_suite_dir(test), 'test_code.py')
+        
+        for index, code in enumerate(codes):
+            # Cada código en su propio directorio para que el bytecode de
+            # app.py de una entrega nunca se confunda con el de otra
+            code_dir = os.path.join(work_dir, str(index))
+            os.makedirs(code_dir)
+            
+            # Escribir el código del usuario
+            with open(os.path.join(code_dir, 'app.py'), 'w') as app_file:
+                app_file.write(code)
+            
+            # Cambiar al directorio de trabajo y agregarlo al path
+            os.chdir(code_dir)
+            sys.path.insert(0, code_dir)
+            
+            _clear_submission_modules()
+            try:
+                results.append(_run_pytest(test_file_path, test_timeout, fail_fast, workers))
+            finally:
+                sys.path.remove(code_dir)
+    
+    finally:
+        # Restaurar sys.dont_write_bytecode
+        sys.dont_write_bytecode = previous_dont_write_bytecode
+        
+        # Restaurar el directorio de trabajo original
+        os.chdir(original_cwd)
+        
+        # Limpiar módulos importados de esta ejecución
+        _clear_submission_modules()
+        
+        # Limpiar todo el directorio de ejecución
+        if os.path.exists(work_dir):
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    return results
+
+
 def lambda_handler(event, context):
     try:
         # Manejo flexible del body para diferentes formatos de event
@@ -28,7 +497,7 @@ def lambda_handler(event, context):
                         })
                     }
         # Caso 2: event es directamente el body (invocación directa)
-        elif 'code' in event and 'test' in event:
+        elif ('code' in event or 'codes' in event) and 'test' in event:
             body = event
         # Caso 3: body vacío
         else:
@@ -36,8 +505,14 @@ def lambda_handler(event, context):
     
         code = body.get('code', '') if body else ''
         test = body.get('test', '') if body else ''
+        codes = body.get('codes') if body else None
+        # Límite por test (segundos) y modo fail-fast para las prácticas
+        test_timeout = body.get('test_timeout') if body else None
+        fail_fast = bool(body.get('fail_fast')) if body else False
+        # Procesos entre los que se reparten los tests (acotado por las vCPU)
+        workers = int(body.get('test_workers') or 1) if body else 1
         
-        if not code:
+        if not code and not codes:
             return {
                 "statusCode": 400,
                 "body": json.dumps({
@@ -57,190 +532,27 @@ def lambda_handler(event, context):
                 })
             }
         
-        # Crear un directorio único para esta ejecución
-        execution_id = str(uuid.uuid4())
-        work_dir = os.path.join('/tmp', f'execution_{execution_id}')
-        os.makedirs(work_dir, exist_ok=True)
-        
-        # Guardar el directorio de trabajo actual
-        original_cwd = os.getcwd()
-        
-        try:
-            # Crear archivos con nombres específicos directamente
-            app_file_path = os.path.join(work_dir, 'app.py')
-            test_file_path = os.path.join(work_dir, 'test_code.py')
-            
-            # Escribir el código del usuario
-            with open(app_file_path, 'w') as app_file:
-                app_file.write(code)
-            
-            # Escribir el test
-            with open(test_file_path, 'w') as test_file:
-                test_file.write(test)
-            
-            # Cambiar al directorio de trabajo
-            os.chdir(work_dir)
-            
-            # Agregar el directorio de trabajo al path
-            sys.path.insert(0, work_dir)
-            
-            # Limpiar cualquier módulo previamente importado que pueda interferir
-            # Esto es importante porque Lambda reutiliza el entorno
-            modules_to_remove = [mod for mod in sys.modules.keys() if mod.startswith('app') or mod.startswith('test_code')]
-            for mod in modules_to_remove:
-                del sys.modules[mod]
-            
-            # Desactivar la escritura de archivos .pyc
-            sys.dont_write_bytecode = True
-            
-            # Importar pytest aquí para asegurar que se use la versión de la layer
-            import pytest
-            
-            # Definir el plugin de pytest
-            class FormatterPlugin:
-                """
-                Plugin de Pytest para capturar resultados y formatear
-                la salida según los requisitos.
-                """
-                def __init__(self):
-                    self.passed = 0
-                    self.failed = 0
-                    self.total = 0
-                    self.failed_test_names = []
-                    self.collection_error_messages = []
-
-                def pytest_collectreport(self, report):
-                    """
-                    Hook #1: Se llama cuando pytest intenta 'recolectar' (importar)
-                    un archivo de test.
-                    """
-                    if report.failed:
-                        error_text = str(report.longrepr)
-                        import_error_prefix = "ImportError: cannot import name '"
-                        
-                        if import_error_prefix in error_text:
-                            try:
-                                start_index = error_text.find(import_error_prefix) + len(import_error_prefix)
-                                end_index = error_text.find("'", start_index)
-                                    
-                                if end_index != -1:
-                                    function_name = error_text[start_index:end_index]
-                                    self.collection_error_messages.append(f"No se encuentra la función '{function_name}' en el código")
-                                else:
-                                    self.collection_error_messages.append(f"Error de importación: {error_text.splitlines()[-1]}")  
-                            except Exception:
-                                self.collection_error_messages.append(f"Error de importación: {error_text.splitlines()[-1]}")
-                        else:
-                            self.collection_error_messages.append(f"Se ha encontrado el siguiente error en el codigo, porfavor corregir antes de correr los tests: {error_text.splitlines()[-1]}")
-
-                def pytest_collection_finish(self, session):
-                    """
-                    Hook #3: Se llama después de que pytest ha terminado de 
-                    encontrar todos los tests.
-                    """
-                    # Guardamos el número total de tests que encontró
-                    self.total = len(session.items)
-
-                def pytest_runtest_logreport(self, report):
-                    """
-                    Hook #2: Se llama después de que un test se ejecuta.
-                    """
-                    if report.when == 'call':
-                        if report.passed:
-                            self.passed += 1
-                        elif report.failed:
-                            self.failed += 1
-                            test_name = report.nodeid.removeprefix("test_code.py::")
-                            
-                            error_text = str(report.longrepr)
-                            name_error_prefix = "NameError: name '"
-                            if name_error_prefix in error_text:
-                                try:
-                                    start = error_text.find(name_error_prefix) + len(name_error_prefix)
-                                    end = error_text.find("'", start)
-                                    name = error_text[start:end]
-
-                                    message = f"{test_name} -> [Test no implementado correctamente]: La funcion '{name}' no existe. Porfavor contacte con su docente."
-                                    self.failed_test_names.append(message)
-                                except Exception:
-                                    self.failed_test_names.append(f"{report.nodeid} (Error: NameError no parseable)")
-                            else:
-                                self.failed_test_names.append(test_name)
-            
-            # Crear instancia del plugin
-            plugin = FormatterPlugin()
-            
-            # Capturar la salida de pytest
-            output_buffer = io.StringIO()
-            
-            try:
-                with redirect_stdout(output_buffer), redirect_stderr(output_buffer):
-                    # Ejecutar pytest sin buscar en otros directorios
-                    pytest.main([
-                        'test_code.py',
-                        '-v',
-                        '--tb=short',  # Traceback corto
-                        '-p', 'no:cacheprovider',  # Desactivar caché de pytest
-                        '--override-ini=python_files=test_code.py',  # Solo este archivo
-                        '--override-ini=python_classes=',  # No buscar clases
-                        '--override-ini=python_functions=test_*'  # Solo funciones test_*
-                    ], plugins=[plugin])
-                
-                # Construir la salida formateada
-                output_lines = []
-                
-                if plugin.collection_error_messages:
-                    output_lines.append("\n[Errores encontrados al verificar el código]")
-                    for message in plugin.collection_error_messages:
-                        output_lines.append(f"  > {message}")
-                    output = "\n".join(output_lines)
-                    return_code = 1
-                elif plugin.total == 0:
-                    output = "\n[ADVERTENCIA]: No se han programado tests para esta actividad."
-                    return_code = 2
-                else:
-                    output_lines.append(f"\nTests Superados: {plugin.passed}")
-                    output_lines.append(f"Tests no superados: {plugin.failed}")
-                    output_lines.append(f"Tests Totales: {plugin.total}")
-                    
-                    if plugin.failed_test_names:
-                        output_lines.append("\nTests que no pasaron:")
-                        for name in plugin.failed_test_names:
-                            output_lines.append(f"  - {name}")
-                    
-                    output_lines.append(f"\nPuntaje obtenido: {int(plugin.passed / plugin.total * 100)}%")
-                    output = "\n".join(output_lines)
-                    return_code = 0 if plugin.failed == 0 else 1
-                
-                errors = ""
-                
-            except Exception as e:
-                output = ""
-                errors = f"Error al ejecutar pytest: {str(e)}"
-                return_code = 1
+        # Modo lote: {"test": ..., "codes": [{"id": ..., "code": ...}, ...]}
+        if codes:
+            results = _run_submissions([item.get('code', '') for item in codes], test, test_timeout, fail_fast, workers)
+            return {
+                "statusCode": 200,
+                "body": json.dumps({
+                    "resultados": [
+                        {
+                            "id": item.get('id'),
+                            "stdout": output,
+                            "stderr": errors,
+                            "return_code": return_code,
+                            "resultado": result,
+                            "recursos": recursos
+                        }
+                        for item, (output, errors, return_code, result, recursos) in zip(codes, results)
+                    ]
+                })
+            }
         
-        finally:
-            # Restaurar sys.dont_write_bytecode
-            sys.dont_write_bytecode = False
-            
-            # Restaurar el directorio de trabajo original
-            os.chdir(original_cwd)
-            
-            # Limpiar el path
-            if work_dir in sys.path:
-                sys.path.remove(work_dir)
-            
-            # Limpiar módulos importados de esta ejecución
-            modules_to_remove = [mod for mod in sys.modules.keys() if mod.startswith('app') or mod.startswith('test_code')]
-            for mod in modules_to_remove:
-                try:
-                    del sys.modules[mod]
-                except:
-                    pass
-            
-            # Limpiar todo el directorio de ejecución
-            if os.path.exists(work_dir):
-                shutil.rmtree(work_dir, ignore_errors=True)
+        output, errors, return_code, result, recursos = _run_submissions([code], test, test_timeout, fail_fast, workers)[0]
         
         # Determinar el statusCode basado en el resultado de la ejecución
         status_code = 200 if return_code == 0 else 400
@@ -250,7 +562,9 @@ def lambda_handler(event, context):
             "body": json.dumps({
                 "stdout": output,
                 "stderr": errors,
-                "return_code": return_code
+                "return_code": return_code,
+                "resultado": result,
+                "recursos": recursos
             })
         }
     
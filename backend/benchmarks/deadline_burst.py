@@ -0,0 +1,330 @@
+"""
+Benchmark de la API con el tráfico del cierre de una evaluación.
+
+Cada alumno simulado hace lo que hace un alumno al acercarse la fecha
+límite: lanzamiento LTI, listado de tareas y evaluaciones (y su
+revalidación con ETag), algunas ejecuciones de práctica en
+/run-tarea-test/, el envío a /send-code/ y el registro de la entrega en
+/evaluacion/entrega/. Los alumnos llegan cada vez más seguido hasta el
+final de la ventana (--ramp), como en un cierre real.
+
+La app de main.py corre en este mismo proceso (httpx + ASGI, con su
+lifespan y middlewares) sobre reemplazos locales de Supabase y del
+ejecutor (ver fakes.py), así que no hace falta red, base de datos ni AWS.
+Con --executor lambda-local las ejecuciones pasan por los handlers reales
+de backend/aws-lambda (local_server.py) y pytest de verdad.
+
+Uso, desde backend/:
+
+    python benchmarks/deadline_burst.py --students 300 --concurrency 64
+    python benchmarks/deadline_burst.py --executor lambda-local --students 50
+    python benchmarks/deadline_burst.py --json actual.json --baseline anterior.json
+
+Reporta por ruta solicitudes, errores, throughput y latencias p50/p95/p99.
+Con --baseline termina con código 1 si el p95 o p99 de alguna ruta empeoró
+más de --max-regression respecto del resultado guardado.
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from typing import Any, Dict, List
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+BACKEND_DIR = os.path.dirname(BENCHMARKS_DIR)
+APP_DIR = os.path.join(BACKEND_DIR, "app")
+LAMBDA_DIR = os.path.join(BACKEND_DIR, "aws-lambda")
+
+COURSE_ID_LMS = "curso-benchmark"
+PLATFORM_GUID = "plataforma-benchmark"
+
+TEST = """from app import resolver
+
+def test_suma():
+    assert resolver(2, 3) == 5
+
+def test_negativos():
+    assert resolver(-1, -1) == -2
+
+def test_cero():
+    assert resolver(0, 0) == 0
+"""
+# La plantilla que reenvían muchos alumnos sin cambios (aciertos de cache)
+TEMPLATE_CODE = "def resolver(a, b):\n    pass\n"
+
+
+def _configure_environment(work_dir: str):
+    # Antes de importar settings: sin base real, cola local en un directorio
+    # temporal y el cliente de la Lambda apuntando al reemplazo local
+    os.environ.update({
+        "DATABASE_URL": "postgresql://benchmark@localhost/benchmark",
+        "WRITE_BEHIND_ENABLED": "true",
+        "WRITE_BEHIND_PATH": os.path.join(work_dir, "entregas_pendientes.db"),
+        "EXECUTORS": "lambda",
+        "LAMBDA_API_URL": "http://lambda-local",
+        "LAMBDA_HTTP2": "false",
+    })
+    sys.path.insert(0, APP_DIR)
+    sys.path.insert(0, BENCHMARKS_DIR)
+
+
+def _setup_executor(args):
+    import httpx
+    from functions import aws_lambda, ejecutores
+    from fakes import SimulatedExecutor
+
+    if args.executor == "simulado":
+        ejecutores._router = ejecutores.ExecutorRouter([SimulatedExecutor(args.executor_latency)])
+        return
+    # Import normal (no por ruta) para que el pool de procesos del
+    # servidor pueda serializar sus funciones
+    sys.path.insert(0, LAMBDA_DIR)
+    import local_server
+    lambda_app = local_server.create_app(args.lambda_concurrency, args.cold_start)
+    # El cliente compartido de functions/aws_lambda.py, sin cambios en el
+    # resto del módulo
+    aws_lambda._client = httpx.AsyncClient(
+        transport=httpx.ASGITransport(app=lambda_app),
+        base_url="http://lambda-local",
+    )
+    ejecutores._router = ejecutores.ExecutorRouter([ejecutores.LambdaExecutor()])
+
+
+def percentile(values: List[float], p: float) -> float:
+    # Percentil por rango más cercano
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(p / 100 * len(ordered)) - 1)]
+
+
+class Recorder:
+    def __init__(self, concurrency: int):
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.errors: Dict[str, int] = defaultdict(int)
+        self.statuses: Dict[str, Dict[int, int]] = defaultdict(lambda: defaultdict(int))
+        self._slots = asyncio.Semaphore(concurrency)
+
+    async def call(self, route: str, request):
+        """
+        Ejecuta la solicitud (una corrutina de httpx) respetando la
+        concurrencia máxima y registra su latencia bajo `route`.
+        """
+        async with self._slots:
+            started = time.perf_counter()
+            try:
+                response = await request
+            except Exception:
+                self.latencies[route].append(time.perf_counter() - started)
+                self.errors[route] += 1
+                return None
+            self.latencies[route].append(time.perf_counter() - started)
+        self.statuses[route][response.status_code] += 1
+        if response.status_code >= 500:
+            self.errors[route] += 1
+        return response
+
+    def summary(self, elapsed: float) -> Dict[str, Dict[str, Any]]:
+        result = {}
+        for route, values in sorted(self.latencies.items()):
+            result[route] = {
+                "solicitudes": len(values),
+                "errores": self.errors[route],
+                "estados": dict(self.statuses[route]),
+                "rps": round(len(values) / elapsed, 2),
+                "p50": round(percentile(values, 50) * 1000, 2),
+                "p95": round(percentile(values, 95) * 1000, 2),
+                "p99": round(percentile(values, 99) * 1000, 2),
+                "max": round(max(values) * 1000, 2),
+            }
+        return result
+
+
+def _student_code(rng: random.Random, student: int, attempt: int, correct: bool, repeat_ratio: float) -> str:
+    if rng.random() < repeat_ratio:
+        return TEMPLATE_CODE
+    body = "return a + b  # correcto" if correct else "return a - b"
+    return f"# alumno {student}, intento {attempt}\ndef resolver(a, b):\n    {body}\n"
+
+
+async def _think(rng: random.Random, think: float):
+    if think:
+        await asyncio.sleep(rng.uniform(0, think))
+
+
+async def _student(client, recorder: Recorder, student: int, start_at: float, tareas, evaluaciones, args):
+    rng = random.Random(args.seed * 100003 + student)
+    await asyncio.sleep(start_at)
+    user_id = f"alumno-{student}"
+
+    await recorder.call("POST /lti/register_instance/", client.post("/lti/register_instance/", json={
+        "usuario": {"id_lms": user_id, "nombre": f"Alumno {student}"},
+        "curso": {"nombre": "Curso benchmark", "id_curso_lms": COURSE_ID_LMS, "id_plataforma": 1},
+        "plataforma": {"guid": PLATFORM_GUID, "nombre": "LMS benchmark"},
+    }))
+
+    etags = {}
+    for kind in ("tareas", "evaluaciones"):
+        response = await recorder.call(
+            f"GET /api/{kind}/{{course_id_lms}}", client.get(f"/api/{kind}/{COURSE_ID_LMS}")
+        )
+        if response is not None:
+            etags[kind] = response.headers.get("etag")
+
+    for attempt in range(args.practice_runs):
+        await _think(rng, args.think)
+        code = _student_code(rng, student, attempt, attempt == args.practice_runs - 1, args.repeat_ratio)
+        await recorder.call("POST /api/run-tarea-test/", client.post("/api/run-tarea-test/", data={
+            "code": code,
+            "tarea_id": rng.choice(tareas),
+        }))
+        # Al volver a la lista el navegador revalida con el ETag
+        kind = rng.choice(("tareas", "evaluaciones"))
+        headers = {"If-None-Match": etags[kind]} if etags.get(kind) else {}
+        await recorder.call(
+            f"GET /api/{kind}/{{course_id_lms}}", client.get(f"/api/{kind}/{COURSE_ID_LMS}", headers=headers)
+        )
+
+    await _think(rng, args.think)
+    evaluacion_id = rng.choice(evaluaciones)
+    code = _student_code(rng, student, args.practice_runs, True, 0.0)
+    response = await recorder.call("POST /api/send-code/", client.post("/api/send-code/", data={
+        "code": code,
+        "evaluacion_id": evaluacion_id,
+    }))
+    result = response.json() if response is not None and response.status_code == 200 else {}
+
+    await recorder.call("POST /api/evaluacion/entrega/", client.post("/api/evaluacion/entrega/", json={
+        "id_evaluacion": evaluacion_id,
+        "id_alumno": user_id,
+        "nota": result.get("score", 0),
+        "codigo": code,
+        "detalles": {"salida": result.get("stdout", ""), "resultado": result.get("resultado")},
+    }))
+
+
+async def run_benchmark(args) -> Dict[str, Any]:
+    import httpx
+    from fakes import FakeDatabase
+
+    db = FakeDatabase(args.db_latency)
+    db.install()
+    tareas = [db.add_activity("tarea", COURSE_ID_LMS, f"Tarea {i}", TEST) for i in range(1, args.activities + 1)]
+    evaluaciones = [db.add_activity("evaluacion", COURSE_ID_LMS, f"Evaluación {i}", TEST) for i in range(1, args.activities + 1)]
+    _setup_executor(args)
+
+    import main
+    from functions.entregas_pendientes import flush_pending
+
+    recorder = Recorder(args.concurrency)
+    rng = random.Random(args.seed)
+    # Densidad de llegadas creciente hacia la fecha límite (CDF t²)
+    starts = sorted(args.ramp * math.sqrt(rng.random()) for _ in range(args.students))
+
+    async with main.app.router.lifespan_context(main.app):
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://edurun", timeout=None) as client:
+            started = time.perf_counter()
+            await asyncio.gather(*[
+                _student(client, recorder, student, start_at, tareas, evaluaciones, args)
+                for student, start_at in enumerate(starts)
+            ])
+            elapsed = time.perf_counter() - started
+        # Lo que quedó en la cola local se escribe antes de cerrar
+        while await flush_pending():
+            pass
+
+    return {
+        "configuracion": {
+            key: getattr(args, key)
+            for key in ("students", "concurrency", "ramp", "practice_runs", "executor", "executor_latency", "db_latency", "repeat_ratio", "seed")
+        },
+        "duracion_segundos": round(elapsed, 3),
+        "solicitudes": sum(len(values) for values in recorder.latencies.values()),
+        "rps": round(sum(len(values) for values in recorder.latencies.values()) / elapsed, 2),
+        "consultas_db": db.queries,
+        "entregas_guardadas": len(db.entregas),
+        "rutas": recorder.summary(elapsed),
+    }
+
+
+def print_report(report: Dict[str, Any]):
+    print(f"\n{report['solicitudes']} solicitudes en {report['duracion_segundos']} s "
+          f"({report['rps']} req/s), {report['consultas_db']} consultas a la base, "
+          f"{report['entregas_guardadas']} entregas guardadas\n")
+    header = f"{'ruta':<40} {'n':>6} {'err':>5} {'req/s':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'máx ms':>9}"
+    print(header)
+    print("-" * len(header))
+    for route, stats in report["rutas"].items():
+        print(f"{route:<40} {stats['solicitudes']:>6} {stats['errores']:>5} {stats['rps']:>8} "
+              f"{stats['p50']:>9} {stats['p95']:>9} {stats['p99']:>9} {stats['max']:>9}")
+
+
+def compare_with_baseline(report: Dict[str, Any], baseline: Dict[str, Any], max_regression: float) -> List[str]:
+    """
+    Rutas cuyo p95 o p99 empeoró más de `max_regression` (fracción)
+    respecto del baseline, o que ahora tienen errores.
+    """
+    regressions = []
+    for route, stats in report["rutas"].items():
+        previous = baseline.get("rutas", {}).get(route)
+        if not previous:
+            continue
+        for key in ("p95", "p99"):
+            if previous[key] and stats[key] > previous[key] * (1 + max_regression):
+                regressions.append(f"{route}: {key} {previous[key]} ms -> {stats[key]} ms")
+        if stats["errores"] > previous.get("errores", 0):
+            regressions.append(f"{route}: errores {previous.get('errores', 0)} -> {stats['errores']}")
+    return regressions
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark de la API con tráfico de cierre de evaluación")
+    parser.add_argument("--students", type=int, default=200, help="alumnos simulados")
+    parser.add_argument("--concurrency", type=int, default=64, help="solicitudes simultáneas máximas")
+    parser.add_argument("--ramp", type=float, default=10.0, help="segundos en los que llegan los alumnos")
+    parser.add_argument("--practice-runs", type=int, default=3, help="ejecuciones de práctica por alumno")
+    parser.add_argument("--activities", type=int, default=5, help="tareas y evaluaciones del curso")
+    parser.add_argument("--think", type=float, default=0.0, help="pausa máxima entre acciones de un alumno (s)")
+    parser.add_argument("--repeat-ratio", type=float, default=0.2, help="fracción de envíos con la plantilla sin cambios")
+    parser.add_argument("--executor", choices=("simulado", "lambda-local"), default="simulado")
+    parser.add_argument("--executor-latency", type=float, default=0.3, help="latencia media del ejecutor simulado (s)")
+    parser.add_argument("--lambda-concurrency", type=int, default=4, help="instancias de la Lambda local")
+    parser.add_argument("--cold-start", type=float, default=0.0, help="arranque en frío de la Lambda local (s)")
+    parser.add_argument("--db-latency", type=float, default=0.002, help="latencia simulada por consulta (s)")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", help="guardar el resultado en este archivo")
+    parser.add_argument("--baseline", help="resultado anterior (--json) con el que comparar")
+    parser.add_argument("--max-regression", type=float, default=0.2, help="empeoramiento tolerado de p95/p99 (fracción)")
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    with tempfile.TemporaryDirectory(prefix="edurun_benchmark_") as work_dir:
+        _configure_environment(work_dir)
+        report = asyncio.run(run_benchmark(args))
+
+    print_report(report)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare_with_baseline(report, json.load(f), args.max_regression)
+        if regressions:
+            print("\nRegresiones respecto del baseline:")
+            for regression in regressions:
+                print(f"  - {regression}")
+            return 1
+        print("\nSin regresiones respecto del baseline")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
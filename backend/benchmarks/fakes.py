@@ -0,0 +1,206 @@
+"""
+Reemplazos en memoria de Supabase (Postgres) y del ejecutor para el
+benchmark (ver deadline_burst.py).
+
+FakeDatabase responde las consultas de las rutas medidas a partir de las
+mismas constantes SQL que usan los módulos de functions/, así una
+consulta nueva o cambiada en esas rutas falla con un error claro en vez
+de medirse mal. Cada consulta puede esperar una latencia simulada.
+"""
+import asyncio
+import itertools
+import random
+from typing import Any, Dict, List, Optional, Tuple
+
+from functions.ejecutores import Executor
+from functions.result_cache import run_cached, result_key
+from functions.test_suites import get_suite, precheck_code
+
+
+class FakeDatabase:
+    def __init__(self, latency: float = 0.0):
+        from functions import entregas_pendientes, evaluaciones, lti, tareas
+
+        self.latency = latency
+        self.queries = 0
+        self._ids = itertools.count(1)
+        self.plataformas: Dict[str, int] = {}
+        self.cursos: Dict[str, int] = {}
+        self.usuarios: Dict[str, int] = {}
+        self.inscripciones: Dict[Tuple[int, int], int] = {}
+        self.tareas: Dict[int, Dict[str, Any]] = {}
+        self.evaluaciones: Dict[int, Dict[str, Any]] = {}
+        self.entregas: Dict[Tuple[int, int], Dict[str, Any]] = {}
+        self.contenidos: Dict[str, Tuple[str, bytes]] = {}
+
+        self._handlers = {
+            lti.REGISTER_LAUNCH: self._register_launch,
+            lti.USER_BY_LMS_ID: lambda id_lms: self._identity(self.usuarios, id_lms),
+            lti.COURSE_BY_LMS_ID: lambda id_lms: self._identity(self.cursos, id_lms),
+            tareas.TAREAS_BY_COURSE: lambda *args: self._listing(self.tareas, *args),
+            evaluaciones.EVALUACIONES_BY_COURSE: lambda *args: self._listing(self.evaluaciones, *args),
+            tareas.TAREA_TEST_BY_ID: lambda id: self._test(self.tareas, id),
+            evaluaciones.EVALUACION_TEST_BY_ID: lambda id: self._test(self.evaluaciones, id),
+            entregas_pendientes.UPSERT_ENTREGA_BY_ID: self._upsert_entrega,
+        }
+
+    def install(self):
+        """
+        Reemplaza fetch/fetchrow/executemany y el pool en los módulos que
+        los importaron.
+        """
+        import functions.db
+        from functions import contenido, estado_alumno, evaluaciones, exportacion, lti, tareas
+
+        async def noop():
+            return None
+
+        functions.db.start_db_pool = noop
+        functions.db.close_db_pool = noop
+        for module in (functions.db, contenido, estado_alumno, evaluaciones, exportacion, lti, tareas):
+            for name in ("fetch", "fetchrow", "executemany"):
+                if hasattr(module, name):
+                    setattr(module, name, getattr(self, name))
+
+    async def _run(self, query: str, args: tuple):
+        handler = self._handlers.get(query)
+        if handler is None:
+            raise RuntimeError(f"Consulta sin reemplazo en FakeDatabase: {query.strip()[:80]}")
+        self.queries += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return handler(*args)
+
+    async def fetch(self, query: str, *args) -> List[Dict[str, Any]]:
+        return await self._run(query, args)
+
+    async def fetchrow(self, query: str, *args) -> Optional[Dict[str, Any]]:
+        return await self._run(query, args)
+
+    async def executemany(self, query: str, args: List[tuple]):
+        for row_args in args:
+            await self._run(query, row_args)
+
+    # Datos iniciales
+
+    def add_activity(self, kind: str, course_id_lms: str, titulo: str, test: str) -> int:
+        course_id = self._get_or_create(self.cursos, course_id_lms)
+        activity_id = next(self._ids)
+        table = self.tareas if kind == "tarea" else self.evaluaciones
+        table[activity_id] = {"id": activity_id, "id_curso": course_id, "titulo": titulo, "test": test, "fecha_limite": None}
+        return activity_id
+
+    # Consultas
+
+    def _get_or_create(self, table: Dict, key) -> int:
+        if key not in table:
+            table[key] = next(self._ids)
+        return table[key]
+
+    def _register_launch(self, guid, nombre, version, family_code, curso_nombre, etiqueta, id_curso_lms, id_lms, usuario_nombre):
+        registered = {}
+        for name, table, key in (
+            ("plataforma", self.plataformas, guid),
+            ("curso", self.cursos, id_curso_lms),
+            ("usuario", self.usuarios, id_lms),
+        ):
+            registered[name] = key not in table
+            self._get_or_create(table, key)
+        enrollment = (self.usuarios[id_lms], self.cursos[id_curso_lms])
+        registered["inscripcion"] = enrollment not in self.inscripciones
+        self._get_or_create(self.inscripciones, enrollment)
+        return {
+            "id_plataforma": self.plataformas[guid], "plataforma_registrada": registered["plataforma"],
+            "id_curso": self.cursos[id_curso_lms], "curso_registrado": registered["curso"],
+            "id_usuario": self.usuarios[id_lms], "usuario_registrado": registered["usuario"],
+            "inscripcion_registrada": registered["inscripcion"],
+        }
+
+    @staticmethod
+    def _identity(table: Dict[str, int], id_lms: str):
+        return {"id": table[id_lms]} if id_lms in table else None
+
+    @staticmethod
+    def _listing(table: Dict[int, Dict[str, Any]], course_id: int, after: int, limit: Optional[int]):
+        rows = [
+            {key: row[key] for key in ("id", "titulo", "fecha_limite")}
+            for row_id, row in sorted(table.items())
+            if row["id_curso"] == course_id and row_id > after
+        ]
+        return rows[:limit] if limit else rows
+
+    @staticmethod
+    def _test(table: Dict[int, Dict[str, Any]], activity_id: int):
+        row = table.get(activity_id)
+        return {"test": row["test"]} if row else None
+
+    def _upsert_entrega(self, id_evaluacion, id_alumno, nota, codigo_hash, detalles_hash, hashes, compresiones, datos):
+        for content_hash, compresion, data in zip(hashes, compresiones, datos):
+            self.contenidos.setdefault(content_hash, (compresion, data))
+        self.entregas[(id_alumno, id_evaluacion)] = {
+            "nota": nota,
+            "codigo_hash": codigo_hash,
+            "detalles_hash": detalles_hash,
+        }
+
+
+class SimulatedExecutor(Executor):
+    """
+    Ejecutor que no ejecuta código: lee el test (con su cache), hace el
+    chequeo previo y usa el cache de resultados como los ejecutores
+    reales, y espera una latencia aleatoria alrededor de `latency`
+    segundos en lugar de correr pytest. Aprueba todo código que contenga
+    la cadena "correcto".
+    """
+    name = "simulado"
+
+    def __init__(self, latency: float = 0.5, jitter: float = 0.3):
+        self.latency = latency
+        self.jitter = jitter
+
+    async def _sleep(self):
+        await asyncio.sleep(max(0.0, random.gauss(self.latency, self.latency * self.jitter)))
+
+    async def _run_test(self, code: str, data: Optional[Dict[str, Any]], tipo: str):
+        if not data or not data.get("test"):
+            return {"stdout": "", "stderr": "No se encontró el test", "return_code": 1}
+        prechecked = precheck_code(code, get_suite(data["test"], data["hash"]))
+        if prechecked:
+            return prechecked
+
+        async def run():
+            await self._sleep()
+            score = 100 if "correcto" in code else 50
+            return {
+                "stdout": f"\nPuntaje obtenido: {score}%",
+                "stderr": "",
+                "return_code": 0,
+                "resultado": {"score": score, "tipo": tipo},
+            }
+
+        return await run_cached(result_key(tipo, self.name, code, data["hash"]), run)
+
+    async def run_code(self, code, use_cache=False):
+        await self._sleep()
+        return {"stdout": "", "stderr": "", "return_code": 0}
+
+    async def stream_code(self, code):
+        await self._sleep()
+        yield {"evento": "fin", "return_code": 0, "timeout": False, "truncado": False}
+
+    async def run_tarea_test(self, code, tarea_id, fail_fast=False):
+        from functions.tareas import get_tarea_test
+        return await self._run_test(code, await get_tarea_test(tarea_id), "test")
+
+    async def run_evaluacion_test(self, code, evaluacion_id, fail_fast=False):
+        from functions.evaluaciones import get_evaluacion_test
+        return await self._run_test(code, await get_evaluacion_test(evaluacion_id), "test")
+
+    async def evaluate_activity(self, code, evaluacion_id):
+        from functions.evaluaciones import get_evaluacion_test
+        result = await self._run_test(code, await get_evaluacion_test(evaluacion_id), "evaluacion")
+        return {**result, "score": (result.get("resultado") or {}).get("score", 0)}
+
+    async def evaluate_batch(self, items, test):
+        await self._sleep()
+        return [{"id": item["id"], "score": 100, "stdout": "", "stderr": "", "return_code": 0} for item in items]
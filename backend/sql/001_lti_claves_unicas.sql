@@ -0,0 +1,9 @@
+-- Claves únicas que usa el registro de lanzamientos LTI (functions/lti.py)
+-- para insertar-o-leer plataforma, curso, usuario e inscripción en una
+-- sola consulta. Si ya existen duplicados hay que unificarlos antes de
+-- aplicar este script.
+
+CREATE UNIQUE INDEX IF NOT EXISTS plataforma_guid_key ON plataforma (guid);
+CREATE UNIQUE INDEX IF NOT EXISTS usuario_id_lms_key ON usuario (id_lms);
+CREATE UNIQUE INDEX IF NOT EXISTS curso_id_curso_lms_key ON curso (id_curso_lms);
+CREATE UNIQUE INDEX IF NOT EXISTS curso_usuario_usuario_curso_key ON curso_usuario (id_usuario, id_curso);
@@ -0,0 +1,7 @@
+-- Una sola entrega por alumno y evaluación: create_or_update_entrega_evaluacion
+-- (functions/evaluaciones.py) la crea o reemplaza con un upsert sobre esta
+-- clave. Si ya existen entregas duplicadas hay que conservar una por par
+-- antes de aplicar este script.
+
+CREATE UNIQUE INDEX IF NOT EXISTS entrega_evaluacion_alumno_evaluacion_key
+    ON entrega_evaluacion (id_alumno, id_evaluacion);
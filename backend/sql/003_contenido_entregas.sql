@@ -0,0 +1,15 @@
+-- Código y detalles de las entregas comprimidos y deduplicados por hash
+-- (functions/contenido.py). Cada entrega apunta a su contenido con
+-- codigo_hash y detalles_hash; las entregas anteriores a este script
+-- conservan codigo y detalles en sus columnas originales y se siguen
+-- leyendo desde ahí.
+
+CREATE TABLE IF NOT EXISTS contenido (
+    hash text PRIMARY KEY,
+    compresion text NOT NULL,
+    datos bytea NOT NULL
+);
+
+ALTER TABLE entrega_evaluacion
+    ADD COLUMN IF NOT EXISTS codigo_hash text,
+    ADD COLUMN IF NOT EXISTS detalles_hash text;
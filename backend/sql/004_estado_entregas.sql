@@ -0,0 +1,36 @@
+-- Resumen por alumno de sus entregas (solo la nota), usado por
+-- get_estado_alumno (functions/estado_alumno.py). Un trigger lo mantiene
+-- al día con cada alta, cambio o baja en entrega_evaluacion, así que
+-- refleja tanto create_or_update_entrega_evaluacion como la recalificación.
+
+CREATE TABLE IF NOT EXISTS estado_entrega (
+    id_alumno bigint NOT NULL,
+    id_evaluacion bigint NOT NULL,
+    nota integer,
+    PRIMARY KEY (id_alumno, id_evaluacion)
+);
+
+CREATE OR REPLACE FUNCTION actualizar_estado_entrega() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        DELETE FROM estado_entrega
+        WHERE id_alumno = OLD.id_alumno AND id_evaluacion = OLD.id_evaluacion;
+        RETURN OLD;
+    END IF;
+    INSERT INTO estado_entrega (id_alumno, id_evaluacion, nota)
+    VALUES (NEW.id_alumno, NEW.id_evaluacion, NEW.nota)
+    ON CONFLICT (id_alumno, id_evaluacion) DO UPDATE
+    SET nota = EXCLUDED.nota;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS entrega_evaluacion_estado ON entrega_evaluacion;
+CREATE TRIGGER entrega_evaluacion_estado
+    AFTER INSERT OR UPDATE OF nota OR DELETE ON entrega_evaluacion
+    FOR EACH ROW EXECUTE FUNCTION actualizar_estado_entrega();
+
+-- Entregas existentes
+INSERT INTO estado_entrega (id_alumno, id_evaluacion, nota)
+SELECT id_alumno, id_evaluacion, nota FROM entrega_evaluacion
+ON CONFLICT (id_alumno, id_evaluacion) DO NOTHING;
@@ -12,6 +12,55 @@ export async function runCode(code: string): Promise<Response> {
     return res
 }
 
+export interface RunStreamEvent {
+    evento: 'stdout' | 'stderr' | 'truncado' | 'fin' | 'error'
+    datos?: string
+    limite?: number
+    return_code?: number
+    timeout?: boolean
+    truncado?: boolean
+    error?: string
+}
+
+// Ejecuta el código recibiendo la salida por Server-Sent Events a medida que se produce
+export async function runCodeStream(code: string, onEvent: (event: RunStreamEvent) => void): Promise<void> {
+    const body = new FormData()
+    body.append('code', code)
+
+    const res = await fetch(`${configs.apiBaseUrl}/api/run-code/stream/`, {
+        method: 'POST',
+        body: body,
+    })
+    if (!res.ok || !res.body) {
+        throw new Error(`Error en la respuesta de /run-code/stream/: ${res.statusText}`)
+    }
+
+    const reader = res.body.pipeThrough(new TextDecoderStream()).getReader()
+    let buffer = ''
+    while (true) {
+        const { value, done } = await reader.read()
+        if (done) break
+        buffer += value
+
+        let end = buffer.indexOf('\n\n')
+        while (end !== -1) {
+            const message = buffer.slice(0, end)
+            buffer = buffer.slice(end + 2)
+            end = buffer.indexOf('\n\n')
+
+            let evento = ''
+            let data = ''
+            for (const line of message.split('\n')) {
+                if (line.startsWith('event: ')) evento = line.slice(7)
+                else if (line.startsWith('data: ')) data += line.slice(6)
+            }
+            if (evento && data) {
+                onEvent({ ...JSON.parse(data), evento } as RunStreamEvent)
+            }
+        }
+    }
+}
+
 export async function sendCode(code: string, evaluacionId: number): Promise<Response> {
     const data = new FormData()
     data.append('code', code)